@@ -0,0 +1,172 @@
+import os
+import posixpath
+import queue
+import threading
+import zipfile
+
+from django.core.files.storage import default_storage
+
+from filebrowser_safe import settings as fb_settings
+from filebrowser_safe.functions import convert_filename, get_file_type, is_excluded
+from filebrowser_safe.storage import FileSystemStorageMixin
+
+# File types whose content is already compressed, stored as is.
+STORED_FILE_TYPES = ("Image", "Video", "Audio")
+STORED_EXTENSIONS = (".zip", ".gz", ".bz2", ".xz", ".7z", ".rar", ".pdf")
+# Number of chunks read ahead of the archive on remote storages.
+READ_AHEAD_CHUNKS = 8
+
+
+class _StreamBuffer:
+    """
+    Unseekable file-like object collecting what a ZipFile writes to it.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.offset = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.offset
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _walk(name, arcname):
+    """
+    Yields the storage and archive names, size and modified time of each
+    file of the folder ``name``, skipping hidden and excluded files.
+    """
+    for filename, is_dir, size, modified in sorted(default_storage.scandir(name)):
+        if filename.startswith(".") or is_excluded(filename):
+            continue
+        path = posixpath.join(name, filename)
+        member = posixpath.join(arcname, filename)
+        if is_dir:
+            yield from _walk(path, member)
+        else:
+            yield path, member, size, modified
+
+
+def _read_chunks(name):
+    with default_storage.open(name) as f:
+        yield from f.chunks()
+
+
+def _read_ahead(name):
+    """
+    Reads ``name`` on another thread, so that the next chunks are being
+    fetched from the remote storage while the current one is sent.
+    """
+    chunks = queue.Queue(maxsize=READ_AHEAD_CHUNKS)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def reader():
+        try:
+            for chunk in _read_chunks(name):
+                if not put(chunk):
+                    return
+        except Exception as e:
+            put(e)
+        else:
+            put(None)
+
+    thread = threading.Thread(target=reader, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = chunks.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # Stops the reader if the download is interrupted.
+        stop.set()
+
+
+def _compress_type(filename):
+    extension = os.path.splitext(filename)[1].lower()
+    if get_file_type(filename) in STORED_FILE_TYPES or extension in STORED_EXTENSIONS:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def zip_stream(name):
+    """
+    Yields the chunks of a zip archive of the folder ``name``, reading each
+    file chunk by chunk from the storage, without a temporary file.
+    """
+    read = _read_chunks
+    if not isinstance(default_storage, FileSystemStorageMixin):
+        read = _read_ahead
+    arcname = posixpath.basename(name.rstrip("/"))
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, mode="w") as archive:
+        for path, member, size, modified in _walk(name, arcname):
+            # Zip files can't hold earlier dates.
+            date_time = max(modified.timetuple()[:6], (1980, 1, 1, 0, 0, 0))
+            info = zipfile.ZipInfo(member, date_time)
+            info.compress_type = _compress_type(member)
+            info.file_size = size
+            with archive.open(info, mode="w") as entry:
+                for chunk in read(path):
+                    entry.write(chunk)
+                    data = buffer.pop()
+                    if data:
+                        yield data
+    yield buffer.pop()
+
+
+def is_zip_upload(filename):
+    """
+    Returns whether an uploaded file is a zip archive to extract.
+    """
+    return fb_settings.EXTRACT_ZIP_UPLOADS and filename.lower().endswith(".zip")
+
+
+def zip_members(archive):
+    """
+    Returns the members of ``archive`` which may be extracted, mapped by
+    their converted names relative to the upload folder, and the names of
+    the members rejected for their path, extension or size.
+    """
+    members = {}
+    rejected = []
+    for info in archive.infolist():
+        if info.filename.endswith("/"):
+            continue
+        name = posixpath.normpath(info.filename.replace("\\", "/"))
+        parts = name.split("/")
+        if (
+            name.startswith("/")
+            or any(part in ("", "..") or part.startswith(".") for part in parts)
+            or "__MACOSX" in parts
+            or get_file_type(name) in ("", "Folder")
+            or info.file_size > fb_settings.MAX_UPLOAD_SIZE
+        ):
+            rejected.append(info.filename)
+            continue
+        members["/".join(convert_filename(part) for part in parts)] = info
+    return members, rejected
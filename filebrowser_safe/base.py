@@ -3,13 +3,18 @@ import mimetypes
 import os
 import time
 import warnings
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
 from django.core.files.storage import default_storage
 from django.db.models.fields.files import FieldFile
+from django.urls import reverse
 from django.utils.encoding import smart_str
 from django.utils.functional import cached_property
 
+from filebrowser_safe import settings as fb_settings
 from filebrowser_safe.functions import get_directory, get_file_type, path_strip
+from filebrowser_safe.storage import setup_default_storage
 
 
 class FileObjectAPI:
@@ -51,7 +56,7 @@ class FileObjectAPI:
     @cached_property
     def date(self):
         if self.exists:
-            return time.mktime(default_storage.get_modified_time(self.path).timetuple())
+            return to_timestamp(default_storage.get_modified_time(self.path))
         return None
 
     @property
@@ -64,8 +69,33 @@ class FileObjectAPI:
     def exists(self):
         return default_storage.exists(self.name)
 
+    def set_metadata(self, entry):
+        """
+        Fills the storage metadata from a ``scandir`` entry, or from None for
+        a missing file, sparing the storage calls otherwise needed.
+        """
+        if entry is None:
+            values = (False, False, None, None)
+        else:
+            filename, is_dir, size, modified_time = entry
+            if modified_time is not None:
+                modified_time = to_timestamp(modified_time)
+            values = (True, is_dir, size, modified_time)
+        self.__dict__.update(zip(("exists", "is_folder", "filesize", "date"), values))
+
     # PATH/URL ATTRIBUTES
 
+    @property
+    def serve_url(self):
+        """
+        URL of the file through FileBrowser's serve view, carrying its
+        modified time when already known so that it may be cached for long.
+        """
+        url = reverse("fb_serve", kwargs={"path": self.name})
+        if self.__dict__.get("date") is not None:
+            url += "?v=%d" % self.date
+        return url
+
     @property
     def path_relative_directory(self):
         """path relative to the path returned by get_directory()"""
@@ -83,6 +113,7 @@ class FileObjectAPI:
 
     @cached_property
     def is_folder(self):
+        setup_default_storage()
         return default_storage.isdir(self.path)
 
     @property
@@ -99,6 +130,47 @@ class FileObjectAPI:
         return False
 
 
+def to_timestamp(modified_time):
+    """
+    Converts a storage's modified time to the timestamp used as ``date``.
+    """
+    return time.mktime(modified_time.timetuple())
+
+
+def prefetch_metadata(fileobjects):
+    """
+    Resolves ``exists``, ``is_folder``, ``filesize`` and ``date`` for many
+    file objects at once, listing each directory involved a single time
+    rather than making several storage calls per file object.
+
+    Directories are listed concurrently. Storages without ``scandir`` fall
+    back to resolving each file object concurrently.
+    """
+    setup_default_storage()
+    by_head = defaultdict(list)
+    for fileobject in fileobjects:
+        by_head[fileobject.head].append(fileobject)
+    if not by_head:
+        return
+
+    def scan(head):
+        try:
+            return {entry[0]: entry for entry in default_storage.scandir(head)}
+        except FileNotFoundError:
+            return {}
+
+    def resolve(fileobject):
+        return fileobject.is_folder, fileobject.filesize, fileobject.date
+
+    with ThreadPoolExecutor(max_workers=fb_settings.STORAGE_WORKERS) as pool:
+        if not hasattr(default_storage, "scandir"):
+            list(pool.map(resolve, fileobjects))
+            return
+        for head, listing in zip(by_head, pool.map(scan, by_head)):
+            for fileobject in by_head[head]:
+                fileobject.set_metadata(listing.get(fileobject.filename))
+
+
 class FileObject(FileObjectAPI):
     """
     The FileObject represents a file (or directory) on the server.
@@ -122,9 +194,74 @@ class FileObject(FileObjectAPI):
 
     @property
     def url(self):
+        if fb_settings.SERVE_MEDIA:
+            return self.serve_url
         return default_storage.url(self.name)
 
 
+class FileEntry:
+    """
+    A compact stand-in for a ``FileObject`` built from a ``scandir`` entry,
+    used for folder listings. It has no ``__dict__``, makes no storage calls,
+    and only works out the mimetype and the parts of its name when asked.
+    """
+
+    __slots__ = ("path", "filename", "filetype", "is_folder", "filesize", "date")
+
+    exists = True
+
+    def __init__(self, path, entry):
+        filename, is_dir, size, modified_time = entry
+        self.path = path
+        self.filename = filename
+        self.filetype = "Folder" if is_dir else get_file_type(filename)
+        self.is_folder = is_dir
+        self.filesize = size
+        self.date = None if modified_time is None else to_timestamp(modified_time)
+
+    @property
+    def name(self):
+        return self.path
+
+    @property
+    def head(self):
+        return os.path.dirname(self.path)
+
+    @property
+    def filename_lower(self):
+        return self.filename.lower()
+
+    @property
+    def filename_root(self):
+        return os.path.splitext(self.filename)[0]
+
+    @property
+    def extension(self):
+        return os.path.splitext(self.filename)[1]
+
+    @property
+    def mimetype(self):
+        return mimetypes.guess_type(self.filename)
+
+    @property
+    def serve_url(self):
+        url = reverse("fb_serve", kwargs={"path": self.name})
+        if self.date is not None:
+            url += "?v=%d" % self.date
+        return url
+
+    # The rest only rely on the attributes above.
+    __str__ = FileObjectAPI.__str__
+    __repr__ = FileObjectAPI.__repr__
+    __len__ = FileObjectAPI.__len__
+    datetime = FileObjectAPI.datetime
+    path_relative_directory = FileObjectAPI.path_relative_directory
+    directory = FileObjectAPI.directory
+    folder = FileObjectAPI.folder
+    is_empty = FileObjectAPI.is_empty
+    url = FileObject.url
+
+
 class FieldFileObject(FieldFile, FileObjectAPI):
     """
     Returned when a FileBrowseField is accessed on a model instance.
@@ -138,6 +275,13 @@ class FieldFileObject(FieldFile, FileObjectAPI):
         FieldFile.__init__(self, instance, field, path)
         FileObjectAPI.__init__(self, path or "")
 
+    @property
+    def url(self):
+        if fb_settings.SERVE_MEDIA:
+            self._require_file()
+            return self.serve_url
+        return super().url
+
     def delete(self, **kwargs):
         if self.is_folder:
             default_storage.rmtree(self.name)
@@ -0,0 +1,301 @@
+import hashlib
+import posixpath
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.core.cache import caches
+from django.core.files.storage import default_storage
+from django.utils.functional import LazyObject, empty
+
+from filebrowser_safe import settings as fb_settings
+from filebrowser_safe.functions import get_site_partition
+from filebrowser_safe.storage import setup_default_storage
+
+# Read-only storage methods whose results are remembered for the request.
+MEMOIZED_METHODS = (
+    "exists",
+    "isdir",
+    "isfile",
+    "size",
+    "get_modified_time",
+    "listdir",
+    "scandir",
+)
+# Storage methods changing the storage, which discard remembered results.
+WRITE_METHODS = (
+    "save",
+    "overwrite",
+    "delete",
+    "move",
+    "copy",
+    "link",
+    "makedirs",
+    "rmtree",
+)
+
+_local = threading.local()
+
+
+def _memoized(storage, name):
+    def method(*args, **kwargs):
+        # Look the method up on each call so that later patching of the
+        # storage class (e.g. instrumentation) is still honoured.
+        return getattr(type(storage), name)(storage, *args, **kwargs)
+
+    def wrapper(*args, **kwargs):
+        memo = getattr(_local, "memo", None)
+        if memo is None:
+            return method(*args, **kwargs)
+        key = (name, args, tuple(sorted(kwargs.items())))
+        try:
+            result = memo[key]
+        except KeyError:
+            result = memo[key] = method(*args, **kwargs)
+        except TypeError:
+            # Unhashable arguments, don't remember anything.
+            return method(*args, **kwargs)
+        # Callers are free to modify the lists they're given.
+        if name == "listdir":
+            return list(result[0]), list(result[1])
+        if name == "scandir":
+            return list(result)
+        return result
+
+    return wrapper
+
+
+def _invalidating(storage, name):
+    def wrapper(*args, **kwargs):
+        # Nothing is remembered during the write, since it may check the
+        # storage again after changing it, e.g. save() when a name is taken.
+        memo = getattr(_local, "memo", None)
+        _local.memo = None
+        try:
+            return getattr(type(storage), name)(storage, *args, **kwargs)
+        finally:
+            _local.memo = memo
+            invalidate_storage_memo()
+
+    return wrapper
+
+
+def memoize_storage(storage):
+    """
+    Installs the request memo on the given storage instance.
+    Safe to call repeatedly.
+    """
+    if isinstance(storage, LazyObject):
+        if storage._wrapped is empty:
+            storage._setup()
+        storage = storage._wrapped
+    if getattr(storage, "fb_memoized", False):
+        return
+    setup_default_storage()
+    # The wrappers look methods up on each call, so that later patching of
+    # the storage class is honoured.
+    for name in MEMOIZED_METHODS:
+        setattr(storage, name, _memoized(storage, name))
+    for name in WRITE_METHODS:
+        # Methods only some storages have, e.g. link(), are left missing.
+        if hasattr(type(storage), name):
+            setattr(storage, name, _invalidating(storage, name))
+    storage.fb_memoized = True
+
+
+def invalidate_storage_memo():
+    """
+    Forgets all storage results remembered for the current request.
+    """
+    memo = getattr(_local, "memo", None)
+    if memo is not None:
+        memo.clear()
+
+
+@contextmanager
+def storage_memo():
+    """
+    Remembers the results of read-only calls on ``default_storage`` for the
+    duration of the block. Writes made through the storage within the block
+    discard everything remembered so far.
+    """
+    memoize_storage(default_storage)
+    previous = getattr(_local, "memo", None)
+    if previous is None:
+        _local.memo = {}
+    try:
+        yield
+    finally:
+        _local.memo = previous
+
+
+def _digest(*parts):
+    return hashlib.md5(repr(parts).encode("utf-8")).hexdigest()
+
+
+def _normalize_directory(directory):
+    directory = posixpath.normpath(directory.replace("\\", "/")).strip("/")
+    return "" if directory == "." else directory
+
+
+def _generation_key(directory):
+    return "filebrowser:generation:%s" % _digest(_normalize_directory(directory))
+
+
+def _new_generation():
+    # Generations (re)start from the current time in microseconds, so a
+    # counter lost to eviction doesn't go back to a value already used.
+    return int(time.time() * 1000000)
+
+
+def _directory_generations(directory):
+    """
+    Returns the generations of the directory and of each of its parents,
+    which are part of its listing keys. Changing a folder bumps its
+    generation, so the listings of the folder and everything within it are
+    no longer found, by any process sharing the generation cache.
+    """
+    cache = caches[fb_settings.GENERATION_CACHE]
+    directory = _normalize_directory(directory)
+    keys = [_generation_key(directory)]
+    while directory:
+        directory = _normalize_directory(posixpath.dirname(directory))
+        keys.append(_generation_key(directory))
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            cache.add(key, _new_generation(), None)
+            generations[key] = cache.get(key)
+    return [generations[key] for key in keys]
+
+
+class SiteListingCache:
+    """
+    In-process listing cache with a least recently used partition per site,
+    so that filling the partition of one site only evicts its own listings.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.partitions = {}
+
+    def get(self, site_id, key):
+        with self.lock:
+            partition = self.partitions.get(site_id)
+            if partition is None or key not in partition:
+                return None
+            expires, listing = partition[key]
+            if expires < time.monotonic():
+                del partition[key]
+                return None
+            partition.move_to_end(key)
+            return listing
+
+    def set(self, site_id, key, listing, timeout, max_entries):
+        """
+        Stores ``listing`` and returns the number of listings of the site
+        evicted to keep it within ``max_entries``.
+        """
+        with self.lock:
+            partition = self.partitions.setdefault(site_id, OrderedDict())
+            partition[key] = (time.monotonic() + timeout, listing)
+            partition.move_to_end(key)
+            evicted = 0
+            while len(partition) > max_entries:
+                partition.popitem(last=False)
+                evicted += 1
+            return evicted
+
+    def entries(self):
+        with self.lock:
+            return {site_id: len(p) for site_id, p in self.partitions.items()}
+
+    def clear(self):
+        with self.lock:
+            self.partitions.clear()
+
+
+site_listings = SiteListingCache()
+
+# Counted for each site by cached_listing().
+LISTING_STATS = ("hits", "misses", "evictions")
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _count(site_id, name, value=1):
+    with _stats_lock:
+        stats = _stats.setdefault(site_id, dict.fromkeys(LISTING_STATS, 0))
+        stats[name] += value
+
+
+def listing_cache_stats():
+    """
+    Returns the listing cache hits, misses and evictions counted for each
+    site since the process started, along with the number of listings each
+    site has in the in-process cache. Evictions are only known for the
+    in-process cache (``LISTING_CACHE_SITE_ENTRIES``).
+    """
+    with _stats_lock:
+        stats = {site_id: dict(counts) for site_id, counts in _stats.items()}
+    for site_id, entries in site_listings.entries().items():
+        stats.setdefault(site_id, dict.fromkeys(LISTING_STATS, 0))["entries"] = entries
+    return stats
+
+
+def cached_listing(directory, variant, build):
+    """
+    Returns the listing of ``directory`` for ``variant`` (the filters and
+    sorting applied to it) from the cache, calling ``build`` to produce and
+    cache it if missing.
+
+    The listing cache may be local to each server, as long as the generation
+    cache is shared: its generations are checked on every call, in a single
+    round trip, before a cached listing is trusted.
+    """
+    timeout = fb_settings.LISTING_CACHE_TIMEOUT
+    if not timeout:
+        return build()
+    generations = _directory_generations(directory)
+    if None in generations:
+        # The cache doesn't keep anything (e.g. DummyCache)
+        return build()
+    site_id = get_site_partition()
+    max_entries = fb_settings.LISTING_CACHE_SITE_ENTRIES
+    cache = caches[fb_settings.CACHE]
+    key = "filebrowser:listing:%s" % _digest(
+        site_id, _normalize_directory(directory), generations, variant
+    )
+    if max_entries:
+        listing = site_listings.get(site_id, key)
+    else:
+        listing = cache.get(key)
+    if listing is not None:
+        _count(site_id, "hits")
+        return listing
+    _count(site_id, "misses")
+    listing = build()
+    if max_entries:
+        evicted = site_listings.set(site_id, key, listing, timeout, max_entries)
+        _count(site_id, "evictions", evicted)
+    else:
+        cache.set(key, listing, timeout)
+    return listing
+
+
+def invalidate_listing(directory):
+    """
+    Discards the cached listings of ``directory`` and of every folder in it,
+    by atomically bumping the directory's generation.
+    """
+    if not fb_settings.LISTING_CACHE_TIMEOUT:
+        return
+    cache = caches[fb_settings.GENERATION_CACHE]
+    key = _generation_key(directory)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Not set yet, or evicted.
+        if not cache.add(key, _new_generation(), None):
+            cache.incr(key)
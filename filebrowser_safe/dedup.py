@@ -0,0 +1,108 @@
+import hashlib
+import logging
+
+from django.core.files.base import File
+from django.core.files.storage import default_storage
+from django.db.models import Q
+
+from filebrowser_safe import settings as fb_settings
+from filebrowser_safe.functions import get_directory
+from filebrowser_safe.models import ContentHash
+
+logger = logging.getLogger("filebrowser_safe")
+
+MAX_PATH_LENGTH = ContentHash._meta.get_field("path").max_length
+
+
+class HashingFile(File):
+    """
+    Wraps an uploaded file, computing the digest of its content as the
+    storage reads it while saving.
+    """
+
+    def __init__(self, file):
+        super().__init__(file, name=file.name)
+        self.hash = hashlib.sha256()
+        self.hashed = 0
+
+    def read(self, *args, **kwargs):
+        start = self.file.tell()
+        data = self.file.read(*args, **kwargs)
+        # Only sequential reads of the whole content make a valid digest.
+        if start == 0 and self.hashed:
+            self.hash = hashlib.sha256()
+            self.hashed = 0
+        if start == self.hashed:
+            self.hash.update(data if isinstance(data, bytes) else data.encode())
+            self.hashed += len(data)
+        return data
+
+    @property
+    def digest(self):
+        if self.hashed != self.size:
+            return None
+        return self.hash.hexdigest()
+
+
+def deduplicate_enabled():
+    return fb_settings.DEDUPLICATE_UPLOADS and hasattr(default_storage, "link")
+
+
+def deduplicate(name, file):
+    """
+    Indexes the digest of the ``HashingFile`` just saved as ``name``, and
+    replaces it with a link to a stored file having the same content, if any.
+    """
+    digest = file.digest
+    if digest is None or len(name) > MAX_PATH_LENGTH:
+        return
+    # Only files of the same site's media library are linked together.
+    candidates = ContentHash.objects.filter(
+        _under(get_directory()), digest=digest, size=file.size
+    )
+    for candidate in candidates.exclude(path=name):
+        try:
+            modified = default_storage.get_modified_time(candidate.path)
+        except OSError:
+            modified = None
+        if modified != candidate.modified:
+            # Deleted or changed outside of FileBrowser
+            candidate.delete()
+            continue
+        try:
+            default_storage.link(candidate.path, name)
+        except OSError as e:
+            logger.warning("Couldn't link %s to %s: %s", name, candidate.path, e)
+        break
+    ContentHash.objects.update_or_create(
+        path=name,
+        defaults={
+            "digest": digest,
+            "size": file.size,
+            "modified": default_storage.get_modified_time(name),
+        },
+    )
+
+
+def _under(name):
+    return Q(path=name) | Q(path__startswith=name.rstrip("/") + "/")
+
+
+def forget(name):
+    """
+    Drops the digests of the file or folder ``name``. Linked content is
+    reference counted by the filesystem, and only freed with its last link.
+    """
+    ContentHash.objects.filter(_under(name)).delete()
+
+
+def rename(old_name, new_name):
+    """
+    Moves the digests of the file or folder ``old_name`` to ``new_name``.
+    """
+    for content_hash in ContentHash.objects.filter(_under(old_name)):
+        content_hash.path = new_name + content_hash.path[len(old_name) :]
+        if len(content_hash.path) > MAX_PATH_LENGTH:
+            content_hash.delete()
+        else:
+            content_hash.save(update_fields=["path"])
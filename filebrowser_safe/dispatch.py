@@ -0,0 +1,314 @@
+import json
+import logging
+import queue
+import threading
+import types
+import weakref
+from datetime import timedelta
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import close_old_connections, transaction
+from django.dispatch.dispatcher import _make_id
+from django.utils import timezone
+
+from filebrowser_safe import settings as fb_settings
+from filebrowser_safe.base import FileObject
+from filebrowser_safe.functions import get_site_partition, override_current_site_id
+from filebrowser_safe.models import SignalEvent
+
+logger = logging.getLogger("filebrowser_safe")
+
+# Seconds an event claimed from the database queue is hidden from other
+# dispatchers for. It's sent again afterwards if still queued.
+LEASE = 300
+# Storage metadata of a FileObject sent along with its path, when known.
+FILEOBJECT_DATA = ("exists", "is_folder", "filesize", "date")
+# The signals of filebrowser_safe.views sent through ``send``.
+SIGNALS = (
+    "filebrowser_post_createdir",
+    "filebrowser_post_upload",
+    "filebrowser_post_delete",
+    "filebrowser_post_rename",
+    "filebrowser_post_move",
+    "filebrowser_post_copy",
+    "filebrowser_post_bulk_delete",
+    "filebrowser_post_bulk_move",
+    "filebrowser_post_bulk_copy",
+)
+
+
+def sync_receiver(receiver):
+    """
+    Marks a receiver of FileBrowser's ``post_*`` signals to be called within
+    the request even with ``SIGNAL_DISPATCH`` set.
+    """
+    receiver.filebrowser_sync = True
+    return receiver
+
+
+def _key(lookup_key, receiver):
+    """
+    Returns the name a receiver is queued under: its ``dispatch_uid``, or the
+    dotted path of a module level function. Other receivers, e.g. bound
+    methods, partials or callable instances, can't be told apart by name.
+    """
+    if isinstance(lookup_key, str):
+        return lookup_key
+    qualname = getattr(receiver, "__qualname__", "<locals>")
+    if isinstance(receiver, types.FunctionType) and "<locals>" not in qualname:
+        return "%s.%s" % (receiver.__module__, qualname)
+    return None
+
+
+def _receivers(signal, sender):
+    """
+    Returns the ``(key, receiver)`` pairs of the live receivers of signal
+    for sender, in the order they were connected.
+    """
+    senders = (_make_id(None), _make_id(sender))
+    with signal.lock:
+        entries = list(signal.receivers)
+    receivers = []
+    for entry in entries:
+        (lookup_key, sender_key), receiver = entry[0], entry[1]
+        if sender_key not in senders:
+            continue
+        if isinstance(receiver, weakref.ReferenceType):
+            receiver = receiver()
+            if receiver is None:
+                continue
+        receivers.append((_key(lookup_key, receiver), receiver))
+    return receivers
+
+
+def _signals():
+    from filebrowser_safe import views
+
+    return {name: getattr(views, name) for name in SIGNALS}
+
+
+def _encode(value):
+    if isinstance(value, FileObject):
+        data = {
+            key: value.__dict__[key] for key in FILEOBJECT_DATA if key in value.__dict__
+        }
+        return {"fileobject": value.path, "data": data}
+    return value
+
+
+def _decode(value):
+    if isinstance(value, dict) and "fileobject" in value:
+        fileobject = FileObject(value["fileobject"])
+        fileobject.__dict__.update(value["data"])
+        return fileobject
+    return value
+
+
+def send(signal, sender, **kwargs):
+    """
+    Sends one of FileBrowser's ``post_*`` signals. With ``SIGNAL_DISPATCH``
+    set, only the receivers marked with ``sync_receiver`` are called now, and
+    the signal is queued for the others.
+
+    Deferred receivers are called with ``sender=None`` since the request is
+    gone by then, and with the ``user_id`` of the request and ``deferred=True``.
+    They're found again by their ``dispatch_uid``, or their dotted path for
+    module level functions. Receivers with neither are called in the request.
+    """
+    if not fb_settings.SIGNAL_DISPATCH:
+        signal.send(sender=sender, **kwargs)
+        return
+    deferred = []
+    for key, receiver in _receivers(signal, sender):
+        if getattr(receiver, "filebrowser_sync", False):
+            receiver(signal=signal, sender=sender, **kwargs)
+        elif key is None:
+            logger.warning(
+                "Receiver %r has no dispatch_uid to be deferred with, calling "
+                "it in the request",
+                receiver,
+            )
+            receiver(signal=signal, sender=sender, **kwargs)
+        else:
+            deferred.append(key)
+    if not deferred:
+        return
+    user = getattr(sender, "user", None)
+    event = {
+        "signal": next(n for n, s in _signals().items() if s is signal),
+        "receivers": deferred,
+        "user_id": getattr(user, "pk", None),
+        "site_id": get_site_partition(),
+        "kwargs": {key: _encode(value) for key, value in kwargs.items()},
+        "attempts": 0,
+    }
+    if not get_queue().put(event):
+        logger.warning("Signal queue full, sending %s in the request", event["signal"])
+        _send(event)
+
+
+def _send(event):
+    """
+    Calls the deferred receivers of an event, returning the labels of the
+    receivers that raised an exception.
+    """
+    signal = _signals()[event["signal"]]
+    kwargs = {key: _decode(value) for key, value in event["kwargs"].items()}
+    kwargs.update(sender=None, user_id=event["user_id"], deferred=True)
+    failed = []
+    for key, receiver in _receivers(signal, None):
+        if key is None or key not in event["receivers"]:
+            continue
+        try:
+            if event["site_id"] is None:
+                receiver(signal=signal, **kwargs)
+            else:
+                with override_current_site_id(event["site_id"]):
+                    receiver(signal=signal, **kwargs)
+        except Exception:
+            logger.exception("Receiver %s of %s failed", key, event["signal"])
+            failed.append(key)
+    return failed
+
+
+def _retry(event, failed):
+    """
+    Returns the event to send again to the ``failed`` receivers, or None if
+    there are none or they're out of retries.
+    """
+    if not failed:
+        return None
+    if event["attempts"] >= fb_settings.SIGNAL_RETRIES:
+        logger.error("Gave up sending %s to %s", event["signal"], ", ".join(failed))
+        return None
+    return dict(event, receivers=failed, attempts=event["attempts"] + 1)
+
+
+def _retry_delay(event):
+    return fb_settings.SIGNAL_RETRY_DELAY * 2 ** (event["attempts"] - 1)
+
+
+class ThreadQueue:
+    """
+    Sends queued signals from a pool of daemon threads in this process.
+    Queued signals are lost if the process exits.
+    """
+
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=fb_settings.SIGNAL_QUEUE_SIZE)
+        self.lock = threading.Lock()
+        self.threads = []
+
+    def put(self, event):
+        with self.lock:
+            while len(self.threads) < fb_settings.SIGNAL_WORKERS:
+                thread = threading.Thread(
+                    target=self.work,
+                    name="filebrowser-signals-%d" % len(self.threads),
+                    daemon=True,
+                )
+                thread.start()
+                self.threads.append(thread)
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            return False
+        return True
+
+    def requeue(self, event):
+        if not self.put(event):
+            logger.error("Signal queue full, dropped retry of %s", event["signal"])
+
+    def work(self):
+        while True:
+            event = self.queue.get()
+            try:
+                retry = _retry(event, _send(event))
+                if retry is not None:
+                    delay = _retry_delay(retry)
+                    if delay:
+                        timer = threading.Timer(delay, self.requeue, args=(retry,))
+                        timer.daemon = True
+                        timer.start()
+                    else:
+                        self.requeue(retry)
+            finally:
+                close_old_connections()
+                self.queue.task_done()
+
+    def join(self):
+        """
+        Waits until the queued signals are sent.
+        """
+        self.queue.join()
+
+
+class DatabaseQueue:
+    """
+    Keeps queued signals in the database, until sent by ``process``.
+    """
+
+    def put(self, event):
+        if SignalEvent.objects.count() >= fb_settings.SIGNAL_QUEUE_SIZE:
+            return False
+        SignalEvent.objects.create(
+            signal=event["signal"],
+            payload=json.dumps(event),
+            available=timezone.now(),
+        )
+        return True
+
+    def claim(self, limit):
+        """
+        Returns the first ``limit`` queued signals due, hiding them from other
+        dispatchers for ``LEASE`` seconds.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            events = list(
+                SignalEvent.objects.select_for_update(skip_locked=True)
+                .filter(available__lte=now)
+                .order_by("id")[:limit]
+            )
+            SignalEvent.objects.filter(pk__in=[e.pk for e in events]).update(
+                available=now + timedelta(seconds=LEASE)
+            )
+        return events
+
+    def process(self, limit=100):
+        """
+        Sends up to ``limit`` queued signals, returning how many were sent.
+        """
+        events = self.claim(limit)
+        for row in events:
+            event = json.loads(row.payload)
+            retry = _retry(event, _send(event))
+            if retry is None:
+                row.delete()
+                continue
+            SignalEvent.objects.filter(pk=row.pk).update(
+                payload=json.dumps(retry),
+                attempts=retry["attempts"],
+                available=timezone.now() + timedelta(seconds=_retry_delay(retry)),
+            )
+        return len(events)
+
+
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+def get_queue():
+    """
+    Returns the queue of signals selected by ``SIGNAL_DISPATCH``.
+    """
+    queue_classes = {"thread": ThreadQueue, "database": DatabaseQueue}
+    dispatch = fb_settings.SIGNAL_DISPATCH
+    if dispatch not in queue_classes:
+        raise ImproperlyConfigured(
+            "FILEBROWSER_SIGNAL_DISPATCH must be None, 'thread' or 'database'."
+        )
+    with _queues_lock:
+        if dispatch not in _queues:
+            _queues[dispatch] = queue_classes[dispatch]()
+        return _queues[dispatch]
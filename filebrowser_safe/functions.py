@@ -1,16 +1,26 @@
+import datetime
 import os
 import re
+import threading
 import unicodedata
 import warnings
-from time import gmtime, localtime, strftime, time
+from contextlib import contextmanager
+from functools import lru_cache
+from time import mktime, time
 
 from django.conf import settings as dj_settings
 from django.core.files.storage import default_storage
 
 from filebrowser_safe import settings as fb_settings
+from filebrowser_safe.storage import setup_default_storage
 
 try:
-    from mezzanine.utils.sites import current_site_id
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
+try:
+    from mezzanine.utils.sites import current_site_id, override_current_site_id
 except ImportError:
     # TODO: filebrowser-safe should not rely on `current_site_id` at all since its
     # provided by Mezzanine.
@@ -26,8 +36,18 @@ except ImportError:
         """
     )
 
+    _site_override = threading.local()
+
     def current_site_id():
-        return dj_settings.SITE_ID
+        return getattr(_site_override, "site_id", dj_settings.SITE_ID)
+
+    @contextmanager
+    def override_current_site_id(site_id):
+        _site_override.site_id = site_id
+        try:
+            yield
+        finally:
+            del _site_override.site_id
 
 
 def get_directory():
@@ -37,15 +57,28 @@ def get_directory():
     creating the root directory if missing.
     """
 
+    setup_default_storage()
     dirname = fb_settings.DIRECTORY
-    if getattr(dj_settings, "MEDIA_LIBRARY_PER_SITE", False):
-        dirname = os.path.join(dirname, "site-%s" % current_site_id())
+    site_id = get_site_partition()
+    if site_id is not None:
+        dirname = os.path.join(dirname, "site-%s" % site_id)
     fullpath = os.path.join(dj_settings.MEDIA_ROOT, dirname)
     if not default_storage.isdir(fullpath):
         default_storage.makedirs(fullpath)
     return dirname
 
 
+def get_site_partition():
+    """
+    Returns the ID of the site whose media library is in use, by which
+    FileBrowser's caches are partitioned, or None if ``MEDIA_LIBRARY_PER_SITE``
+    isn't set.
+    """
+    if getattr(dj_settings, "MEDIA_LIBRARY_PER_SITE", False):
+        return current_site_id()
+    return None
+
+
 def path_strip(path, root):
     if not path or not root:
         return path
@@ -137,30 +170,130 @@ def get_breadcrumbs(query, path):
     return breadcrumbs
 
 
+def get_filterdate_range(filter_date, date_from="", date_to=""):
+    """
+    Get the ``[start, end)`` timestamp bounds of a date filter, either of
+    which may be None when unbounded. ``filter_date`` is one of the named
+    ranges, ``date_from`` and ``date_to`` are inclusive ``YYYY-MM-DD`` dates,
+    and all given bounds apply. Invalid dates are ignored.
+
+    Computed once per listing so that files are checked with two comparisons.
+    """
+    now = time()
+    today = datetime.date.today()
+    start = end = None
+    if filter_date == "today":
+        start = _local_timestamp(today)
+        end = _local_timestamp(today + datetime.timedelta(days=1))
+    elif filter_date == "past7days":
+        start = now - 604800
+    elif filter_date == "thismonth":
+        start = now - 2592000
+    elif filter_date == "thisyear":
+        start = _local_timestamp(today.replace(month=1, day=1))
+        end = _local_timestamp(today.replace(year=today.year + 1, month=1, day=1))
+    elif filter_date:
+        # Unknown ranges match nothing.
+        return (now, now)
+    date_from, date_to = _parse_date(date_from), _parse_date(date_to)
+    if date_from is not None:
+        start = max(start or 0, _local_timestamp(date_from))
+    if date_to is not None:
+        date_to = _local_timestamp(date_to + datetime.timedelta(days=1))
+        end = date_to if end is None else min(end, date_to)
+    return (start, end)
+
+
+def in_date_range(timestamp, date_range):
+    """
+    Returns True if the timestamp falls within the ``[start, end)`` bounds
+    returned by ``get_filterdate_range``.
+    """
+    start, end = date_range
+    if start is None and end is None:
+        return True
+    if timestamp is None:
+        return False
+    return (start is None or timestamp >= start) and (end is None or timestamp < end)
+
+
+def _local_timestamp(date):
+    return mktime(date.timetuple())
+
+
+def _parse_date(value):
+    try:
+        return datetime.datetime.strptime(value or "", "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+
 def get_filterdate(filterDate, dateTime):
     """
     Get filterdate.
     """
-    returnvalue = ""
-    dateYear = strftime("%Y", gmtime(dateTime))
-    dateMonth = strftime("%m", gmtime(dateTime))
-    dateDay = strftime("%d", gmtime(dateTime))
-    if (
-        filterDate == "today"
-        and int(dateYear) == int(localtime()[0])
-        and int(dateMonth) == int(localtime()[1])
-        and int(dateDay) == int(localtime()[2])
-    ):
-        returnvalue = "true"
-    elif filterDate == "thismonth" and dateTime >= time() - 2592000:
-        returnvalue = "true"
-    elif filterDate == "thisyear" and int(dateYear) == int(localtime()[0]):
-        returnvalue = "true"
-    elif filterDate == "past7days" and dateTime >= time() - 604800:
-        returnvalue = "true"
-    elif filterDate == "":
-        returnvalue = "true"
-    return returnvalue
+    if in_date_range(dateTime, get_filterdate_range(filterDate)):
+        return "true"
+    return ""
+
+
+def _required_literal(pattern):
+    """
+    Returns the longest run of literal characters any match of ``pattern``
+    must contain, or an empty string if there's none we can rely on.
+    """
+    try:
+        parsed = sre_parse.parse(pattern)
+        # Called ``pattern`` before Python 3.8.
+        flags = (getattr(parsed, "state", None) or parsed.pattern).flags
+    except Exception:
+        return ""
+    if flags & (re.IGNORECASE | re.VERBOSE):
+        return ""
+    longest = run = ""
+    for op, value in parsed:
+        if op == sre_parse.LITERAL:
+            run += chr(value)
+            longest = max(longest, run, key=len)
+        else:
+            run = ""
+    return longest
+
+
+@lru_cache(maxsize=None)
+def _exclude_matcher():
+    """
+    Compiles the ``EXCLUDE`` patterns into a single regex, along with the
+    literals at least one of which must appear in a filename for it to match.
+    Done on first use rather than at import time.
+    """
+    patterns = list(fb_settings.EXCLUDE)
+    if not patterns:
+        return None, ()
+    try:
+        regex = re.compile("|".join("(?:%s)" % pattern for pattern in patterns))
+    except re.error:
+        # Patterns using backreferences can't be combined.
+        regex = [re.compile(pattern) for pattern in patterns]
+    literals = tuple(_required_literal(pattern) for pattern in patterns)
+    if not all(literals):
+        literals = ()
+    return regex, literals
+
+
+@lru_cache(maxsize=4096)
+def is_excluded(filename):
+    """
+    Returns True if the filename matches any of the ``EXCLUDE`` patterns.
+    """
+    regex, literals = _exclude_matcher()
+    if regex is None:
+        return False
+    if literals and not any(literal in filename for literal in literals):
+        return False
+    if isinstance(regex, list):
+        return any(r.search(filename) for r in regex)
+    return regex.search(filename) is not None
 
 
 def get_settings_var():
@@ -0,0 +1,142 @@
+import logging
+import threading
+from functools import wraps
+from time import perf_counter
+
+from django.core.files.storage import default_storage
+
+from filebrowser_safe import metrics
+from filebrowser_safe import settings as fb_settings
+
+logger = logging.getLogger("filebrowser_safe")
+
+# Storage methods counted and timed when instrumentation is enabled.
+STORAGE_METHODS = (
+    "exists",
+    "isdir",
+    "isfile",
+    "size",
+    "get_modified_time",
+    "listdir",
+    "scandir",
+    "url",
+    "open",
+    "save",
+    "overwrite",
+    "delete",
+    "move",
+    "copy",
+    "makedirs",
+    "rmtree",
+)
+
+_local = threading.local()
+
+
+class StorageStats:
+    """
+    Counts and times the storage calls made while serving a request.
+
+    Calls made from within another storage method (e.g. ``exists`` inside
+    ``isdir`` on S3) are counted, but only the outermost call adds to
+    ``total_time`` so that time isn't counted twice.
+    """
+
+    def __init__(self):
+        self.calls = {}
+        self.times = {}
+        self.total_time = 0.0
+        self.depth = 0
+
+    def record(self, method, elapsed):
+        self.calls[method] = self.calls.get(method, 0) + 1
+        self.times[method] = self.times.get(method, 0.0) + elapsed
+        if not self.depth:
+            self.total_time += elapsed
+
+    @property
+    def total_calls(self):
+        return sum(self.calls.values())
+
+    def __str__(self):
+        summary = [
+            "calls=%d" % self.total_calls,
+            "time=%.1fms" % (self.total_time * 1000),
+        ]
+        for method in sorted(self.calls):
+            summary.append(
+                "%s=%d/%.1fms" % (method, self.calls[method], self.times[method] * 1000)
+            )
+        return "; ".join(summary)
+
+
+def current_stats():
+    """
+    Returns the ``StorageStats`` for the request being served, or None.
+    """
+    return getattr(_local, "stats", None)
+
+
+def _instrument(name, method):
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        stats = current_stats()
+        if stats is None:
+            return method(self, *args, **kwargs)
+        stats.depth += 1
+        start = perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            stats.depth -= 1
+            stats.record(name, perf_counter() - start)
+
+    wrapper.fb_instrumented = True
+    return wrapper
+
+
+def instrument_storage_class(storage_class):
+    """
+    Wraps the storage methods of ``storage_class`` so that calls made while
+    an instrumented view is running are recorded. Safe to call repeatedly.
+    """
+    for name in STORAGE_METHODS:
+        method = getattr(storage_class, name, None)
+        if method is None or getattr(method, "fb_instrumented", False):
+            continue
+        setattr(storage_class, name, _instrument(name, method))
+
+
+def instrument_storage(view):
+    """
+    View decorator recording the storage calls made while serving the view,
+    including those made while rendering its template.
+    """
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        enabled = fb_settings.STORAGE_INSTRUMENTATION or fb_settings.METRICS
+        if not enabled or current_stats() is not None:
+            return view(request, *args, **kwargs)
+        stats = _local.stats = StorageStats()
+        try:
+            response = view(request, *args, **kwargs)
+        finally:
+            del _local.stats
+            if fb_settings.METRICS:
+                metrics.record_storage_stats(stats, default_storage.__class__.__name__)
+        if not fb_settings.STORAGE_INSTRUMENTATION:
+            return response
+        response["X-Filebrowser-Storage"] = str(stats)
+        budget = fb_settings.STORAGE_CALL_BUDGET
+        if budget is not None and stats.total_calls > budget:
+            logger.warning(
+                "%s made %d storage calls (budget %d): %s",
+                request.path,
+                stats.total_calls,
+                budget,
+                stats,
+            )
+        return response
+
+    return wrapper
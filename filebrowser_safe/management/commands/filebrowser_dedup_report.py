@@ -0,0 +1,46 @@
+import os
+from collections import defaultdict
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.template.defaultfilters import filesizeformat
+
+from filebrowser_safe.models import ContentHash
+from filebrowser_safe.storage import FileSystemStorageMixin, setup_default_storage
+
+
+class Command(BaseCommand):
+    help = (
+        "Reports the disk space saved by storing identical uploads as hard "
+        "links (FILEBROWSER_DEDUPLICATE_UPLOADS)."
+    )
+
+    def handle(self, **options):
+        setup_default_storage()
+        if not isinstance(default_storage, FileSystemStorageMixin):
+            raise CommandError("Only storages supporting hard links are deduplicated.")
+        files = defaultdict(int)
+        inodes = defaultdict(set)
+        for content_hash in ContentHash.objects.iterator():
+            try:
+                stat = os.stat(default_storage.path(content_hash.path))
+            except OSError:
+                # Removed outside of FileBrowser
+                continue
+            content = (content_hash.digest, content_hash.size)
+            files[content] += 1
+            inodes[content].add((stat.st_dev, stat.st_ino))
+        saved = 0
+        for (digest, size), count in sorted(files.items()):
+            # Links to the same inode only take the space of one file.
+            shared = count - len(inodes[digest, size])
+            saved += shared * size
+            if shared and options["verbosity"] > 1:
+                self.stdout.write(
+                    "%s: %d files, %s saved"
+                    % (digest, count, filesizeformat(shared * size))
+                )
+        self.stdout.write(
+            "%d files, %d distinct contents, %s saved."
+            % (sum(files.values()), len(files), filesizeformat(saved))
+        )
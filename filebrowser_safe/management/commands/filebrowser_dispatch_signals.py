@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from filebrowser_safe import settings as fb_settings
+from filebrowser_safe.dispatch import DatabaseQueue
+
+
+class Command(BaseCommand):
+    help = (
+        "Sends the FileBrowser signals queued in the database to their "
+        "receivers, with FILEBROWSER_SIGNAL_DISPATCH set to 'database'. "
+        "Several instances may run at once."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once no queued signal is due, instead of waiting for more.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=1.0,
+            help="Seconds to wait for more signals once none is due.",
+        )
+        parser.add_argument(
+            "--batch",
+            type=int,
+            default=100,
+            help="Number of signals claimed at a time.",
+        )
+
+    def handle(self, **options):
+        if fb_settings.SIGNAL_DISPATCH != "database":
+            raise CommandError("FILEBROWSER_SIGNAL_DISPATCH isn't set to 'database'.")
+        queue = DatabaseQueue()
+        try:
+            while True:
+                if queue.process(options["batch"]):
+                    continue
+                if options["once"]:
+                    break
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            pass
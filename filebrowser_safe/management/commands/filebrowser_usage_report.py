@@ -0,0 +1,139 @@
+import heapq
+import json
+import posixpath
+from collections import defaultdict
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+
+from filebrowser_safe.functions import (
+    get_directory,
+    get_file_type,
+    override_current_site_id,
+)
+from filebrowser_safe.storage import _concurrently
+
+
+def _scan(name):
+    try:
+        return default_storage.scandir(name)
+    except FileNotFoundError:
+        return []
+
+
+class Command(BaseCommand):
+    help = (
+        "Reports the space used by the FileBrowser directory: recursive size "
+        "and number of files of its largest folders, its largest files, and "
+        "totals per file type. Folders are listed concurrently."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--site",
+            type=int,
+            default=None,
+            help="ID of the site to report on, with MEDIA_LIBRARY_PER_SITE.",
+        )
+        parser.add_argument(
+            "--top",
+            type=int,
+            default=10,
+            help="Number of largest folders and files reported.",
+        )
+        parser.add_argument(
+            "--json",
+            action="store_true",
+            help="Output the report as JSON.",
+        )
+
+    def handle(self, **options):
+        if options["site"] is None:
+            report = self.get_report(options["top"])
+        else:
+            with override_current_site_id(options["site"]):
+                report = self.get_report(options["top"])
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.write_report(report)
+
+    def get_report(self, top):
+        """
+        Lists the directory level by level, each level's folders concurrently,
+        and adds the size and number of files of each folder to its parents.
+        """
+        root = get_directory().rstrip("/")
+        sizes = defaultdict(int)
+        counts = defaultdict(int)
+        types = defaultdict(lambda: {"size": 0, "files": 0})
+        largest_files = []
+        level = [root]
+        while level:
+            next_level = []
+            for folder, entries in zip(level, _concurrently(_scan, level)):
+                for filename, is_dir, size, modified_time in entries:
+                    path = posixpath.join(folder, filename)
+                    if is_dir:
+                        next_level.append(path)
+                        continue
+                    size = size or 0
+                    sizes[folder] += size
+                    counts[folder] += 1
+                    file_type = types[get_file_type(filename) or "Other"]
+                    file_type["size"] += size
+                    file_type["files"] += 1
+                    heapq.heappush(largest_files, (size, path))
+                    if len(largest_files) > top:
+                        heapq.heappop(largest_files)
+                sizes.setdefault(folder, 0)
+            level = next_level
+
+        # Deepest folders first, so that each total is complete when added
+        # to the parent's.
+        for folder in sorted(sizes, key=lambda f: f.count("/"), reverse=True):
+            if folder != root:
+                parent = posixpath.dirname(folder)
+                sizes[parent] += sizes[folder]
+                counts[parent] += counts[folder]
+        folders = heapq.nlargest(
+            top, (folder for folder in sizes if folder != root), key=sizes.get
+        )
+        return {
+            "directory": root,
+            "size": sizes[root],
+            "files": counts[root],
+            "folders": [
+                {"path": folder, "size": sizes[folder], "files": counts[folder]}
+                for folder in folders
+            ],
+            "largest_files": [
+                {"path": path, "size": size}
+                for size, path in sorted(largest_files, reverse=True)
+            ],
+            "types": dict(sorted(types.items())),
+        }
+
+    def write_report(self, report):
+        self.stdout.write(
+            "%s: %d files, %s"
+            % (report["directory"], report["files"], filesizeformat(report["size"]))
+        )
+        self.stdout.write("Largest folders:")
+        for folder in report["folders"]:
+            self.stdout.write(
+                "  %10s %8d files  %s"
+                % (filesizeformat(folder["size"]), folder["files"], folder["path"])
+            )
+        self.stdout.write("Largest files:")
+        for file in report["largest_files"]:
+            self.stdout.write(
+                "  %10s  %s" % (filesizeformat(file["size"]), file["path"])
+            )
+        self.stdout.write("By type:")
+        for file_type, usage in report["types"].items():
+            self.stdout.write(
+                "  %10s %8d files  %s"
+                % (filesizeformat(usage["size"]), usage["files"], file_type)
+            )
@@ -0,0 +1,224 @@
+import json
+import os
+import posixpath
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from filebrowser_safe import settings as fb_settings
+from filebrowser_safe.functions import (
+    get_directory,
+    get_file_type,
+    override_current_site_id,
+)
+from filebrowser_safe.templatetags.fb_tags import thumbnail
+from filebrowser_safe.views import browse_listing
+
+
+class RateLimiter:
+    """
+    Spaces out the calls to ``wait`` made by all threads, so that at most
+    ``rate`` of them return per second.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.lock = threading.Lock()
+        self.next_time = time.monotonic()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+class Command(BaseCommand):
+    help = (
+        "Walks the FileBrowser directory of each site, caching the listings "
+        "browse() shows by default and generating their thumbnails, so that "
+        "the first editors to open big folders don't pay for it. Only useful "
+        "if FILEBROWSER_CACHE is shared with the web processes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--site",
+            type=int,
+            action="append",
+            dest="sites",
+            help="ID of a site to warm, with MEDIA_LIBRARY_PER_SITE. "
+            "Defaults to all sites.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=fb_settings.STORAGE_WORKERS,
+            help="Number of folders warmed concurrently.",
+        )
+        parser.add_argument(
+            "--rate",
+            type=float,
+            default=None,
+            help="Max. storage listings and thumbnails per second.",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            default=None,
+            help="File recording the progress, to resume an interrupted run.",
+        )
+        parser.add_argument(
+            "--no-thumbnails",
+            action="store_false",
+            dest="thumbnails",
+            help="Don't generate the thumbnails of listed images.",
+        )
+        parser.add_argument(
+            "--report-interval",
+            type=float,
+            default=10.0,
+            help="Seconds between progress reports.",
+        )
+
+    def handle(self, **options):
+        if not fb_settings.LISTING_CACHE_TIMEOUT:
+            raise CommandError(
+                "FILEBROWSER_LISTING_CACHE_TIMEOUT isn't set, listings aren't cached."
+            )
+        if fb_settings.LISTING_CACHE_SITE_ENTRIES:
+            self.stderr.write(
+                "FILEBROWSER_LISTING_CACHE_SITE_ENTRIES keeps listings in each "
+                "process, only thumbnails will be of use to the web processes."
+            )
+        self.options = options
+        self.limiter = RateLimiter(options["rate"])
+        self.checkpoint_path = options["checkpoint"]
+        self.checkpoint = {"done": [], "pending": {}}
+        if self.checkpoint_path and os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path) as f:
+                self.checkpoint = json.load(f)
+
+        for site_id in self.get_sites(options["sites"]):
+            if site_id in self.checkpoint["done"]:
+                continue
+            if site_id is not None:
+                self.stdout.write("Site %s" % site_id)
+            pending = self.checkpoint["pending"].get(str(site_id), [""])
+            self.warm_site(site_id, pending)
+            self.checkpoint["pending"].pop(str(site_id), None)
+            self.checkpoint["done"].append(site_id)
+            self.save_checkpoint()
+        if self.checkpoint_path and os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+    def get_sites(self, sites):
+        if not getattr(settings, "MEDIA_LIBRARY_PER_SITE", False):
+            return [None]
+        if sites:
+            return sites
+        if not apps.is_installed("django.contrib.sites"):
+            raise CommandError("Use --site to give the sites to warm.")
+        from django.contrib.sites.models import Site
+
+        return list(Site.objects.order_by("id").values_list("id", flat=True))
+
+    def save_checkpoint(self):
+        if not self.checkpoint_path:
+            return
+        temp_path = self.checkpoint_path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self.checkpoint, f)
+        os.replace(temp_path, self.checkpoint_path)
+
+    def warm_folder(self, path):
+        """
+        Caches the listing of the folder ``path`` and generates the thumbnails
+        of its images. Returns its subfolders and its number of files and
+        thumbnails.
+        """
+        self.limiter.wait()
+        results_var, counter, entries = browse_listing(path)
+        folders = []
+        files = thumbnails = 0
+        for filename, is_dir, size, modified_time in entries:
+            if is_dir:
+                folders.append(posixpath.join(path, filename))
+                continue
+            files += 1
+            if self.options["thumbnails"] and get_file_type(filename) == "Image":
+                self.limiter.wait()
+                thumbnail(posixpath.join(get_directory(), path, filename), 60, 60)
+                thumbnails += 1
+        return folders, files, thumbnails
+
+    def warm_site(self, site_id, pending):
+        def warm(path):
+            if site_id is None:
+                return self.warm_folder(path)
+            with override_current_site_id(site_id):
+                return self.warm_folder(path)
+
+        pending = set(pending)
+        totals = {"folders": 0, "files": 0, "thumbnails": 0, "errors": 0}
+        start = last_report = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.options["workers"]) as executor:
+            futures = {executor.submit(warm, path): path for path in pending}
+            try:
+                while futures:
+                    done, _ = wait(
+                        futures,
+                        timeout=self.options["report_interval"],
+                        return_when=FIRST_COMPLETED,
+                    )
+                    for future in done:
+                        path = futures.pop(future)
+                        try:
+                            folders, files, thumbnails = future.result()
+                        except Exception as e:
+                            self.stderr.write("%s: %s" % (path or "/", e))
+                            totals["errors"] += 1
+                            folders, files, thumbnails = [], 0, 0
+                        pending.discard(path)
+                        for folder in folders:
+                            pending.add(folder)
+                            futures[executor.submit(warm, folder)] = folder
+                        totals["folders"] += 1
+                        totals["files"] += files
+                        totals["thumbnails"] += thumbnails
+                    now = time.monotonic()
+                    if now - last_report >= self.options["report_interval"]:
+                        last_report = now
+                        self.report(totals, now - start, len(pending))
+                        self.checkpoint["pending"][str(site_id)] = sorted(pending)
+                        self.save_checkpoint()
+            except BaseException:
+                # Folders not warmed yet are left for the next run.
+                for future in futures:
+                    future.cancel()
+                self.checkpoint["pending"][str(site_id)] = sorted(pending)
+                self.save_checkpoint()
+                raise
+        self.report(totals, time.monotonic() - start, 0)
+
+    def report(self, totals, elapsed, pending):
+        self.stdout.write(
+            "%d folders, %d files, %d thumbnails, %d errors in %.1fs "
+            "(%.1f folders/s), %d folders pending."
+            % (
+                totals["folders"],
+                totals["files"],
+                totals["thumbnails"],
+                totals["errors"],
+                elapsed,
+                totals["folders"] / elapsed if elapsed else 0.0,
+                pending,
+            )
+        )
@@ -0,0 +1,48 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from filebrowser_safe.watcher import DirectoryWatcher
+
+
+class Command(BaseCommand):
+    help = (
+        "Watches the FileBrowser directory for changes made outside of "
+        "FileBrowser and discards the affected cached listings. The cache "
+        "configured by FILEBROWSER_GENERATION_CACHE must be shared with the "
+        "web processes (e.g. Redis or Memcached)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--coalesce",
+            type=float,
+            default=1.0,
+            help="Seconds without events before changes are applied.",
+        )
+        parser.add_argument(
+            "--max-delay",
+            type=float,
+            default=10.0,
+            help="Max. seconds before changes are applied during a burst.",
+        )
+        parser.add_argument(
+            "--reconcile",
+            type=float,
+            default=300.0,
+            help="Seconds between full rescans catching missed events.",
+        )
+
+    def handle(self, **options):
+        try:
+            watcher = DirectoryWatcher(
+                coalesce=options["coalesce"],
+                max_delay=options["max_delay"],
+                reconcile=options["reconcile"],
+            )
+        except ImproperlyConfigured as e:
+            raise CommandError(e)
+        self.stdout.write("Watching %s" % watcher.root)
+        try:
+            watcher.run()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,223 @@
+import threading
+from bisect import bisect_left
+from functools import wraps
+from time import perf_counter
+
+from filebrowser_safe import settings as fb_settings
+
+# Upper bounds of the histogram buckets, in seconds.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Upper bounds of the histogram buckets, in bytes per second.
+THROUGHPUT_BUCKETS = tuple(2 ** n for n in range(16, 31, 2))
+# Upper bounds of the histogram buckets, in entries.
+ENTRIES_BUCKETS = (10, 50, 100, 500, 1000, 5000, 10000, 50000)
+
+# Type and help text of each metric.
+METRICS = {
+    "filebrowser_view_seconds": ("histogram", "Time spent serving FileBrowser views."),
+    "filebrowser_upload_bytes_total": ("counter", "Bytes of files uploaded."),
+    "filebrowser_uploads_total": ("counter", "Files uploaded."),
+    "filebrowser_upload_throughput_bytes_per_second": (
+        "histogram",
+        "Rate at which uploaded files were received.",
+    ),
+    "filebrowser_rejected_uploads_total": (
+        "counter",
+        "Uploads rejected while received, by reason.",
+    ),
+    "filebrowser_storage_calls_total": (
+        "counter",
+        "Storage calls made by FileBrowser views, by method and backend.",
+    ),
+    "filebrowser_storage_call_seconds_total": (
+        "counter",
+        "Time spent in storage calls made by FileBrowser views.",
+    ),
+    "filebrowser_listing_cache_hits_total": ("counter", "Listing cache hits."),
+    "filebrowser_listing_cache_misses_total": ("counter", "Listing cache misses."),
+    "filebrowser_listing_cache_evictions_total": (
+        "counter",
+        "Listings evicted from the in-process listing cache.",
+    ),
+    "filebrowser_listing_cache_entries": (
+        "gauge",
+        "Listings in the in-process listing cache.",
+    ),
+    "filebrowser_listing_entries": (
+        "histogram",
+        "Directory entries of the folders listed.",
+    ),
+}
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, value=1, **labels):
+    """
+    Adds ``value`` to the counter ``name`` with the given labels.
+    """
+    if not fb_settings.METRICS:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, value, buckets=LATENCY_BUCKETS, **labels):
+    """
+    Records ``value`` in the histogram ``name`` with the given labels.
+    """
+    if not fb_settings.METRICS:
+        return
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram(buckets)
+        histogram.observe(value)
+
+
+def clear():
+    """
+    Forgets the counters and histograms recorded so far.
+    """
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+def time_view(view):
+    """
+    View decorator recording the time spent serving the view.
+    """
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not fb_settings.METRICS:
+            return view(request, *args, **kwargs)
+        start = perf_counter()
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            observe(
+                "filebrowser_view_seconds",
+                perf_counter() - start,
+                view=view.__name__,
+            )
+
+    return wrapper
+
+
+def record_storage_stats(stats, backend):
+    """
+    Adds the storage calls of a request's ``StorageStats`` to the metrics.
+    """
+    for method, calls in stats.calls.items():
+        inc("filebrowser_storage_calls_total", calls, method=method, backend=backend)
+        inc(
+            "filebrowser_storage_call_seconds_total",
+            stats.times[method],
+            method=method,
+            backend=backend,
+        )
+
+
+def record_upload(size, seconds):
+    inc("filebrowser_uploads_total")
+    inc("filebrowser_upload_bytes_total", size)
+    if seconds > 0:
+        observe(
+            "filebrowser_upload_throughput_bytes_per_second",
+            size / seconds,
+            buckets=THROUGHPUT_BUCKETS,
+        )
+
+
+def _collect():
+    """
+    Returns the counters and gauges kept by other modules.
+    """
+    from filebrowser_safe.cache import listing_cache_stats
+    from filebrowser_safe.uploadhandler import rejected_uploads
+
+    values = {}
+    for reason, count in rejected_uploads().items():
+        values[_key("filebrowser_rejected_uploads_total", {"reason": reason})] = count
+    for site_id, stats in listing_cache_stats().items():
+        labels = {"site": "" if site_id is None else site_id}
+        for stat, value in stats.items():
+            name = "filebrowser_listing_cache_%s" % stat
+            if stat != "entries":
+                name += "_total"
+            values[_key(name, labels)] = value
+    return values
+
+
+def _labels(labels, **extra):
+    labels = labels + tuple(extra.items())
+    if not labels:
+        return ""
+    return "{%s}" % ",".join(
+        '%s="%s"' % (label, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for label, value in labels
+    )
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    """
+    Returns the metrics in the Prometheus text exposition format.
+    """
+    with _lock:
+        values = dict(_counters)
+        histograms = {
+            key: (histogram.buckets, list(histogram.counts), histogram.sum)
+            for key, histogram in _histograms.items()
+        }
+    values.update(_collect())
+
+    lines = []
+    for name, (metric_type, help_text) in sorted(METRICS.items()):
+        lines.append("# HELP %s %s" % (name, help_text))
+        lines.append("# TYPE %s %s" % (name, metric_type))
+        for (key_name, labels), value in sorted(values.items(), key=str):
+            if key_name == name:
+                lines.append("%s%s %s" % (name, _labels(labels), _number(value)))
+        for (key_name, labels), (buckets, counts, total) in sorted(
+            histograms.items(), key=str
+        ):
+            if key_name != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets + (float("inf"),), counts):
+                cumulative += count
+                lines.append(
+                    "%s_bucket%s %d"
+                    % (name, _labels(labels, le=_number(bound)), cumulative)
+                )
+            lines.append("%s_sum%s %s" % (name, _labels(labels), _number(total)))
+            lines.append("%s_count%s %d" % (name, _labels(labels), cumulative))
+    return "\n".join(lines) + "\n"
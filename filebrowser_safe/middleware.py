@@ -0,0 +1,20 @@
+from filebrowser_safe.cache import storage_memo
+
+
+class StorageMemoMiddleware:
+    """
+    Remembers the results of read-only ``default_storage`` calls (``exists``,
+    ``isdir``, ``size`` and friends) for the duration of each request, so
+    views and templates asking the same question twice only hit the storage
+    once. Writes made through the storage discard the remembered results.
+
+    Add ``"filebrowser_safe.middleware.StorageMemoMiddleware"`` to
+    ``MIDDLEWARE`` to enable it.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with storage_memo():
+            return self.get_response(request)
@@ -0,0 +1,24 @@
+# Generated by Django 4.0.10 on 2026-10-19 09:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("filebrowser_safe", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SignalEvent",
+            fields=[
+                ("id", models.AutoField(primary_key=True, serialize=False)),
+                ("signal", models.CharField(max_length=100)),
+                ("payload", models.TextField()),
+                ("attempts", models.PositiveIntegerField(default=0)),
+                ("available", models.DateTimeField(db_index=True)),
+                ("created", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -1 +1,34 @@
-# This file is only necessary for the tests to work
+from django.db import models
+
+
+class ContentHash(models.Model):
+    """
+    Digest of the content of a file uploaded through FileBrowser, used to
+    store identical uploads only once.
+    """
+
+    id = models.AutoField(primary_key=True)
+    path = models.CharField(max_length=255, unique=True)
+    digest = models.CharField(max_length=64, db_index=True)
+    size = models.BigIntegerField()
+    modified = models.DateTimeField()
+
+    def __str__(self):
+        return self.path
+
+
+class SignalEvent(models.Model):
+    """
+    A FileBrowser ``post_*`` signal waiting to be sent to its deferred
+    receivers by the ``filebrowser_dispatch_signals`` command.
+    """
+
+    id = models.AutoField(primary_key=True)
+    signal = models.CharField(max_length=100)
+    payload = models.TextField()
+    attempts = models.PositiveIntegerField(default=0)
+    available = models.DateTimeField(db_index=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.signal
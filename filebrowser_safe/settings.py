@@ -107,6 +107,90 @@ DEFAULT_SORTING_BY = getattr(settings, "FILEBROWSER_DEFAULT_SORTING_BY", "date")
 DEFAULT_SORTING_ORDER = getattr(settings, "FILEBROWSER_DEFAULT_SORTING_ORDER", "desc")
 # regex to clean dir names before creation
 FOLDER_REGEX = getattr(settings, "FILEBROWSER_FOLDER_REGEX", r"^[\sa-zA-Z0-9_/-]+$")
+# Alias of the Django cache used by FileBrowser.
+CACHE = getattr(settings, "FILEBROWSER_CACHE", "default")
+# Alias of the Django cache holding the generation counters used to
+# invalidate cached listings. With several servers, this must be a cache
+# shared by all of them (e.g. Redis or Memcached), while CACHE may be local.
+GENERATION_CACHE = getattr(settings, "FILEBROWSER_GENERATION_CACHE", CACHE)
+# Seconds to cache sorted directory listings for, so that paging through a
+# folder doesn't list and sort it again. Listings are discarded when changed
+# through FileBrowser. Eviction is left to the cache backend.
+# Set to None to disable.
+LISTING_CACHE_TIMEOUT = getattr(settings, "FILEBROWSER_LISTING_CACHE_TIMEOUT", None)
+# Number of listings each site may keep in an in-process cache of its own,
+# evicting its least recently used listings first. When set, listings are kept
+# there rather than in CACHE, so that with MEDIA_LIBRARY_PER_SITE a busy site
+# only ever evicts its own listings. None leaves eviction to CACHE.
+LISTING_CACHE_SITE_ENTRIES = getattr(
+    settings, "FILEBROWSER_LISTING_CACHE_SITE_ENTRIES", None
+)
+# Max. number of threads used for concurrent storage operations.
+STORAGE_WORKERS = getattr(settings, "FILEBROWSER_STORAGE_WORKERS", 8)
+# Count and time the storage calls made by each FileBrowser request.
+# A summary is added to the response in the X-Filebrowser-Storage header.
+STORAGE_INSTRUMENTATION = getattr(
+    settings, "FILEBROWSER_STORAGE_INSTRUMENTATION", False
+)
+# Collect metrics of FileBrowser views, uploads, storage calls and listings in
+# each process, exposed in the Prometheus text format by the staff-only
+# fb_metrics view, or by filebrowser_safe.metrics.render().
+METRICS = getattr(settings, "FILEBROWSER_METRICS", False)
+# Log a warning for instrumented requests making more storage calls than this.
+# Set to None to disable the warning.
+STORAGE_CALL_BUDGET = getattr(settings, "FILEBROWSER_STORAGE_CALL_BUDGET", None)
+# Store files uploaded with the same content as an existing file as hard links
+# to it, when the storage supports them (FileSystemStorage). Content digests
+# are kept in the database, so filebrowser_safe's migrations must be applied.
+DEDUPLICATE_UPLOADS = getattr(settings, "FILEBROWSER_DEDUPLICATE_UPLOADS", False)
+# Extract uploaded zip archives into the upload folder instead of storing them.
+# Members are checked against EXTENSIONS and MAX_UPLOAD_SIZE one by one.
+EXTRACT_ZIP_UPLOADS = getattr(settings, "FILEBROWSER_EXTRACT_ZIP_UPLOADS", False)
+# Max. number of files and total uncompressed size in bytes of an extracted
+# archive. Archives over either are rejected before anything is written.
+EXTRACT_ZIP_MAX_FILES = getattr(settings, "FILEBROWSER_EXTRACT_ZIP_MAX_FILES", 1000)
+EXTRACT_ZIP_MAX_SIZE = getattr(
+    settings, "FILEBROWSER_EXTRACT_ZIP_MAX_SIZE", 100 * MAX_UPLOAD_SIZE
+)
+# Link files to FileBrowser's serve view instead of the storage's URLs, so
+# that media may be kept private and each download's permission checked.
+SERVE_MEDIA = getattr(settings, "FILEBROWSER_SERVE_MEDIA", False)
+# How the serve view sends files once permitted: None streams them through
+# Django, "x-accel-redirect" hands them to nginx from the internal location
+# SERVE_URL, and "x-sendfile" hands their local path to Apache or lighttpd.
+SERVE_MODE = getattr(settings, "FILEBROWSER_SERVE_MODE", None)
+SERVE_URL = getattr(settings, "FILEBROWSER_SERVE_URL", "/protected/")
+# Dotted path to a function called with the request and the file's storage
+# name, returning whether the file may be served. Defaults to requiring an
+# authenticated user.
+SERVE_PERMISSION = getattr(
+    settings, "FILEBROWSER_SERVE_PERMISSION", "filebrowser_safe.views.can_serve"
+)
+# Seconds browsers may cache served files for, when linked with their modified
+# time so that changed files get new URLs. Others are revalidated every time.
+SERVE_MAX_AGE = getattr(settings, "FILEBROWSER_SERVE_MAX_AGE", 60 * 60 * 24 * 365)
+# Let browsers upload straight to the storage with presigned requests, when
+# the storage supports them (S3Storage), rather than through Django. The
+# bucket's CORS rules must allow POST requests from the admin's origin.
+DIRECT_UPLOADS = getattr(settings, "FILEBROWSER_DIRECT_UPLOADS", False)
+# Seconds a presigned upload request may be started within.
+DIRECT_UPLOAD_EXPIRY = getattr(settings, "FILEBROWSER_DIRECT_UPLOAD_EXPIRY", 3600)
+# Send the post_* signals to their receivers outside of the request: None
+# sends them synchronously, "thread" from a pool of SIGNAL_WORKERS threads in
+# each process, and "database" from a queue in the database, processed by the
+# filebrowser_dispatch_signals command. Receivers decorated with
+# filebrowser_safe.dispatch.sync_receiver are always called in the request,
+# as are those other than module level functions connected without a
+# dispatch_uid, since they can't be found again by name.
+SIGNAL_DISPATCH = getattr(settings, "FILEBROWSER_SIGNAL_DISPATCH", None)
+SIGNAL_WORKERS = getattr(settings, "FILEBROWSER_SIGNAL_WORKERS", 2)
+# Max. number of signals waiting to be sent. Once reached, signals are sent
+# in the request again rather than queued.
+SIGNAL_QUEUE_SIZE = getattr(settings, "FILEBROWSER_SIGNAL_QUEUE_SIZE", 1000)
+# Number of times a deferred receiver raising an exception is called again,
+# after SIGNAL_RETRY_DELAY seconds, doubled for each retry.
+SIGNAL_RETRIES = getattr(settings, "FILEBROWSER_SIGNAL_RETRIES", 3)
+SIGNAL_RETRY_DELAY = getattr(settings, "FILEBROWSER_SIGNAL_RETRY_DELAY", 5)
 
 # EXTRA TRANSLATION STRINGS
 # The following strings are not availabe within views or templates
@@ -63,6 +63,12 @@
                 var data = form.serializeArray();
                 var url = form.attr('action');
 
+                // when set, files are uploaded straight to the storage
+                var direct = formData.presignUrl && {
+                    presignUrl: formData.presignUrl,
+                    finalizeUrl: formData.finalizeUrl
+                };
+
                 // hide the "clear queue" button, we don't
                 // support cancelling of uploads yet
                 $('a.deletelink').hide();
@@ -77,7 +83,7 @@
                         var promise = queueFile(url, data, {
                             field: 'Filedata',
                             value: file
-                        });
+                        }, direct);
 
                         // note that the file needs to be cleared so pressing
                         // "upload" doesn't trigger another upload
@@ -151,44 +157,87 @@
         });
     }
 
-    function queueFile(url, data, file){
+    function queueFile(url, data, file, direct){
         var xhr = new global.XMLHttpRequest();
-        var formData = new global.FormData();
         var deferred = $.Deferred();
-        var sendRequest = function(){
-            xhr.open('POST', url, true);
+        var token = null;
+        var send = function(target, fields, field){
+            var formData = new global.FormData();
+
+            // add all of the hidden fields to the request
+            $.each(fields, function(index, item){
+                formData.append(item.name, item.value);
+            });
+
+            // add the file to the request, it has to come last for the storage
+            formData.append(field, file.value);
+
+            xhr.open('POST', target, true);
             xhr.send(formData);
         };
+        var sendRequest = function(){
+            if(!direct){
+                send(url, data, file.field);
+                return;
+            }
+
+            // asks the server where to upload the file. files the server
+            // has to process itself get an empty response and are sent to it.
+            var presignData = data.concat([
+                {name: 'filename', value: file.value.name},
+                {name: 'size', value: file.value.size}
+            ]);
+            $.post(direct.presignUrl, presignData).then(function(params){
+                if(!params.url){
+                    send(url, data, file.field);
+                    return;
+                }
+                token = params.token;
+                send(params.url, $.map(params.fields, function(value, name){
+                    return {name: name, value: value};
+                }), 'file');
+            }, function(response){
+                dequeue();
+                deferred.reject(response.status);
+            });
+        };
+        var dequeue = function(){
+            var index = queue.indexOf(deferred);
+
+            if(index > -1){
+                queue.splice(index, 1);
+            }
+        };
 
         // add a reference to the xhr object just in case
         // it isn't used atm but might be useful for something
         // like aborting a request that is in progress
         deferred.xhr = xhr;
 
-        // add all of the hidden fields to the request
-        $.each(data, function(index, item){
-            formData.append(item.name, item.value);
-        });
-
-        // add the file to the request
-        formData.append(file.field, file.value);
-
         xhr.addEventListener('readystatechange', function(){
             var status = xhr.status;
-            var index = queue.indexOf(deferred);
 
             // anything different from 4 means "not-ready"
             if(xhr.readyState !== 4) return;
 
             // remove the deferred from the queue
-            if(index > -1){
-                queue.splice(index, 1);
-            }
+            dequeue();
 
             // upload was successful
             if(status > 0 && 200 <= status && status < 300){
                 deferred.notify(100);
-                deferred.resolve(xhr.responseText);
+
+                // files uploaded straight to the storage are then
+                // completed by the server
+                if(token){
+                    $.post(direct.finalizeUrl, data.concat([{name: 'token', value: token}])).then(function(response){
+                        deferred.resolve(response);
+                    }, function(response){
+                        deferred.reject(response.status);
+                    });
+                }else{
+                    deferred.resolve(xhr.responseText);
+                }
             // upload failed
             }else{
                 deferred.reject(status);
@@ -1,9 +1,21 @@
+import errno
+import mimetypes
 import os
 import posixpath
 import shutil
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
 
+from django.conf import settings
 from django.core.files.base import ContentFile
 from django.core.files.move import file_move_safe
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from filebrowser_safe import settings as fb_settings
+from filebrowser_safe.instrumentation import instrument_storage_class
 
 FILE_EXISTS_MSG = "The destination file '{}' exists and allow_overwrite is False"
 
@@ -25,14 +37,36 @@ class StorageMixin:
         """
         raise NotImplementedError()
 
-    def move(self, old_file_name, new_file_name, allow_overwrite=False):
+    def move(self, old_file_name, new_file_name, allow_overwrite=False, progress=None):
         """
-        Moves safely a file from one location to another.
+        Moves safely a file or a directory from one location to another.
 
         If allow_overwrite==False and new_file_name exists, raises an exception.
+        If given, progress is called with the number of files moved so far and
+        the total number of files.
         """
         raise NotImplementedError()
 
+    def copy(self, old_file_name, new_file_name, progress=None):
+        """
+        Copies a file or a directory and everything it contains to a new
+        location, which mustn't exist. Progress is reported as for move().
+        """
+        raise NotImplementedError()
+
+    def overwrite(self, name, content):
+        """
+        Saves content as name, replacing the file already there if any, and
+        returns name.
+
+        Storages able to replace a file at once should override this, the
+        default saves the content under an available name and moves it over.
+        """
+        saved_name = self.save(name, content)
+        if saved_name != name:
+            self.move(saved_name, name, allow_overwrite=True)
+        return name
+
     def makedirs(self, name):
         """
         Creates all missing directories specified by name. Analogue to os.mkdirs().
@@ -45,6 +79,25 @@ class StorageMixin:
         """
         raise NotImplementedError()
 
+    def scandir(self, name):
+        """
+        Lists a directory with the metadata of each entry, as a list of
+        ``(filename, is_dir, size, modified_time)`` tuples. Analogue to
+        os.scandir().
+
+        Storages able to list metadata along with the names should override
+        this, the default makes a ``size`` and ``get_modified_time`` call per
+        file, and doesn't provide them for directories.
+        """
+        dirs, files = self.listdir(name)
+        entries = [(dirname, True, None, None) for dirname in dirs]
+        for filename in files:
+            path = posixpath.join(name, filename)
+            entries.append(
+                (filename, False, self.size(path), self.get_modified_time(path))
+            )
+        return entries
+
 
 class FileSystemStorageMixin(StorageMixin):
     def isdir(self, name):
@@ -53,10 +106,99 @@ class FileSystemStorageMixin(StorageMixin):
     def isfile(self, name):
         return os.path.isfile(self.path(name))
 
-    def move(self, old_file_name, new_file_name, allow_overwrite=False):
-        file_move_safe(
-            self.path(old_file_name), self.path(new_file_name), allow_overwrite=True
-        )
+    def move(self, old_file_name, new_file_name, allow_overwrite=False, progress=None):
+        old_path = self.path(old_file_name)
+        new_path = self.path(new_file_name)
+        if not os.path.isdir(old_path):
+            file_move_safe(old_path, new_path, allow_overwrite=True)
+        elif os.path.exists(new_path):
+            raise OSError(errno.EEXIST, FILE_EXISTS_MSG.format(new_file_name))
+        else:
+            try:
+                # Atomic within a filesystem.
+                os.rename(old_path, new_path)
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+                self._copy_tree(old_path, new_path, progress)
+                shutil.rmtree(old_path)
+                return
+        if progress:
+            progress(1, 1)
+
+    def copy(self, old_file_name, new_file_name, progress=None):
+        old_path = self.path(old_file_name)
+        new_path = self.path(new_file_name)
+        if os.path.exists(new_path):
+            raise OSError(errno.EEXIST, FILE_EXISTS_MSG.format(new_file_name))
+        if os.path.isdir(old_path):
+            self._copy_tree(old_path, new_path, progress)
+        else:
+            os.makedirs(os.path.dirname(new_path), exist_ok=True)
+            temp_path = _temp_path(new_path)
+            shutil.copy2(old_path, temp_path)
+            os.replace(temp_path, new_path)
+            if progress:
+                progress(1, 1)
+
+    def overwrite(self, name, content):
+        """
+        Writes content to a temporary file renamed over name once complete,
+        so that name is replaced at once. Other hard links to the replaced
+        file, e.g. deduplicated uploads, keep its content.
+
+        Like ``FileSystemStorage._save``, uploads already written to a
+        temporary file are moved rather than copied, and the permission modes
+        are applied.
+        """
+        path = self.path(name)
+        directory = os.path.dirname(path)
+        if self.directory_permissions_mode is not None:
+            old_umask = os.umask(0o777 & ~self.directory_permissions_mode)
+            try:
+                os.makedirs(directory, self.directory_permissions_mode, exist_ok=True)
+            finally:
+                os.umask(old_umask)
+        else:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = _temp_path(path)
+        try:
+            if hasattr(content, "temporary_file_path"):
+                file_move_safe(content.temporary_file_path(), temp_path)
+            else:
+                with open(temp_path, "wb") as f:
+                    for chunk in content.chunks():
+                        f.write(chunk.encode() if isinstance(chunk, str) else chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(temp_path, self.file_permissions_mode)
+            os.replace(temp_path, path)
+        except Exception:
+            with suppress(FileNotFoundError):
+                os.unlink(temp_path)
+            raise
+        return name
+
+    def _copy_tree(self, old_path, new_path, progress=None):
+        """
+        Copies a directory under a temporary name, renamed once complete so
+        that the copy appears at once.
+        """
+        total = sum(len(files) for _, _, files in os.walk(old_path))
+        copied = [0]
+
+        def copy_function(src, dst):
+            shutil.copy2(src, dst)
+            copied[0] += 1
+            if progress:
+                progress(copied[0], total)
+
+        temp_path = _temp_path(new_path)
+        try:
+            shutil.copytree(old_path, temp_path, copy_function=copy_function)
+            os.rename(temp_path, new_path)
+        except OSError:
+            shutil.rmtree(temp_path, ignore_errors=True)
+            raise
 
     def makedirs(self, name):
         os.makedirs(self.path(name))
@@ -64,6 +206,34 @@ class FileSystemStorageMixin(StorageMixin):
     def rmtree(self, name):
         shutil.rmtree(self.path(name))
 
+    def link(self, source, name):
+        """
+        Replaces name with a hard link to source, sharing its content.
+        """
+        path = self.path(name)
+        temp_path = _temp_path(path)
+        os.link(self.path(source), temp_path)
+        try:
+            os.replace(temp_path, path)
+        except OSError:
+            os.unlink(temp_path)
+            raise
+
+    def scandir(self, name):
+        entries = []
+        with os.scandir(self.path(name)) as it:
+            for entry in it:
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    # Broken symlink
+                    continue
+                modified_time = self._datetime_from_timestamp(stat.st_mtime)
+                entries.append(
+                    (entry.name, entry.is_dir(), stat.st_size, modified_time)
+                )
+        return entries
+
 
 class S3BotoStorageMixin(StorageMixin):
     def isfile(self, name):
@@ -80,35 +250,56 @@ class S3BotoStorageMixin(StorageMixin):
             return False
 
         name = self._normalize_name(self._clean_name(name))
-        dirlist = self.listdir(self._encode_name(name))
+        directories, files = self.listdir(self._encode_name(name))
+        return bool(directories or files)
 
-        # Check whether the iterator is empty
-        for item in dirlist:
-            return True
-        return False
+    def _file_names(self, name):
+        """
+        Returns the names of the files within the folder name, recursively.
+        """
+        directories, files = self.listdir(name)
+        names = [posixpath.join(name, filename) for filename in files]
+        for dirname in directories:
+            names += self._file_names(posixpath.join(name, dirname))
+        return names
 
-    def move(self, old_file_name, new_file_name, allow_overwrite=False):
+    def _copy_files(self, old_file_name, new_file_name, progress=None):
+        """
+        Copies the file or the files of the folder old_file_name to
+        new_file_name, and returns the names of the copied files.
+        """
+        old_file_name = self._clean_name(old_file_name).rstrip("/")
+        new_file_name = self._clean_name(new_file_name).rstrip("/")
+        if self.isfile(old_file_name):
+            old_names = [old_file_name]
+        else:
+            old_names = self._file_names(old_file_name)
+        for copied, old_name in enumerate(old_names, 1):
+            new_name = new_file_name + old_name[len(old_file_name) :]
+            old_key_name = self._encode_name(self._normalize_name(old_name))
+            new_key_name = self._encode_name(self._normalize_name(new_name))
+            k = self.bucket.copy_key(
+                new_key_name, self.bucket.name, old_key_name, preserve_acl=True
+            )
+            if not k:
+                raise OSError("Couldn't copy '%s' to '%s'" % (old_name, new_name))
+            if progress:
+                progress(copied, len(old_names))
+        return old_names
+
+    def copy(self, old_file_name, new_file_name, progress=None):
+        if self.exists(new_file_name) or self.isdir(new_file_name):
+            raise OSError(errno.EEXIST, FILE_EXISTS_MSG.format(new_file_name))
+        self._copy_files(old_file_name, new_file_name, progress)
+
+    def move(self, old_file_name, new_file_name, allow_overwrite=False, progress=None):
         if self.exists(new_file_name):
             if allow_overwrite:
                 self.delete(new_file_name)
             else:
-                raise FILE_EXISTS_MSG.format(new_file_name)
-
-        old_key_name = self._encode_name(
-            self._normalize_name(self._clean_name(old_file_name))
-        )
-        new_key_name = self._encode_name(
-            self._normalize_name(self._clean_name(new_file_name))
-        )
-
-        k = self.bucket.copy_key(
-            new_key_name, self.bucket.name, old_key_name, preserve_acl=True
-        )
-
-        if not k:
-            raise f"Couldn't copy '{old_file_name}' to '{new_file_name}'"
-
-        self.delete(old_file_name)
+                raise OSError(errno.EEXIST, FILE_EXISTS_MSG.format(new_file_name))
+        for name in self._copy_files(old_file_name, new_file_name, progress):
+            self.delete(name)
 
     def makedirs(self, name):
         self.save(name + "/.folder", ContentFile(""))
@@ -124,58 +315,240 @@ class S3BotoStorageMixin(StorageMixin):
             self.rmtree("/".join([name, dirname]))
 
 
-class GoogleStorageMixin(StorageMixin):
+class BucketStorageMixin(StorageMixin):
+    """
+    Common implementation for object storages, where folders are key
+    prefixes. Objects are copied server side, concurrently for folders.
+
+    Subclasses provide ``_list_keys``, ``_copy_key`` and ``_delete_keys``.
+    """
+
+    def _key_name(self, name):
+        return self._normalize_name(clean_name(name))
+
+    def _prefix(self, name):
+        prefix = self._key_name(name)
+        if prefix and not prefix.endswith("/"):
+            prefix += "/"
+        return prefix
+
+    def _copy_keys(self, old_name, new_name, progress=None):
+        """
+        Copies the object or the objects of the folder ``old_name`` to
+        ``new_name``, and returns the copied keys.
+        """
+        if self.isfile(old_name):
+            old_key = self._key_name(old_name)
+            self._copy_key(old_key, self._key_name(new_name))
+            if progress:
+                progress(1, 1)
+            return [old_key]
+
+        old_prefix = self._prefix(old_name)
+        new_prefix = self._prefix(new_name)
+        old_keys = list(self._list_keys(old_prefix))
+        lock = threading.Lock()
+        copied = [0]
+
+        def copy_key(key):
+            self._copy_key(key, new_prefix + key[len(old_prefix) :])
+            if progress:
+                with lock:
+                    copied[0] += 1
+                    progress(copied[0], len(old_keys))
+
+        _concurrently(copy_key, old_keys)
+        return old_keys
+
     def isfile(self, name):
+        if not name or name.endswith("/"):
+            return False
         return self.exists(name)
 
-    def isdir(self, name):
-        # That's some inefficient implementation...
-        # If there are some files having 'name' as their prefix, then
-        # the name is considered to be a directory
-        if not name:  # Empty name is a directory
-            return True
+    def copy(self, old_file_name, new_file_name, progress=None):
+        if self.exists(new_file_name) or self.isdir(new_file_name):
+            raise OSError(errno.EEXIST, FILE_EXISTS_MSG.format(new_file_name))
+        self._copy_keys(old_file_name, new_file_name, progress)
 
-        if self.isfile(name):
-            return False
+    def move(self, old_file_name, new_file_name, allow_overwrite=False, progress=None):
+        if self.exists(new_file_name) and not allow_overwrite:
+            raise OSError(errno.EEXIST, FILE_EXISTS_MSG.format(new_file_name))
+        self._delete_keys(self._copy_keys(old_file_name, new_file_name, progress))
 
-        name = self._normalize_name(self._clean_name(name))
-        dirlist = self.listdir(self._encode_name(name))
+    def overwrite(self, name, content):
+        # A single upload to the final key, which replaces the object at once.
+        self._save(name, content)
+        return name
 
-        # Check whether the iterator is empty
-        for item in dirlist:
-            return True
-        return False
+    def makedirs(self, name):
+        self.save(name + "/.folder", ContentFile(b""))
 
-    def move(self, old_file_name, new_file_name, allow_overwrite=False):
+    def rmtree(self, name):
+        self._delete_keys(self._list_keys(self._prefix(name)))
 
-        if self.exists(new_file_name):
-            if allow_overwrite:
-                self.delete(new_file_name)
-            else:
-                raise FILE_EXISTS_MSG.format(new_file_name)
 
-        old_key_name = self._encode_name(
-            self._normalize_name(self._clean_name(old_file_name))
+class S3Boto3StorageMixin(BucketStorageMixin):
+    """
+    For django-storages' boto3 based ``S3Storage`` (``S3Boto3Storage``).
+
+    Listings are made with paginated ``list_objects_v2`` requests using a
+    delimiter, so only the keys of the folder itself are fetched.
+    """
+
+    # S3 accepts up to 1000 keys per DeleteObjects request.
+    delete_batch_size = 1000
+
+    def _list_pages(self, prefix, delimiter="/", **kwargs):
+        paginator = self.connection.meta.client.get_paginator("list_objects_v2")
+        if delimiter:
+            kwargs["Delimiter"] = delimiter
+        return paginator.paginate(Bucket=self.bucket_name, Prefix=prefix, **kwargs)
+
+    def _list_keys(self, prefix):
+        for page in self._list_pages(prefix, delimiter=None):
+            for obj in page.get("Contents", ()):
+                yield obj["Key"]
+
+    def _copy_key(self, old_key, new_key):
+        extra_args = {}
+        if self.default_acl:
+            extra_args["ACL"] = self.default_acl
+        # The managed copy switches to a multipart copy for large objects,
+        # each part still being copied server side.
+        self.connection.meta.client.copy(
+            {"Bucket": self.bucket_name, "Key": old_key},
+            self.bucket_name,
+            new_key,
+            ExtraArgs=extra_args,
+            Config=self.transfer_config,
         )
-        new_key_name = self._encode_name(
-            self._normalize_name(self._clean_name(new_file_name))
+
+    def _delete_keys(self, keys):
+        client = self.connection.meta.client
+        keys = list(keys)
+        for i in range(0, len(keys), self.delete_batch_size):
+            batch = keys[i : i + self.delete_batch_size]
+            response = client.delete_objects(
+                Bucket=self.bucket_name,
+                Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True},
+            )
+            errors = response.get("Errors")
+            if errors:
+                raise OSError(
+                    "Couldn't delete '{}': {}".format(
+                        errors[0]["Key"], errors[0]["Message"]
+                    )
+                )
+
+    def presigned_post(self, name, max_size, expires):
+        """
+        Returns the URL and form fields with which a browser may upload a file
+        of at most ``max_size`` bytes straight to ``name`` for ``expires``
+        seconds.
+        """
+        fields = {}
+        conditions = [["content-length-range", 0, max_size]]
+        if self.default_acl:
+            fields["acl"] = self.default_acl
+            conditions.append({"acl": self.default_acl})
+        content_type = mimetypes.guess_type(name)[0]
+        if content_type:
+            fields["Content-Type"] = content_type
+            conditions.append({"Content-Type": content_type})
+        return self.connection.meta.client.generate_presigned_post(
+            self.bucket_name,
+            self._key_name(name),
+            Fields=fields,
+            Conditions=conditions,
+            ExpiresIn=expires,
         )
 
-        k = self.bucket.copy_key(new_key_name, self.bucket.name, old_key_name)
+    def isdir(self, name):
+        if not name:  # Empty name is a directory
+            return True
+        # A single request for at most one key or common prefix below name.
+        for page in self._list_pages(self._prefix(name), MaxKeys=1):
+            return bool(page.get("Contents") or page.get("CommonPrefixes"))
+        return False
+
+    def scandir(self, name):
+        prefix = self._prefix(name)
+        entries = []
+        for page in self._list_pages(prefix):
+            for common_prefix in page.get("CommonPrefixes", ()):
+                dirname = common_prefix["Prefix"][len(prefix) :].rstrip("/")
+                entries.append((dirname, True, None, None))
+            for obj in page.get("Contents", ()):
+                filename = obj["Key"][len(prefix) :]
+                if not filename:
+                    # Placeholder object of the folder itself
+                    continue
+                modified_time = obj["LastModified"]
+                if not settings.USE_TZ:
+                    modified_time = timezone.make_naive(modified_time)
+                entries.append((filename, False, obj["Size"], modified_time))
+        return entries
+
+
+# django-storages 1.14 renamed S3Boto3Storage to S3Storage.
+S3StorageMixin = S3Boto3StorageMixin
+
+
+class GoogleStorageMixin(BucketStorageMixin):
+    """
+    For django-storages' ``GoogleCloudStorage``.
 
-        if not k:
-            raise f"Couldn't copy '{old_file_name}' to '{new_file_name}'"
+    Folders are listed with delimiter requests, blobs are copied with
+    rewrites and deleted in batch requests.
+    """
 
-        self.delete(old_file_name)
+    # GCS accepts up to 100 calls per batch request.
+    delete_batch_size = 100
 
-    def makedirs(self, name):
-        self.save(name + "/.folder", ContentFile(""))
+    def _list_keys(self, prefix):
+        for blob in self.bucket.list_blobs(prefix=prefix):
+            yield blob.name
 
-    def rmtree(self, name):
-        name = self._normalize_name(self._clean_name(name))
-        dirlist = self.listdir(self._encode_name(name))
-        for item in dirlist:
-            item.delete()
+    def _copy_key(self, old_key, new_key):
+        source = self.bucket.blob(old_key)
+        destination = self.bucket.blob(new_key)
+        # Large objects may take several rewrite calls.
+        token, _, _ = destination.rewrite(source)
+        while token is not None:
+            token, _, _ = destination.rewrite(source, token=token)
+
+    def _delete_keys(self, keys):
+        keys = list(keys)
+        for i in range(0, len(keys), self.delete_batch_size):
+            with self.client.batch():
+                for key in keys[i : i + self.delete_batch_size]:
+                    self.bucket.blob(key).delete()
+
+    def isdir(self, name):
+        if not name:  # Empty name is a directory
+            return True
+        iterator = self.bucket.list_blobs(
+            prefix=self._prefix(name), delimiter="/", max_results=1
+        )
+        return bool(list(iterator) or iterator.prefixes)
+
+    def scandir(self, name):
+        prefix = self._prefix(name)
+        iterator = self.bucket.list_blobs(prefix=prefix, delimiter="/")
+        entries = []
+        for blob in iterator:
+            filename = blob.name[len(prefix) :]
+            if not filename:
+                # Placeholder object of the folder itself
+                continue
+            modified_time = blob.updated
+            if not settings.USE_TZ:
+                modified_time = timezone.make_naive(modified_time)
+            entries.append((filename, False, blob.size, modified_time))
+        # Prefixes are only known once all the pages have been read.
+        for dirname in iterator.prefixes:
+            entries.append((dirname[len(prefix) :].rstrip("/"), True, None, None))
+        return entries
 
     def _clean_name(self, name):
         """
@@ -184,6 +557,9 @@ class GoogleStorageMixin(StorageMixin):
         return clean_name(name)
 
 
+GoogleCloudStorageMixin = GoogleStorageMixin
+
+
 def clean_name(name):
     """
     Cleans the name so that Windows style paths work
@@ -202,3 +578,76 @@ def clean_name(name):
         clean_name = ""
 
     return clean_name
+
+
+def _temp_path(path):
+    """
+    Returns a hidden temporary path next to path.
+    """
+    directory, filename = os.path.split(path)
+    return os.path.join(directory, ".%s.%s.tmp" % (filename, uuid.uuid4().hex))
+
+
+_worker = threading.local()
+
+
+def _concurrently(function, items, workers=None):
+    """
+    Calls function with each item, using up to ``workers`` threads, or
+    ``STORAGE_WORKERS``. Called from one of those threads, e.g. for the
+    objects of a folder copied by a bulk action, the items are handled in
+    turn so that the threads in use stay bounded.
+    """
+    if getattr(_worker, "active", False):
+        return [function(item) for item in items]
+
+    def call(item):
+        _worker.active = True
+        try:
+            return function(item)
+        finally:
+            _worker.active = False
+
+    workers = workers or fb_settings.STORAGE_WORKERS
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(call, items))
+
+
+_setup_lock = threading.Lock()
+_setup_done = False
+
+
+def setup_default_storage():
+    """
+    Adds the mixin matching the ``DEFAULT_FILE_STORAGE`` class to it, which
+    provides the methods FileBrowser relies on, and installs the storage
+    instrumentation if enabled.
+
+    Only does the work on its first call, so that importing filebrowser_safe
+    doesn't import the storage backend.
+    """
+    global _setup_done
+    if _setup_done:
+        return
+    with _setup_lock:
+        if _setup_done:
+            return
+        storage_path = settings.DEFAULT_FILE_STORAGE
+        mixin_class_name = "filebrowser_safe.storage.%sMixin" % (
+            storage_path.split(".")[-1]
+        )
+        # Workaround for django-s3-folder-storage
+        if storage_path == "s3_folder_storage.s3.DefaultStorage":
+            mixin_class_name = "filebrowser_safe.storage.S3BotoStorageMixin"
+        try:
+            mixin_class = import_string(mixin_class_name)
+            storage_class = import_string(storage_path)
+        except ImportError:
+            pass
+        else:
+            if mixin_class not in storage_class.__bases__:
+                storage_class.__bases__ += (mixin_class,)
+        # Count and time storage calls made while serving FileBrowser views
+        if fb_settings.STORAGE_INSTRUMENTATION or fb_settings.METRICS:
+            instrument_storage_class(import_string(storage_path))
+        _setup_done = True
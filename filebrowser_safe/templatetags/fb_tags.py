@@ -4,7 +4,7 @@ from django import template
 
 from urllib.parse import quote
 
-from filebrowser_safe.settings import EXTENSIONS, SELECT_FORMATS
+from filebrowser_safe.settings import EXTENSIONS, EXTRACT_ZIP_UPLOADS, SELECT_FORMATS
 
 register = template.Library()
 
@@ -180,6 +180,10 @@ def allowed_extensions_list(separator=","):
         if key != "Folder":
             output += EXTENSIONS[key]
 
+    # Zip archives are accepted to be extracted
+    if EXTRACT_ZIP_UPLOADS and ".zip" not in output:
+        output.append(".zip")
+
     return separator.join(output)
 
 
@@ -0,0 +1,59 @@
+import logging
+import threading
+from collections import Counter
+from time import perf_counter
+
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+
+from filebrowser_safe import metrics
+from filebrowser_safe import settings as fb_settings
+from filebrowser_safe.archive import is_zip_upload
+from filebrowser_safe.functions import get_file_type
+
+logger = logging.getLogger("filebrowser_safe")
+
+_rejected = Counter()
+_rejected_lock = threading.Lock()
+
+
+def rejected_uploads():
+    """
+    Returns the number of uploads rejected by ``LimitUploadHandler`` since
+    the process started, by reason ("extension" or "size").
+    """
+    with _rejected_lock:
+        return dict(_rejected)
+
+
+class LimitUploadHandler(FileUploadHandler):
+    """
+    Rejects an uploaded file as soon as its name has an extension missing
+    from ``EXTENSIONS``, or its received bytes pass ``MAX_UPLOAD_SIZE``, and
+    stops reading the request instead of spooling the rest of it.
+
+    The reason is set as ``request.upload_rejected``.
+    """
+
+    def new_file(self, field_name, file_name, *args, **kwargs):
+        super().new_file(field_name, file_name, *args, **kwargs)
+        self.start = perf_counter()
+        if not (get_file_type(file_name) or is_zip_upload(file_name)):
+            self.reject("extension")
+        if self.content_length and self.content_length > fb_settings.MAX_UPLOAD_SIZE:
+            self.reject("size")
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > fb_settings.MAX_UPLOAD_SIZE:
+            self.reject("size")
+        return raw_data
+
+    def file_complete(self, file_size):
+        metrics.record_upload(file_size, perf_counter() - self.start)
+        return None
+
+    def reject(self, reason):
+        self.request.upload_rejected = reason
+        with _rejected_lock:
+            _rejected[reason] += 1
+        logger.info("Rejected upload of %s: %s", self.file_name, reason)
+        raise StopUpload(connection_reset=True)
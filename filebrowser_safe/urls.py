@@ -8,6 +8,14 @@ urlpatterns = [
     re_path(r"^upload/", views.upload, name="fb_upload"),
     re_path(r"^rename/$", views.rename, name="fb_rename"),
     re_path(r"^delete/$", views.delete, name="fb_delete"),
+    re_path(r"^bulk_delete/$", views.bulk_delete, name="fb_bulk_delete"),
+    re_path(r"^bulk_move/$", views.bulk_move, name="fb_bulk_move"),
+    re_path(r"^bulk_copy/$", views.bulk_copy, name="fb_bulk_copy"),
+    re_path(r"^download_zip/$", views.download_zip, name="fb_download_zip"),
+    re_path(r"^serve/(?P<path>.+)$", views.serve, name="fb_serve"),
+    re_path(r"^metrics/$", views.metrics_view, name="fb_metrics"),
     re_path(r"^check_file/$", views._check_file, name="fb_check"),
     re_path(r"^upload_file/$", views._upload_file, name="fb_do_upload"),
+    re_path(r"^presign_upload/$", views._presign_upload, name="fb_presign_upload"),
+    re_path(r"^finalize_upload/$", views._finalize_upload, name="fb_finalize_upload"),
 ]
@@ -1,67 +1,78 @@
+import datetime
+import logging
+import mimetypes
 import os
+import posixpath
 import re
+import uuid
+import zipfile
 from json import dumps
+from urllib.parse import quote
 
 from django import forms
 from django.conf import settings as django_settings
 from django.contrib import messages
 from django.contrib.admin.views.decorators import staff_member_required
-from django.core.exceptions import ImproperlyConfigured
-from django.core.files.base import ContentFile
+from django.contrib.auth.views import redirect_to_login
+from django.core import signing
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured, PermissionDenied
+from django.core.files.base import ContentFile, File
 from django.core.files.storage import default_storage
 from django.core.paginator import EmptyPage, InvalidPage, Paginator
-from django.dispatch import Signal
-from django.http import HttpResponseBadRequest, HttpResponseRedirect
+from django.dispatch import Signal, receiver
+from django.http import (
+    Http404,
+    HttpResponseBadRequest,
+    HttpResponseRedirect,
+    StreamingHttpResponse,
+)
 from django.shortcuts import HttpResponse, render
 from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.utils.module_loading import import_string
 from django.utils.translation import gettext as _
+from django.utils.translation import ngettext
 from django.views.decorators.cache import never_cache
 from django.views.decorators.clickjacking import xframe_options_sameorigin
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_safe
 
 from django.utils.encoding import smart_str
 
-from django.utils.module_loading import import_string
-
+from filebrowser_safe import dedup, dispatch, metrics
 from filebrowser_safe import settings as fb_settings
-from filebrowser_safe.base import FileObject
+from filebrowser_safe.archive import is_zip_upload, zip_members, zip_stream
+from filebrowser_safe.base import FileEntry, FileObject, to_timestamp
+from filebrowser_safe.cache import (
+    cached_listing,
+    invalidate_listing,
+    invalidate_storage_memo,
+)
 from filebrowser_safe.functions import (
     convert_filename,
     get_breadcrumbs,
     get_directory,
     get_file_type,
-    get_filterdate,
+    get_filterdate_range,
     get_path,
     get_settings_var,
+    in_date_range,
+    is_excluded,
 )
+from filebrowser_safe.instrumentation import instrument_storage
+from filebrowser_safe.metrics import time_view
+from filebrowser_safe.storage import FileSystemStorageMixin, _concurrently
 from filebrowser_safe.templatetags.fb_tags import query_helper
+from filebrowser_safe.uploadhandler import LimitUploadHandler
 
 try:
     from mezzanine.utils.html import escape
 except ImportError:
     escape = lambda s: s  # noqa
 
-
-# Add some required methods to FileSystemStorage
-storage_class_name = django_settings.DEFAULT_FILE_STORAGE.split(".")[-1]
-mixin_class_name = "filebrowser_safe.storage.%sMixin" % storage_class_name
-
-# Workaround for django-s3-folder-storage
-if django_settings.DEFAULT_FILE_STORAGE == "s3_folder_storage.s3.DefaultStorage":
-    mixin_class_name = "filebrowser_safe.storage.S3BotoStorageMixin"
-
-try:
-    mixin_class = import_string(mixin_class_name)
-    storage_class = import_string(django_settings.DEFAULT_FILE_STORAGE)
-except ImportError:
-    pass
-else:
-    if mixin_class not in storage_class.__bases__:
-        storage_class.__bases__ += (mixin_class,)
-
-
-# Precompile regular expressions
-filter_re = [re.compile(exp) for exp in fb_settings.EXCLUDE]
+logger = logging.getLogger("filebrowser_safe")
 
 
 def remove_thumbnails(file_path):
@@ -80,28 +91,26 @@ def remove_thumbnails(file_path):
         pass
 
 
-@xframe_options_sameorigin
-def browse(request):
+def _get_folder_name(path):
     """
-    Browse Files/Directories.
+    Returns the storage name of the folder ``path``, which its entries'
+    names are joined to.
     """
+    return "/".join(
+        s.strip("/") for s in [get_directory(), path.replace("\\", "/")] if s.strip("/")
+    )
 
-    # QUERY / PATH CHECK
-    query = request.GET.copy()
-    path = get_path(query.get("dir", ""))
-    directory = get_path("")
 
-    if path is None:
-        msg = _("The requested Folder does not exist.")
-        messages.add_message(request, messages.ERROR, msg)
-        if directory is None:
-            # The directory returned by get_directory() does not exist, raise an error
-            # to prevent eternal redirecting.
-            raise ImproperlyConfigured(
-                _("Error finding Upload-Folder. Maybe it does not exist?")
-            )
-        redirect_url = reverse("fb_browse") + query_helper(query, "", "dir")
-        return HttpResponseRedirect(redirect_url)
+def _get_file_entry(folder_name, entry):
+    return FileEntry("/".join(filter(None, [folder_name, entry[0]])), entry)
+
+
+def _get_listing(path, query, params):
+    """
+    Lists, filters and sorts the folder ``path`` as browse() shows it for
+    ``query`` and the request's ``params``. Returns the result counters and
+    the storage entries of the files shown.
+    """
     abs_path = os.path.join(get_directory(), path)
 
     # INITIAL VARIABLES
@@ -116,41 +125,42 @@ def browse(request):
     for k, v in fb_settings.EXTENSIONS.items():
         counter[k] = 0
 
-    dir_list, file_list = default_storage.listdir(abs_path)
+    # Directories first, as returned by listdir()
+    entries = sorted(default_storage.scandir(abs_path), key=lambda e: not e[1])
+    metrics.observe(
+        "filebrowser_listing_entries", len(entries), buckets=metrics.ENTRIES_BUCKETS
+    )
+    date_range = get_filterdate_range(
+        params.get("filter_date", ""),
+        params.get("date_from", ""),
+        params.get("date_to", ""),
+    )
+    search_re = None
+    if params.get("q"):
+        search_re = re.compile(params.get("q").lower(), re.M)
+    folder_name = _get_folder_name(path)
     files = []
-    for file in dir_list + file_list:
+    for entry in entries:
+        file = entry[0]
 
         # EXCLUDE FILES MATCHING ANY OF THE EXCLUDE PATTERNS
-        filtered = not file or file.startswith(".")
-        for re_prefix in filter_re:
-            if re_prefix.search(file):
-                filtered = True
-        if filtered:
+        if not file or file.startswith(".") or is_excluded(file):
             continue
         results_var["results_total"] += 1
 
         # CREATE FILEOBJECT
-        url_path = "/".join(
-            s.strip("/")
-            for s in [get_directory(), path.replace("\\", "/"), file]
-            if s.strip("/")
-        )
-        fileobject = FileObject(url_path)
+        fileobject = _get_file_entry(folder_name, entry)
 
         # FILTER / SEARCH
         append = False
-        if (
-            fileobject.filetype == request.GET.get("filter_type", fileobject.filetype)
-            and fileobject.filetype == "Folder"
-        ):
+        filter_type = params.get("filter_type", fileobject.filetype)
+        if fileobject.filetype == filter_type and fileobject.filetype == "Folder":
             append = True
-        elif fileobject.filetype == request.GET.get(
-            "filter_type", fileobject.filetype
-        ) and get_filterdate(request.GET.get("filter_date", ""), fileobject.date):
+        elif fileobject.filetype == filter_type and in_date_range(
+            fileobject.date, date_range
+        ):
             append = True
-        if request.GET.get("q") and not re.compile(
-            request.GET.get("q").lower(), re.M
-        ).search(file.lower()):
+        if search_re and not search_re.search(file.lower()):
             append = False
 
         # APPEND FILE_LIST
@@ -173,7 +183,7 @@ def browse(request):
                 # Ignore items that have problems
                 continue
             else:
-                files.append(fileobject)
+                files.append((fileobject, entry))
                 results_var["results_current"] += 1
 
         # COUNTER/RESULTS
@@ -181,20 +191,83 @@ def browse(request):
             counter[fileobject.filetype] += 1
 
     # SORTING
-    query["o"] = request.GET.get("o", fb_settings.DEFAULT_SORTING_BY)
-    query["ot"] = request.GET.get("ot", fb_settings.DEFAULT_SORTING_ORDER)
     defaultValue = ""
     if query["o"] in ["date", "filesize"]:
         defaultValue = 0.0
-    files = sorted(files, key=lambda f: getattr(f, query["o"]) or defaultValue)
+    files = sorted(files, key=lambda f: getattr(f[0], query["o"]) or defaultValue)
     if (
-        not request.GET.get("ot")
+        not params.get("ot")
         and fb_settings.DEFAULT_SORTING_ORDER == "desc"
-        or request.GET.get("ot") == "desc"
+        or params.get("ot") == "desc"
     ):
         files.reverse()
+    return results_var, counter, [entry for fileobject, entry in files]
+
+
+def _listing_variant(query, params):
+    # The sorted listing only depends on these, so paging reuses it.
+    variant = [
+        params.get(k)
+        for k in ("filter_type", "filter_date", "date_from", "date_to", "q", "ot")
+    ]
+    variant += [query.get("type"), query["o"]]
+    if any(variant[1:4]):
+        # Date ranges move with the current date
+        variant.append(datetime.date.today())
+    return variant
+
 
-    p = Paginator(files, fb_settings.LIST_PER_PAGE)
+def browse_listing(path):
+    """
+    Returns the listing browse() shows for the folder ``path`` with the
+    default filters and sorting, from the listing cache when possible.
+    """
+    query = {
+        "o": fb_settings.DEFAULT_SORTING_BY,
+        "ot": fb_settings.DEFAULT_SORTING_ORDER,
+    }
+    return cached_listing(
+        os.path.join(get_directory(), path),
+        _listing_variant(query, {}),
+        lambda: _get_listing(path, query, {}),
+    )
+
+
+@xframe_options_sameorigin
+def browse(request):
+    """
+    Browse Files/Directories.
+    """
+
+    # QUERY / PATH CHECK
+    query = request.GET.copy()
+    path = get_path(query.get("dir", ""))
+    directory = get_path("")
+
+    if path is None:
+        msg = _("The requested Folder does not exist.")
+        messages.add_message(request, messages.ERROR, msg)
+        if directory is None:
+            # The directory returned by get_directory() does not exist, raise an error
+            # to prevent eternal redirecting.
+            raise ImproperlyConfigured(
+                _("Error finding Upload-Folder. Maybe it does not exist?")
+            )
+        redirect_url = reverse("fb_browse") + query_helper(query, "", "dir")
+        return HttpResponseRedirect(redirect_url)
+    abs_path = os.path.join(get_directory(), path)
+
+    # SORTING
+    query["o"] = request.GET.get("o", fb_settings.DEFAULT_SORTING_BY)
+    query["ot"] = request.GET.get("ot", fb_settings.DEFAULT_SORTING_ORDER)
+
+    results_var, counter, entries = cached_listing(
+        abs_path,
+        _listing_variant(query, request.GET),
+        lambda: _get_listing(path, query, request.GET),
+    )
+
+    p = Paginator(entries, fb_settings.LIST_PER_PAGE)
     try:
         page_nr = request.GET.get("p", "1")
     except:  # noqa
@@ -203,6 +276,10 @@ def browse(request):
         page = p.page(page_nr)
     except (EmptyPage, InvalidPage):
         page = p.page(p.num_pages)
+    folder_name = _get_folder_name(path)
+    page.object_list = [
+        _get_file_entry(folder_name, entry) for entry in page.object_list
+    ]
 
     return render(
         request,
@@ -222,7 +299,7 @@ def browse(request):
     )
 
 
-browse = staff_member_required(never_cache(browse))
+browse = staff_member_required(never_cache(instrument_storage(time_view(browse))))
 
 
 # mkdir signals
@@ -259,8 +336,11 @@ def mkdir(request):
                 # CREATE FOLDER
                 default_storage.makedirs(server_path)
                 # POST CREATE SIGNAL
-                filebrowser_post_createdir.send(
-                    sender=request, path=path, dirname=form.cleaned_data["dir_name"]
+                dispatch.send(
+                    filebrowser_post_createdir,
+                    sender=request,
+                    path=path,
+                    dirname=form.cleaned_data["dir_name"],
                 )
                 # MESSAGE & REDIRECT
                 msg = _("The Folder %s was successfully created.") % (
@@ -271,7 +351,9 @@ def mkdir(request):
                 # list remove filter in order to actually _see_ the new folder
                 # remove pagination
                 redirect_url = reverse("fb_browse") + query_helper(
-                    query, "ot=desc,o=date", "ot,o,filter_type,filter_date,q,p"
+                    query,
+                    "ot=desc,o=date",
+                    "ot,o,filter_type,filter_date,date_from,date_to,q,p",
                 )
                 return HttpResponseRedirect(redirect_url)
             except OSError as xxx_todo_changeme:
@@ -301,7 +383,7 @@ def mkdir(request):
     )
 
 
-mkdir = staff_member_required(never_cache(mkdir))
+mkdir = staff_member_required(never_cache(instrument_storage(time_view(mkdir))))
 
 
 @xframe_options_sameorigin
@@ -335,14 +417,17 @@ def upload(request):
             "session_key": session_key,
             "breadcrumbs": get_breadcrumbs(query, path),
             "breadcrumbs_title": _("Upload"),
+            "direct_uploads": _direct_uploads_enabled(),
         },
     )
 
 
-upload = staff_member_required(never_cache(upload))
+upload = staff_member_required(never_cache(instrument_storage(upload)))
 
 
 @csrf_exempt
+@instrument_storage
+@time_view
 def _check_file(request):
     """
     Check if file already exists on the server.
@@ -363,21 +448,36 @@ def _check_file(request):
 filebrowser_pre_upload = Signal()
 filebrowser_post_upload = Signal()
 
+DIRECT_UPLOAD_SALT = "filebrowser_safe.direct_upload"
+# Seconds a finalize token stays valid past DIRECT_UPLOAD_EXPIRY, for uploads
+# started just before their presigned request expired.
+DIRECT_UPLOAD_MARGIN = 600
+
 
 @csrf_exempt
 @staff_member_required
+@instrument_storage
+@time_view
 def _upload_file(request):
     """
     Upload file to the server.
     """
     if request.method == "POST":
+        # Stop reading files with disallowed extensions or sizes early.
+        request.upload_handlers.insert(0, LimitUploadHandler(request))
         folder = request.POST.get("folder")
+        if folder is None or getattr(request, "upload_rejected", None):
+            return HttpResponseBadRequest("")
         fb_uploadurl_re = re.compile(r"^.*(%s)" % reverse("fb_upload"))
         folder = fb_uploadurl_re.sub("", folder)
         if "." in folder:
             return HttpResponseBadRequest("")
 
-        if request.FILES:
+        if request.FILES and is_zip_upload(request.FILES["Filedata"].name):
+            # EXTRACT ARCHIVE
+            if not _extract_zip_upload(request, folder, request.FILES["Filedata"]):
+                return HttpResponseBadRequest("")
+        elif request.FILES:
             filedata = request.FILES["Filedata"]
             directory = get_directory()
 
@@ -405,16 +505,16 @@ def _upload_file(request):
                 filedata = ContentFile(escape(filedata.read()), name=filedata.name)
 
             # HANDLE UPLOAD
-            uploadedfile = default_storage.save(file_path, filedata)
-            if default_storage.exists(file_path) and file_path != uploadedfile:
-                default_storage.move(
-                    smart_str(uploadedfile),
-                    smart_str(file_path),
-                    allow_overwrite=True,
-                )
+            deduplicate = dedup.deduplicate_enabled()
+            if deduplicate:
+                filedata = dedup.HashingFile(filedata)
+            default_storage.overwrite(file_path, filedata)
+            if deduplicate:
+                dedup.deduplicate(smart_str(file_path), filedata)
 
             # POST UPLOAD SIGNAL
-            filebrowser_post_upload.send(
+            dispatch.send(
+                filebrowser_post_upload,
                 sender=request,
                 path=request.POST.get("folder"),
                 file=FileObject(smart_str(file_path)),
@@ -425,6 +525,176 @@ def _upload_file(request):
     return HttpResponse("True")
 
 
+def _extract_zip_upload(request, folder, filedata):
+    """
+    Extracts an uploaded zip archive into folder, writing its members to the
+    storage concurrently. Returns False if the archive can't be read or is
+    over the ``EXTRACT_ZIP_MAX_FILES`` or ``EXTRACT_ZIP_MAX_SIZE`` limits.
+    """
+    directory = get_directory()
+    try:
+        archive = zipfile.ZipFile(filedata)
+    except zipfile.BadZipFile:
+        return False
+
+    with archive:
+        members, rejected = zip_members(archive)
+        if len(members) > fb_settings.EXTRACT_ZIP_MAX_FILES or (
+            sum(info.file_size for info in members.values())
+            > fb_settings.EXTRACT_ZIP_MAX_SIZE
+        ):
+            msg = _("%(archive)s has too many files or is too large to extract.")
+            messages.add_message(
+                request, messages.ERROR, msg % {"archive": filedata.name}
+            )
+            return False
+        # Members are opened one at a time as they're written, so the
+        # pre_upload signals only get their name and size.
+        files = {}
+        for name, info in members.items():
+            files[name] = File(None, name=posixpath.basename(name))
+            files[name].size = info.file_size
+        deduplicate = dedup.deduplicate_enabled()
+
+        def save_member(name):
+            file_path = os.path.join(directory, folder, name)
+            remove_thumbnails(file_path)
+            with archive.open(members[name]) as f:
+                member = File(f, name=files[name].name)
+                member.size = files[name].size
+                if name.split(".")[-1].lower() in fb_settings.ESCAPED_EXTENSIONS:
+                    member = ContentFile(escape(member.read()), name=member.name)
+                if deduplicate:
+                    member = files[name] = dedup.HashingFile(member)
+                default_storage.overwrite(file_path, member)
+
+        # PRE UPLOAD SIGNALS
+        for name in members:
+            filebrowser_pre_upload.send(
+                sender=request, path=request.POST.get("folder"), file=files[name]
+            )
+        # HANDLE UPLOADS
+        extracted, failed = _run_bulk(save_member, list(members))
+        for name in extracted:
+            file_path = smart_str(os.path.join(directory, folder, name))
+            if deduplicate:
+                dedup.deduplicate(file_path, files[name])
+            # POST UPLOAD SIGNAL
+            dispatch.send(
+                filebrowser_post_upload,
+                sender=request,
+                path=request.POST.get("folder"),
+                file=FileObject(file_path),
+            )
+
+    if rejected or failed:
+        msg = _("Some files of %(archive)s weren't extracted: %(files)s") % {
+            "archive": filedata.name,
+            "files": ", ".join(rejected + failed),
+        }
+        messages.add_message(request, messages.WARNING, msg)
+    return True
+
+
+def _direct_uploads_enabled():
+    return fb_settings.DIRECT_UPLOADS and hasattr(default_storage, "presigned_post")
+
+
+@staff_member_required
+@instrument_storage
+def _presign_upload(request):
+    """
+    Returns the URL and fields with which the browser uploads a file straight
+    to the storage, or an empty object for files the server has to process,
+    which are sent to ``_upload_file`` instead.
+    """
+    if request.method != "POST" or not _direct_uploads_enabled():
+        return HttpResponseBadRequest("")
+    fb_uploadurl_re = re.compile(r"^.*(%s)" % reverse("fb_upload"))
+    folder = get_path(fb_uploadurl_re.sub("", request.POST.get("folder", "")))
+    filename = request.POST.get("filename", "")
+    try:
+        size = int(request.POST.get("size", ""))
+    except ValueError:
+        return HttpResponseBadRequest("")
+    if (
+        folder is None
+        or "/" in filename
+        or not get_file_type(filename)
+        or size > fb_settings.MAX_UPLOAD_SIZE
+    ):
+        return HttpResponseBadRequest("")
+    if (
+        is_zip_upload(filename)
+        or filename.split(".")[-1].lower() in fb_settings.ESCAPED_EXTENSIONS
+    ):
+        return HttpResponse(dumps({}), content_type="application/json")
+
+    # Names are converted beforehand, as renaming an object means copying it.
+    file_path = os.path.join(get_directory(), folder, convert_filename(filename))
+    params = default_storage.presigned_post(
+        file_path, fb_settings.MAX_UPLOAD_SIZE, fb_settings.DIRECT_UPLOAD_EXPIRY
+    )
+    params["token"] = signing.dumps(
+        {
+            "folder": folder,
+            "filename": filename,
+            "size": size,
+            "nonce": uuid.uuid4().hex,
+        },
+        salt=DIRECT_UPLOAD_SALT,
+    )
+    return HttpResponse(dumps(params), content_type="application/json")
+
+
+@staff_member_required
+@instrument_storage
+def _finalize_upload(request):
+    """
+    Completes a file uploaded straight to the storage.
+    """
+    if request.method != "POST" or not _direct_uploads_enabled():
+        return HttpResponseBadRequest("")
+    try:
+        upload = signing.loads(
+            request.POST.get("token", ""),
+            salt=DIRECT_UPLOAD_SALT,
+            max_age=fb_settings.DIRECT_UPLOAD_EXPIRY + DIRECT_UPLOAD_MARGIN,
+        )
+    except signing.BadSignature:
+        return HttpResponseBadRequest("")
+    directory = os.path.join(get_directory(), upload["folder"])
+    file_path = os.path.join(directory, convert_filename(upload["filename"]))
+    if not default_storage.isfile(file_path):
+        return HttpResponseBadRequest("")
+    size = default_storage.size(file_path)
+    if size > fb_settings.MAX_UPLOAD_SIZE:
+        default_storage.delete(file_path)
+        return HttpResponseBadRequest("")
+    # Each token completes the file it was issued for once. The generation
+    # cache is the one shared by all servers.
+    if size != upload["size"] or not caches[fb_settings.GENERATION_CACHE].add(
+        "filebrowser:direct_upload:%s" % upload["nonce"],
+        True,
+        fb_settings.DIRECT_UPLOAD_EXPIRY + DIRECT_UPLOAD_MARGIN,
+    ):
+        return HttpResponseBadRequest("")
+
+    # Try and remove both original and normalised thumb names,
+    # in case files were added programmatically outside FB.
+    remove_thumbnails(os.path.join(directory, upload["filename"]))
+    remove_thumbnails(file_path)
+
+    # POST UPLOAD SIGNAL
+    dispatch.send(
+        filebrowser_post_upload,
+        sender=request,
+        path=upload["folder"],
+        file=FileObject(smart_str(file_path)),
+    )
+    return HttpResponse("True")
+
+
 # delete signals
 filebrowser_pre_delete = Signal()
 filebrowser_post_delete = Signal()
@@ -466,7 +736,9 @@ def delete(request):
             # DELETE FILE
             default_storage.delete(os.path.join(abs_path, filename))
             # POST DELETE SIGNAL
-            filebrowser_post_delete.send(sender=request, path=path, filename=filename)
+            dispatch.send(
+                filebrowser_post_delete, sender=request, path=path, filename=filename
+            )
             # MESSAGE & REDIRECT
             msg = _("The file %s was successfully deleted.") % (filename.lower())
             messages.add_message(request, messages.SUCCESS, msg)
@@ -480,7 +752,9 @@ def delete(request):
             # DELETE FOLDER
             default_storage.rmtree(os.path.join(abs_path, filename))
             # POST DELETE SIGNAL
-            filebrowser_post_delete.send(sender=request, path=path, filename=filename)
+            dispatch.send(
+                filebrowser_post_delete, sender=request, path=path, filename=filename
+            )
             # MESSAGE & REDIRECT
             msg = _("The folder %s was successfully deleted.") % (filename.lower())
             messages.add_message(request, messages.SUCCESS, msg)
@@ -491,7 +765,7 @@ def delete(request):
     return HttpResponseRedirect(reverse("fb_browse") + qs)
 
 
-delete = staff_member_required(never_cache(delete))
+delete = staff_member_required(never_cache(instrument_storage(time_view(delete))))
 
 
 # rename signals
@@ -541,7 +815,8 @@ def rename(request):
                 remove_thumbnails(new_relative_server_path)
                 default_storage.move(relative_server_path, new_relative_server_path)
                 # POST RENAME SIGNAL
-                filebrowser_post_rename.send(
+                dispatch.send(
+                    filebrowser_post_rename,
                     sender=request,
                     path=path,
                     filename=filename,
@@ -576,4 +851,486 @@ def rename(request):
     )
 
 
-rename = staff_member_required(never_cache(rename))
+rename = staff_member_required(never_cache(instrument_storage(time_view(rename))))
+
+
+# bulk signals, sent once per bulk action along with the signals of each item
+filebrowser_post_bulk_delete = Signal()
+filebrowser_post_bulk_move = Signal()
+filebrowser_post_bulk_copy = Signal()
+# move signals
+filebrowser_pre_move = Signal()
+filebrowser_post_move = Signal()
+# copy signals
+filebrowser_pre_copy = Signal()
+filebrowser_post_copy = Signal()
+
+
+def _bulk_selection(request):
+    """
+    Returns the folder and the entries selected for a bulk action, mapped to
+    whether they're folders. Validated against a single listing of the folder.
+    """
+    path = get_path(request.GET.get("dir", ""))
+    filenames = request.POST.getlist("filename")
+    if path is None or not filenames:
+        return path, None
+    entries = {
+        entry[0]: entry[1]
+        for entry in default_storage.scandir(os.path.join(get_directory(), path))
+    }
+    selection = {}
+    for filename in filenames:
+        if filename.startswith(".") or filename not in entries:
+            return path, None
+        selection[filename] = entries[filename]
+    return path, selection
+
+
+def _run_bulk(function, filenames):
+    """
+    Calls function with each filename, concurrently on remote storages.
+    Returns the filenames it succeeded and failed for.
+    """
+    workers = None
+    if isinstance(default_storage, FileSystemStorageMixin):
+        workers = 1
+
+    def run(filename):
+        try:
+            function(filename)
+        except Exception:
+            logger.exception("Bulk action failed for %s", filename)
+            return False
+        return True
+
+    results = _concurrently(run, filenames, workers)
+    # Calls made by the worker threads aren't seen by the request memo.
+    invalidate_storage_memo()
+    done = [filename for filename, ok in zip(filenames, results) if ok]
+    failed = [filename for filename, ok in zip(filenames, results) if not ok]
+    return done, failed
+
+
+def _bulk_messages(request, msg, failed):
+    if msg:
+        messages.add_message(request, messages.SUCCESS, msg)
+    if failed:
+        msg = _("An error occurred with: %s") % ", ".join(failed)
+        messages.add_message(request, messages.ERROR, msg)
+
+
+def bulk_delete(request):
+    """
+    Delete the selected Files/Directories.
+    """
+
+    if request.method != "POST":
+        return HttpResponseRedirect(reverse("fb_browse"))
+
+    # QUERY / PATH CHECK
+    query = request.GET
+    path, selection = _bulk_selection(request)
+    redirect_url = reverse("fb_browse") + query_helper(query, "", "")
+    if selection is None:
+        if path is None:
+            msg = _("The requested Folder does not exist.")
+        else:
+            msg = _("The requested File does not exist.")
+        messages.add_message(request, messages.ERROR, msg)
+        return HttpResponseRedirect(redirect_url)
+    abs_path = os.path.join(get_directory(), path)
+
+    def delete_item(filename):
+        if selection[filename]:
+            default_storage.rmtree(os.path.join(abs_path, filename))
+        else:
+            default_storage.delete(os.path.join(abs_path, filename))
+
+    # PRE DELETE SIGNALS
+    for filename in selection:
+        filebrowser_pre_delete.send(sender=request, path=path, filename=filename)
+    # DELETE FILES/FOLDERS
+    deleted, failed = _run_bulk(delete_item, list(selection))
+    # POST DELETE SIGNALS
+    for filename in deleted:
+        dispatch.send(
+            filebrowser_post_delete, sender=request, path=path, filename=filename
+        )
+    dispatch.send(
+        filebrowser_post_bulk_delete, sender=request, path=path, filenames=deleted
+    )
+    # MESSAGE & REDIRECT
+    msg = (
+        ngettext(
+            "%(count)d item was successfully deleted.",
+            "%(count)d items were successfully deleted.",
+            len(deleted),
+        )
+        % {"count": len(deleted)}
+    )
+    _bulk_messages(request, msg if deleted else None, failed)
+    return HttpResponseRedirect(redirect_url)
+
+
+bulk_delete = staff_member_required(never_cache(instrument_storage(bulk_delete)))
+
+
+def _bulk_transfer(request, copy):
+    """
+    Moves or copies the selected Files/Directories to another Directory.
+    """
+
+    if request.method != "POST":
+        return HttpResponseRedirect(reverse("fb_browse"))
+
+    # QUERY / PATH CHECK
+    query = request.GET
+    path, selection = _bulk_selection(request)
+    destination = posixpath.normpath(
+        request.POST.get("destination", "").strip().strip("/") or "."
+    )
+    if destination == ".":
+        destination = ""
+    if destination.split("/")[0] == "..":
+        destination = None
+    else:
+        destination = get_path(destination)
+    redirect_url = reverse("fb_browse") + query_helper(query, "", "")
+    if selection is None or destination is None:
+        if path is None or destination is None:
+            msg = _("The requested Folder does not exist.")
+        else:
+            msg = _("The requested File does not exist.")
+        messages.add_message(request, messages.ERROR, msg)
+        return HttpResponseRedirect(redirect_url)
+    for filename, is_dir in selection.items():
+        folder = os.path.join(path, filename)
+        if is_dir and (destination + "/").startswith(folder + "/"):
+            if copy:
+                msg = _("A folder can't be copied into itself.")
+            else:
+                msg = _("A folder can't be moved into itself.")
+            messages.add_message(request, messages.ERROR, msg)
+            return HttpResponseRedirect(redirect_url)
+    abs_path = os.path.join(get_directory(), path)
+    abs_destination = os.path.join(get_directory(), destination)
+    existing = {entry[0] for entry in default_storage.scandir(abs_destination)}
+    failed = [filename for filename in selection if filename in existing]
+    filenames = [filename for filename in selection if filename not in existing]
+    if copy:
+        pre_signal, post_signal = filebrowser_pre_copy, filebrowser_post_copy
+        bulk_signal = filebrowser_post_bulk_copy
+    else:
+        pre_signal, post_signal = filebrowser_pre_move, filebrowser_post_move
+        bulk_signal = filebrowser_post_bulk_move
+
+    counts = {}
+
+    def transfer_item(filename):
+        old_name = os.path.join(abs_path, filename)
+        new_name = os.path.join(abs_destination, filename)
+
+        def progress(done, total):
+            counts[filename] = done, total
+            logger.info("%s -> %s: %d/%d files", old_name, new_name, done, total)
+
+        remove_thumbnails(new_name)
+        if copy:
+            default_storage.copy(old_name, new_name, progress=progress)
+        else:
+            default_storage.move(old_name, new_name, progress=progress)
+            remove_thumbnails(old_name)
+
+    # PRE MOVE/COPY SIGNALS
+    for filename in filenames:
+        pre_signal.send(
+            sender=request, path=path, filename=filename, destination=destination
+        )
+    # MOVE/COPY FILES/FOLDERS
+    done, transfer_failed = _run_bulk(transfer_item, filenames)
+    # POST MOVE/COPY SIGNALS
+    for filename in done:
+        dispatch.send(
+            post_signal,
+            sender=request,
+            path=path,
+            filename=filename,
+            destination=destination,
+        )
+    dispatch.send(
+        bulk_signal, sender=request, path=path, filenames=done, destination=destination
+    )
+    # MESSAGE & REDIRECT
+    if copy:
+        msg = ngettext(
+            "%(count)d item was successfully copied.",
+            "%(count)d items were successfully copied.",
+            len(done),
+        )
+    else:
+        msg = ngettext(
+            "%(count)d item was successfully moved.",
+            "%(count)d items were successfully moved.",
+            len(done),
+        )
+    msg = msg % {"count": len(done)}
+    # Folders the storage failed to transfer part way through.
+    for filename in transfer_failed:
+        if filename in counts:
+            transferred, total = counts[filename]
+            filename = _("%(name)s (%(done)d of %(total)d files)") % {
+                "name": filename,
+                "done": transferred,
+                "total": total,
+            }
+        failed.append(filename)
+    _bulk_messages(request, msg if done else None, failed)
+    return HttpResponseRedirect(redirect_url)
+
+
+def bulk_move(request):
+    """
+    Move the selected Files/Directories to another Directory.
+    """
+    return _bulk_transfer(request, copy=False)
+
+
+bulk_move = staff_member_required(never_cache(instrument_storage(bulk_move)))
+
+
+def bulk_copy(request):
+    """
+    Copy the selected Files/Directories to another Directory.
+    """
+    return _bulk_transfer(request, copy=True)
+
+
+bulk_copy = staff_member_required(never_cache(instrument_storage(bulk_copy)))
+
+
+def _attachment(filename):
+    """
+    Returns the Content-Disposition header of a download named filename,
+    escaped or encoded as per RFC 6266 as Django's FileResponse does.
+    """
+    try:
+        filename.encode("ascii")
+    except UnicodeEncodeError:
+        return "attachment; filename*=utf-8''%s" % quote(filename)
+    filename = filename.replace("\\", "\\\\").replace('"', '\\"')
+    return 'attachment; filename="%s"' % filename
+
+
+def download_zip(request):
+    """
+    Download a Directory as a zip archive, streamed as it's built.
+    """
+
+    # QUERY / PATH CHECK
+    query = request.GET
+    path = get_path(query.get("dir", ""))
+    filename = query.get("filename", "")
+    folder = None
+    if (
+        path is not None
+        and filename
+        and not filename.startswith(".")
+        and "/" not in filename
+    ):
+        folder = get_path(os.path.join(path, filename))
+    if folder is None:
+        msg = _("The requested Folder does not exist.")
+        messages.add_message(request, messages.ERROR, msg)
+        return HttpResponseRedirect(reverse("fb_browse"))
+
+    response = StreamingHttpResponse(
+        zip_stream(os.path.join(get_directory(), folder)),
+        content_type="application/zip",
+    )
+    response["Content-Disposition"] = _attachment(filename + ".zip")
+    return response
+
+
+download_zip = staff_member_required(never_cache(download_zip))
+
+
+def can_serve(request, name):
+    """
+    Default ``SERVE_PERMISSION``, serving files to authenticated users.
+    """
+    return request.user.is_authenticated
+
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _byte_range(request, size, etag, last_modified):
+    """
+    Returns the first and last bytes of the single range requested, None to
+    send the whole file, or False if the range can't be satisfied.
+    """
+    match = RANGE_RE.match(request.META.get("HTTP_RANGE", "").strip())
+    if_range = request.META.get("HTTP_IF_RANGE")
+    if not match or if_range and if_range not in (etag, http_date(last_modified)):
+        return None
+    first, last = match.groups()
+    if first:
+        start, end = int(first), int(last) if last else size - 1
+        if last and start > end:
+            return None
+    elif last:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        return None
+    if start >= size or end < 0:
+        return False
+    return start, min(end, size - 1)
+
+
+def _read_range(name, start, end):
+    with default_storage.open(name) as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            data = f.read(min(remaining, File.DEFAULT_CHUNK_SIZE))
+            if not data:
+                return
+            remaining -= len(data)
+            yield data
+
+
+def _serve_response(request, name, size, etag, last_modified):
+    content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    if fb_settings.SERVE_MODE == "x-accel-redirect":
+        # nginx answers range requests itself.
+        response = HttpResponse(content_type=content_type)
+        response["X-Accel-Redirect"] = quote(fb_settings.SERVE_URL + name)
+        return response
+    if fb_settings.SERVE_MODE == "x-sendfile":
+        try:
+            local_path = default_storage.path(name)
+        except NotImplementedError:
+            raise ImproperlyConfigured(
+                "FILEBROWSER_SERVE_MODE 'x-sendfile' requires a storage with "
+                "local paths."
+            )
+        response = HttpResponse(content_type=content_type)
+        response["X-Sendfile"] = local_path
+        return response
+
+    byte_range = _byte_range(request, size, etag, last_modified)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = "bytes */%d" % size
+        return response
+    start, end = byte_range or (0, size - 1)
+    response = StreamingHttpResponse(
+        _read_range(name, start, end), content_type=content_type
+    )
+    if byte_range:
+        response.status_code = 206
+        response["Content-Range"] = "bytes %d-%d/%d" % (start, end, size)
+    response["Content-Length"] = end - start + 1
+    response["Accept-Ranges"] = "bytes"
+    return response
+
+
+def serve(request, path):
+    """
+    Serve a file of the media library to the users ``SERVE_PERMISSION``
+    allows, handing the transfer to the web server when ``SERVE_MODE`` is set.
+    """
+
+    # PATH CHECK
+    directory = os.path.join(get_directory(), "")
+    if (
+        not path.startswith(directory)
+        or any(part in ("", "..") or part.startswith(".") for part in path.split("/"))
+        or not default_storage.isfile(path)
+    ):
+        raise Http404
+    if not import_string(fb_settings.SERVE_PERMISSION)(request, path):
+        if not request.user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        raise PermissionDenied
+
+    size = default_storage.size(path)
+    modified = default_storage.get_modified_time(path)
+    last_modified = int(modified.timestamp())
+    etag = '"%x-%x"' % (last_modified, size)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = _serve_response(request, path, size, etag, last_modified)
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    if request.GET.get("v") == "%d" % to_timestamp(modified):
+        # The URL changes along with the file.
+        patch_cache_control(response, private=True, max_age=fb_settings.SERVE_MAX_AGE)
+    else:
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+serve = require_safe(instrument_storage(serve))
+
+
+def metrics_view(request):
+    """
+    Metrics of this process in the Prometheus text format.
+    """
+    if not fb_settings.METRICS:
+        raise Http404
+    return HttpResponse(
+        metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+metrics_view = staff_member_required(never_cache(metrics_view))
+
+
+@receiver(
+    [
+        filebrowser_post_createdir,
+        filebrowser_post_upload,
+        filebrowser_post_delete,
+        filebrowser_post_rename,
+        filebrowser_post_move,
+        filebrowser_post_copy,
+    ]
+)
+@dispatch.sync_receiver
+def invalidate_listings(sender, path, **kwargs):
+    """
+    Discards the cached listings of a folder changed through FileBrowser,
+    along with those of any folder within it that was deleted or renamed.
+    """
+    directory = os.path.join(get_directory(), path or "")
+    invalidate_listing(directory)
+    for filename in (kwargs.get("filename"), kwargs.get("new_filename")):
+        if filename:
+            invalidate_listing(os.path.join(directory, filename))
+    if kwargs.get("destination") is not None:
+        invalidate_listing(os.path.join(get_directory(), kwargs["destination"]))
+
+
+@receiver([filebrowser_post_delete, filebrowser_post_rename, filebrowser_post_move])
+@dispatch.sync_receiver
+def update_content_hashes(
+    sender, path, filename, new_filename=None, destination=None, **kwargs
+):
+    """
+    Keeps the digests of deduplicated uploads in line with deletions, renames
+    and moves made through FileBrowser.
+    """
+    if not dedup.deduplicate_enabled():
+        return
+    name = os.path.join(get_directory(), path or "", filename)
+    if new_filename or destination is not None:
+        new_path = path if destination is None else destination
+        new_name = os.path.join(
+            get_directory(), new_path or "", new_filename or filename
+        )
+        dedup.rename(name, new_name)
+    else:
+        dedup.forget(name)
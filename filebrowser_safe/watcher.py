@@ -0,0 +1,188 @@
+import logging
+import os
+import time
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.storage import default_storage
+
+from filebrowser_safe import settings as fb_settings
+from filebrowser_safe.cache import invalidate_listing
+from filebrowser_safe.storage import FileSystemStorageMixin, setup_default_storage
+
+try:
+    import inotify_simple
+    from inotify_simple import flags
+except ImportError:
+    inotify_simple = None
+
+logger = logging.getLogger("filebrowser_safe")
+
+
+class DirectoryWatcher:
+    """
+    Keeps FileBrowser's listing caches in sync with changes made to the
+    FileBrowser directory outside of FileBrowser (deploy scripts, rsync...)
+    when using a ``FileSystemStorageMixin`` storage.
+
+    Create, delete, move and modify events are collected per directory and
+    applied once no more have arrived for ``coalesce`` seconds (or after
+    ``max_delay`` seconds of continuous changes). Every ``reconcile`` seconds,
+    and whenever the kernel reports dropped events, directory signatures
+    (modified times and entry counts) are compared with the previous scan to
+    catch anything missed.
+
+    Requires the ``inotify_simple`` package.
+    """
+
+    def __init__(self, coalesce=1.0, max_delay=10.0, reconcile=300.0):
+        if inotify_simple is None:
+            raise ImproperlyConfigured("The inotify_simple package is required.")
+        setup_default_storage()
+        if not isinstance(default_storage, FileSystemStorageMixin):
+            raise ImproperlyConfigured(
+                "Only storages using FileSystemStorageMixin can be watched."
+            )
+        self.coalesce = coalesce
+        self.max_delay = max_delay
+        self.reconcile_interval = reconcile
+        self.storage_root = default_storage.path("")
+        self.root = default_storage.path(fb_settings.DIRECTORY)
+        self.inotify = inotify_simple.INotify()
+        self.mask = (
+            flags.CREATE
+            | flags.DELETE
+            | flags.MODIFY
+            | flags.CLOSE_WRITE
+            | flags.ATTRIB
+            | flags.MOVED_FROM
+            | flags.MOVED_TO
+        )
+        self.watches = {}
+        self.pending = set()
+        self.pending_since = None
+        self.snapshot = {}
+
+    def storage_name(self, path):
+        """
+        Returns the storage name of an absolute path.
+        """
+        return os.path.relpath(path, self.storage_root).replace(os.sep, "/")
+
+    def watch(self, path):
+        """
+        Adds watches for the directory at ``path`` and everything within it.
+        """
+        for dirpath, dirnames, filenames in os.walk(path):
+            try:
+                wd = self.inotify.add_watch(dirpath, self.mask)
+            except OSError:
+                # Removed in the meantime
+                continue
+            self.watches[wd] = dirpath
+
+    def unwatch(self, path):
+        """
+        Drops the watches of the directory at ``path`` and everything within it.
+        """
+        prefix = os.path.join(path, "")
+        for wd, dirpath in list(self.watches.items()):
+            if dirpath == path or dirpath.startswith(prefix):
+                del self.watches[wd]
+                try:
+                    self.inotify.rm_watch(wd)
+                except OSError:
+                    pass
+
+    def scan(self):
+        """
+        Returns a signature for each directory below the root, changing when
+        entries are added, removed or modified.
+        """
+        snapshot = {}
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            try:
+                stats = [os.stat(dirpath)]
+                for name in filenames:
+                    stats.append(os.stat(os.path.join(dirpath, name)))
+            except OSError:
+                continue
+            latest = max(stat.st_mtime_ns for stat in stats)
+            snapshot[dirpath] = (latest, len(dirnames), len(filenames))
+        return snapshot
+
+    def reconcile(self):
+        """
+        Marks directories whose signature changed since the last scan as
+        changed, and watches any directory that was missed.
+        """
+        snapshot = self.scan()
+        for path in set(snapshot) | set(self.snapshot):
+            if snapshot.get(path) != self.snapshot.get(path):
+                self.mark(path)
+        watched = set(self.watches.values())
+        for path in snapshot:
+            if path not in watched:
+                self.watch(path)
+        self.snapshot = snapshot
+
+    def mark(self, path):
+        if not self.pending:
+            self.pending_since = time.monotonic()
+        self.pending.add(path)
+
+    def handle(self, event):
+        """
+        Marks the directories changed by an inotify event.
+        """
+        if event.mask & flags.Q_OVERFLOW:
+            logger.warning("Filesystem events were dropped, reconciling.")
+            self.reconcile()
+            return
+        if event.mask & flags.IGNORED:
+            self.watches.pop(event.wd, None)
+            return
+        dirpath = self.watches.get(event.wd)
+        if dirpath is None:
+            return
+        self.mark(dirpath)
+        if event.mask & flags.ISDIR and event.name:
+            path = os.path.join(dirpath, event.name)
+            # A folder appearing or disappearing changes its own listings too.
+            self.mark(path)
+            if event.mask & (flags.CREATE | flags.MOVED_TO):
+                self.watch(path)
+            elif event.mask & flags.MOVED_FROM:
+                self.unwatch(path)
+
+    def flush(self):
+        """
+        Invalidates the listings of every directory changed since last flush.
+        """
+        for path in self.pending:
+            invalidate_listing(self.storage_name(path))
+        if self.pending:
+            logger.debug("Invalidated %d directories.", len(self.pending))
+        self.pending = set()
+        self.pending_since = None
+
+    def run(self, iterations=None):
+        """
+        Watches for changes until interrupted, or for the given number of reads.
+        """
+        self.watch(self.root)
+        self.snapshot = self.scan()
+        last_reconcile = time.monotonic()
+        while iterations is None or iterations > 0:
+            if iterations is not None:
+                iterations -= 1
+            events = self.inotify.read(timeout=int(self.coalesce * 1000))
+            for event in events:
+                self.handle(event)
+            now = time.monotonic()
+            if now - last_reconcile >= self.reconcile_interval:
+                self.reconcile()
+                last_reconcile = now
+            if self.pending and (
+                not events or now - self.pending_since >= self.max_delay
+            ):
+                self.flush()
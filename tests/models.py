@@ -0,0 +1,7 @@
+from django.db import models
+
+from filebrowser_safe.fields import FileBrowseField
+
+
+class Document(models.Model):
+    file = FileBrowseField(max_length=255, blank=True)
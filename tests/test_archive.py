@@ -0,0 +1,195 @@
+import shutil
+import zipfile
+from io import BytesIO
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase
+from django.urls import reverse
+
+from filebrowser_safe import archive
+from filebrowser_safe import settings as fb_settings
+from filebrowser_safe.functions import get_directory
+from filebrowser_safe.views import filebrowser_post_upload
+
+User = get_user_model()
+
+
+class DownloadZipTestCase(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(
+            username="staff",
+            password="password",
+            is_staff=True,
+        )
+        self.client.force_login(user)
+        self.folder = Path(default_storage.path(get_directory() + "zipped"))
+        (self.folder / "sub").mkdir(parents=True)
+        (self.folder / ".thumbnails").mkdir()
+        self.addCleanup(shutil.rmtree, str(self.folder))
+        (self.folder / "notes.txt").write_text("notes " * 100)
+        (self.folder / "photo.jpg").write_bytes(b"\xff\xd8" * 100)
+        (self.folder / "sub" / "nested.txt").write_text("nested")
+        (self.folder / ".thumbnails" / "photo.jpg").write_bytes(b"thumb")
+
+    def download(self):
+        response = self.client.get(reverse("fb_download_zip"), {"filename": "zipped"})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(
+            'attachment; filename="zipped.zip"', response["Content-Disposition"]
+        )
+        return zipfile.ZipFile(BytesIO(b"".join(response.streaming_content)))
+
+    def test_filename_encoded(self):
+        for name, header in (
+            ('say "zip"', 'attachment; filename="say \\"zip\\".zip"'),
+            ("zippé", "attachment; filename*=utf-8''zipp%C3%A9.zip"),
+        ):
+            folder = Path(default_storage.path(get_directory() + name))
+            folder.mkdir()
+            self.addCleanup(folder.rmdir)
+            response = self.client.get(reverse("fb_download_zip"), {"filename": name})
+            self.assertEqual(header, response["Content-Disposition"])
+
+    def test_download(self):
+        with self.download() as zipped:
+            self.assertEqual(
+                ["zipped/notes.txt", "zipped/photo.jpg", "zipped/sub/nested.txt"],
+                zipped.namelist(),
+            )
+            self.assertEqual(b"nested", zipped.read("zipped/sub/nested.txt"))
+            self.assertEqual(
+                zipfile.ZIP_STORED, zipped.getinfo("zipped/photo.jpg").compress_type
+            )
+            self.assertEqual(
+                zipfile.ZIP_DEFLATED, zipped.getinfo("zipped/notes.txt").compress_type
+            )
+
+    def test_download_read_ahead(self):
+        with mock.patch.object(archive, "READ_AHEAD_CHUNKS", 1):
+            with mock.patch.object(archive, "_read_chunks") as read_chunks:
+                read_chunks.side_effect = lambda name: iter([b"a", b"b", b"c"])
+                with mock.patch.object(
+                    archive, "FileSystemStorageMixin", type("Remote", (), {})
+                ):
+                    zipped = self.download()
+        self.assertEqual(b"abc", zipped.read("zipped/notes.txt"))
+
+    def test_read_ahead_error(self):
+        def failing(name):
+            yield b"a"
+            raise OSError("Connection reset")
+
+        with mock.patch.object(archive, "_read_chunks", failing):
+            chunks = archive._read_ahead("name")
+            self.assertEqual(b"a", next(chunks))
+            with self.assertRaises(OSError):
+                next(chunks)
+
+    def test_missing_folder(self):
+        response = self.client.get(reverse("fb_download_zip"), {"filename": "missing"})
+        self.assertRedirects(
+            response, reverse("fb_browse"), fetch_redirect_response=False
+        )
+
+    def test_parent_and_hidden_folders(self):
+        for filename in ("..", ".thumbnails"):
+            response = self.client.get(
+                reverse("fb_download_zip"), {"dir": "zipped", "filename": filename}
+            )
+            self.assertRedirects(
+                response, reverse("fb_browse"), fetch_redirect_response=False
+            )
+
+
+@mock.patch.object(fb_settings, "EXTRACT_ZIP_UPLOADS", True)
+class ZipUploadTestCase(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(
+            username="staff",
+            password="password",
+            is_staff=True,
+        )
+        self.client.force_login(user)
+        self.folder = Path(default_storage.path(get_directory() + "extracted"))
+        self.folder.mkdir(parents=True)
+        self.addCleanup(shutil.rmtree, str(self.folder))
+
+    def upload(self, content):
+        return self.client.post(
+            reverse("fb_do_upload"),
+            data={
+                "folder": "extracted",
+                "Filedata": ContentFile(content, name="pack.zip"),
+            },
+        )
+
+    def test_extract(self):
+        buffer = BytesIO()
+        with zipfile.ZipFile(buffer, "w") as zipped:
+            zipped.writestr("pack/Photo One.jpg", b"photo")
+            zipped.writestr("pack/notes.txt", b"notes")
+            zipped.writestr("pack/.hidden.txt", b"hidden")
+            zipped.writestr("../evil.txt", b"evil")
+            zipped.writestr("tool.exe", b"tool")
+        receiver = mock.Mock()
+        filebrowser_post_upload.connect(receiver)
+        self.addCleanup(filebrowser_post_upload.disconnect, receiver)
+
+        response = self.upload(buffer.getvalue())
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(
+            b"photo", (self.folder / "pack" / "photo_one.jpg").read_bytes()
+        )
+        self.assertEqual(b"notes", (self.folder / "pack" / "notes.txt").read_bytes())
+        self.assertEqual(["pack"], sorted(p.name for p in self.folder.iterdir()))
+        self.assertEqual(
+            ["notes.txt", "photo_one.jpg"],
+            sorted(p.name for p in (self.folder / "pack").iterdir()),
+        )
+        self.assertEqual(2, receiver.call_count)
+        self.assertFalse(default_storage.exists(get_directory() + "evil.txt"))
+
+    def test_members_closed(self):
+        buffer = BytesIO()
+        with zipfile.ZipFile(buffer, "w") as zipped:
+            for i in range(3):
+                zipped.writestr("file%d.txt" % i, b"content")
+        opened = []
+        zip_open = zipfile.ZipFile.open
+
+        def open_member(*args, **kwargs):
+            opened.append(zip_open(*args, **kwargs))
+            return opened[-1]
+
+        with mock.patch.object(
+            zipfile.ZipFile, "open", autospec=True, side_effect=open_member
+        ):
+            self.assertEqual(200, self.upload(buffer.getvalue()).status_code)
+        self.assertEqual(3, len(opened))
+        self.assertTrue(all(member.closed for member in opened))
+
+    @mock.patch.object(fb_settings, "EXTRACT_ZIP_MAX_FILES", 10)
+    def test_too_many_files(self):
+        buffer = BytesIO()
+        with zipfile.ZipFile(buffer, "w") as zipped:
+            for i in range(11):
+                zipped.writestr("file%d.txt" % i, b"content")
+        self.assertEqual(400, self.upload(buffer.getvalue()).status_code)
+        self.assertEqual([], list(self.folder.iterdir()))
+
+    @mock.patch.object(fb_settings, "EXTRACT_ZIP_MAX_SIZE", 10)
+    def test_too_large(self):
+        buffer = BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zipped:
+            zipped.writestr("small.txt", b"x" * 6)
+            zipped.writestr("large.txt", b"x" * 6)
+        self.assertEqual(400, self.upload(buffer.getvalue()).status_code)
+        self.assertEqual([], list(self.folder.iterdir()))
+
+    def test_bad_archive(self):
+        self.assertEqual(400, self.upload(b"not a zip").status_code)
@@ -0,0 +1,56 @@
+import os
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase
+
+from filebrowser_safe.base import FileEntry, FileObject
+from filebrowser_safe.functions import get_directory
+
+
+class FileEntryTestCase(TestCase):
+    def setUp(self):
+        self.folder = os.path.join(get_directory(), "entries")
+        default_storage.save(os.path.join(self.folder, "Photo.JPG"), ContentFile(b"x"))
+        default_storage.makedirs(os.path.join(self.folder, "empty"))
+        self.addCleanup(default_storage.rmtree, self.folder)
+        self.entries = {
+            entry[0]: FileEntry(os.path.join(self.folder, entry[0]), entry)
+            for entry in default_storage.scandir(self.folder)
+        }
+
+    def test_attributes(self):
+        entry = self.entries["Photo.JPG"]
+        self.assertFalse(hasattr(entry, "__dict__"))
+        fileobject = FileObject(os.path.join(self.folder, "Photo.JPG"))
+        for attribute in (
+            "name",
+            "head",
+            "filename",
+            "filename_lower",
+            "filename_root",
+            "extension",
+            "mimetype",
+            "filetype",
+            "filesize",
+            "date",
+            "datetime",
+            "exists",
+            "is_folder",
+            "url",
+            "path_relative_directory",
+            "directory",
+            "folder",
+        ):
+            self.assertEqual(
+                getattr(fileobject, attribute), getattr(entry, attribute), attribute
+            )
+        self.assertEqual(str(fileobject), str(entry))
+        self.assertEqual("<FileEntry: %s>" % entry.path, repr(entry))
+
+    def test_folder(self):
+        entry = self.entries["empty"]
+        self.assertEqual("Folder", entry.filetype)
+        self.assertTrue(entry.is_folder)
+        self.assertTrue(entry.is_empty)
+        self.assertEqual("entries/empty", entry.path_relative_directory)
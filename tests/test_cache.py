@@ -0,0 +1,292 @@
+import json
+import os
+import time
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from filebrowser_safe import settings as fb_settings
+from filebrowser_safe.cache import (
+    cached_listing,
+    invalidate_listing,
+    listing_cache_stats,
+    site_listings,
+    storage_memo,
+)
+from filebrowser_safe.functions import get_directory, override_current_site_id
+from filebrowser_safe.management.commands.filebrowser_warm_cache import RateLimiter
+from filebrowser_safe.views import browse_listing
+
+User = get_user_model()
+
+
+def limit_calls(function, limit):
+    calls = []
+
+    def wrapper(*args, **kwargs):
+        calls.append(args)
+        if len(calls) > limit:
+            raise AssertionError("Called more than %d times" % limit)
+        return function(*args, **kwargs)
+
+    return wrapper
+
+
+class StorageMemoTestCase(TestCase):
+    def setUp(self):
+        self.name = get_directory() + "memo-test.txt"
+        self.addCleanup(default_storage.delete, self.name)
+
+    def test_read_calls_remembered(self):
+        with mock.patch.object(
+            FileSystemStorage, "exists", autospec=True, return_value=True
+        ) as exists:
+            with storage_memo():
+                self.assertTrue(default_storage.exists(self.name))
+                self.assertTrue(default_storage.exists(self.name))
+            self.assertEqual(1, exists.call_count)
+            # Nothing is remembered outside the block.
+            default_storage.exists(self.name)
+            self.assertEqual(2, exists.call_count)
+
+    def test_writes_invalidate(self):
+        with storage_memo():
+            self.assertFalse(default_storage.exists(self.name))
+            default_storage.save(self.name, ContentFile(b"memo"))
+            self.assertTrue(default_storage.exists(self.name))
+            self.assertEqual(4, default_storage.size(self.name))
+
+    def test_save_not_remembered(self):
+        exists = FileSystemStorage.exists
+        taken = []
+
+        def exists_racing(storage, name):
+            # Another process takes the name once save() has checked it.
+            if name == self.name and not taken:
+                taken.append(name)
+                with open(storage.path(name), "wb"):
+                    pass
+                return False
+            return exists(storage, name)
+
+        with storage_memo():
+            self.assertFalse(default_storage.exists(self.name))
+            with mock.patch.object(
+                FileSystemStorage, "exists", autospec=True, side_effect=exists_racing
+            ), mock.patch.object(
+                FileSystemStorage,
+                "get_available_name",
+                autospec=True,
+                side_effect=limit_calls(FileSystemStorage.get_available_name, 5),
+            ):
+                name = default_storage.save(self.name, ContentFile(b"memo"))
+        self.addCleanup(default_storage.delete, name)
+        self.assertNotEqual(self.name, name)
+        self.assertEqual(b"memo", default_storage.open(name).read())
+
+    def test_overwrite_invalidates(self):
+        with storage_memo():
+            self.assertFalse(default_storage.exists(self.name))
+            default_storage.overwrite(self.name, ContentFile(b"memo"))
+            self.assertTrue(default_storage.exists(self.name))
+
+    def test_link_invalidates(self):
+        source = get_directory() + "memo-source.txt"
+        default_storage.save(source, ContentFile(b"memo"))
+        self.addCleanup(default_storage.delete, source)
+        with storage_memo():
+            self.assertFalse(default_storage.exists(self.name))
+            default_storage.link(source, self.name)
+            self.assertTrue(default_storage.exists(self.name))
+
+    def test_listdir_copies(self):
+        with storage_memo():
+            dirs, files = default_storage.listdir(get_directory())
+            files.append("not-there.txt")
+            self.assertNotIn(
+                "not-there.txt", default_storage.listdir(get_directory())[1]
+            )
+
+
+@mock.patch.object(fb_settings, "LISTING_CACHE_TIMEOUT", 60)
+class ListingCacheTestCase(TestCase):
+    def setUp(self):
+        caches["default"].clear()
+        user = User.objects.create_user(
+            username="staff",
+            password="password",
+            is_staff=True,
+        )
+        self.client.force_login(user)
+
+    def test_cached_listing(self):
+        build = mock.Mock(return_value=["a"])
+        self.assertEqual(["a"], cached_listing("uploads/a", ["date"], build))
+        self.assertEqual(["a"], cached_listing("uploads/a", ["date"], build))
+        self.assertEqual(1, build.call_count)
+        cached_listing("uploads/a", ["filesize"], build)
+        self.assertEqual(2, build.call_count)
+
+    def test_invalidate_parent(self):
+        build = mock.Mock(return_value=["a"])
+        cached_listing("uploads/a/b", [], build)
+        invalidate_listing("uploads/a/")
+        cached_listing("uploads/a/b", [], build)
+        self.assertEqual(2, build.call_count)
+        invalidate_listing("uploads/a/b/c")
+        cached_listing("uploads/a/b", [], build)
+        self.assertEqual(2, build.call_count)
+
+    def test_browse_pages(self):
+        url = reverse("fb_browse")
+        self.client.get(url)
+        with mock.patch.object(FileSystemStorage, "scandir") as scandir:
+            response = self.client.get(url, {"p": "2"})
+        self.assertEqual(200, response.status_code)
+        self.assertFalse(scandir.called)
+
+    def test_upload_invalidates(self):
+        self.client.get(reverse("fb_browse"))
+        test_file = ContentFile(b"Test File content", name="listing-upload.txt")
+        self.client.post(
+            reverse("fb_do_upload"), data={"folder": "", "Filedata": test_file}
+        )
+        self.addCleanup(default_storage.delete, get_directory() + "listing-upload.txt")
+        self.assertContains(self.client.get(reverse("fb_browse")), test_file.name)
+
+
+@mock.patch.object(fb_settings, "LISTING_CACHE_TIMEOUT", 60)
+@mock.patch.object(fb_settings, "GENERATION_CACHE", "shared")
+class CrossNodeInvalidationTestCase(TestCase):
+    def setUp(self):
+        for alias in ("node_a", "node_b", "shared"):
+            caches[alias].clear()
+
+    def listing(self, node, build):
+        with mock.patch.object(fb_settings, "CACHE", node):
+            return cached_listing("uploads/a", [], build)
+
+    def test_invalidation_seen_by_other_nodes(self):
+        build = mock.Mock(side_effect=lambda: [build.call_count])
+        self.assertEqual([1], self.listing("node_a", build))
+        self.assertEqual([2], self.listing("node_b", build))
+        self.assertEqual([1], self.listing("node_a", build))
+        # Invalidated by node A, node B must not trust its local listing.
+        with mock.patch.object(fb_settings, "CACHE", "node_a"):
+            invalidate_listing("uploads/a")
+        self.assertEqual([3], self.listing("node_b", build))
+        self.assertEqual([4], self.listing("node_a", build))
+
+    def test_evicted_generation(self):
+        build = mock.Mock(side_effect=lambda: [build.call_count])
+        self.listing("node_a", build)
+        caches["shared"].clear()
+        invalidate_listing("uploads")
+        self.assertEqual([2], self.listing("node_a", build))
+
+
+@mock.patch.object(fb_settings, "LISTING_CACHE_TIMEOUT", 60)
+@mock.patch.object(fb_settings, "LISTING_CACHE_SITE_ENTRIES", 2)
+@override_settings(MEDIA_LIBRARY_PER_SITE=True)
+class SiteListingCacheTestCase(TestCase):
+    def setUp(self):
+        caches["default"].clear()
+        site_listings.clear()
+
+    def listing(self, site_id, directory, build):
+        with override_settings(SITE_ID=site_id):
+            return cached_listing(directory, [], build)
+
+    def test_sites_partitioned(self):
+        build = mock.Mock(side_effect=lambda: [build.call_count])
+        stats = listing_cache_stats()
+        self.assertEqual([1], self.listing(2, "uploads/site-2", build))
+        for directory in ("a", "b", "c"):
+            self.listing(1, "uploads/site-1/" + directory, build)
+        # Site 1 only evicted its own least recently used listing.
+        self.assertEqual([1], self.listing(2, "uploads/site-2", build))
+        self.listing(1, "uploads/site-1/c", build)
+        self.listing(1, "uploads/site-1/a", build)
+        self.assertEqual(5, build.call_count)
+
+        new_stats = listing_cache_stats()
+        self.assertEqual({1: 2, 2: 1}, site_listings.entries())
+        self.assertEqual(2, new_stats[1]["entries"])
+        for site_id, hits, misses, evictions in ((1, 1, 4, 2), (2, 1, 1, 0)):
+            before = stats.get(site_id, dict.fromkeys(new_stats[site_id], 0))
+            self.assertEqual(hits, new_stats[site_id]["hits"] - before["hits"])
+            self.assertEqual(misses, new_stats[site_id]["misses"] - before["misses"])
+            self.assertEqual(
+                evictions, new_stats[site_id]["evictions"] - before["evictions"]
+            )
+
+    def test_expired(self):
+        build = mock.Mock(return_value=["a"])
+        self.listing(1, "uploads/site-1", build)
+        with mock.patch("time.monotonic", return_value=time.monotonic() + 61):
+            self.listing(1, "uploads/site-1", build)
+        self.assertEqual(2, build.call_count)
+
+
+@mock.patch.object(fb_settings, "LISTING_CACHE_TIMEOUT", 60)
+class WarmCacheCommandTestCase(TestCase):
+    def setUp(self):
+        caches["default"].clear()
+        self.names = [
+            os.path.join(get_directory(), "warm", "image.jpg"),
+            os.path.join(get_directory(), "warm", "sub", "doc.txt"),
+        ]
+        for name in self.names:
+            default_storage.save(name, ContentFile(b"warm"))
+        self.addCleanup(default_storage.rmtree, os.path.join(get_directory(), "warm"))
+
+    def warm(self, *args):
+        out = StringIO()
+        with mock.patch(
+            "filebrowser_safe.management.commands.filebrowser_warm_cache.thumbnail"
+        ) as thumbnail:
+            call_command("filebrowser_warm_cache", *args, stdout=out)
+        return thumbnail, out.getvalue()
+
+    def assertWarm(self, path, warm=True):
+        with mock.patch.object(FileSystemStorage, "scandir") as scandir:
+            browse_listing(path)
+        self.assertEqual(not warm, scandir.called)
+
+    def test_warm(self):
+        thumbnail, out = self.warm()
+        for path in ("", "warm", "warm/sub"):
+            self.assertWarm(path)
+        thumbnail.assert_called_once_with(self.names[0], 60, 60)
+        self.assertIn("1 thumbnails, 0 errors", out)
+
+    def test_resume(self):
+        checkpoint = os.path.join(settings.MEDIA_ROOT, "warm-checkpoint.json")
+        with open(checkpoint, "w") as f:
+            json.dump({"done": [], "pending": {"None": ["warm/sub"]}}, f)
+        self.warm("--checkpoint", checkpoint, "--no-thumbnails")
+        self.assertWarm("warm/sub")
+        self.assertWarm("warm", warm=False)
+        self.assertFalse(os.path.exists(checkpoint))
+
+    @override_settings(MEDIA_LIBRARY_PER_SITE=True, SITE_ID=1)
+    def test_sites(self):
+        self.warm("--site", "2")
+        with override_current_site_id(2):
+            self.assertWarm("")
+        self.assertWarm("", warm=False)
+
+    def test_rate_limiter(self):
+        limiter = RateLimiter(100)
+        start = time.monotonic()
+        for i in range(5):
+            limiter.wait()
+        self.assertGreaterEqual(time.monotonic() - start, 0.04)
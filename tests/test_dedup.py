@@ -0,0 +1,114 @@
+import os
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from filebrowser_safe import settings as fb_settings
+from filebrowser_safe.dedup import HashingFile
+from filebrowser_safe.functions import get_directory
+from filebrowser_safe.models import ContentHash
+
+User = get_user_model()
+
+
+class HashingFileTestCase(TestCase):
+    def test_digest(self):
+        file = HashingFile(ContentFile(b"content", name="file.txt"))
+        list(file.chunks(chunk_size=3))
+        self.assertEqual(
+            "ed7002b439e9ac845f22357d822bac1444730fbdb6016d3ec9432297b9ec9f73",
+            file.digest,
+        )
+
+    def test_partial_read(self):
+        file = HashingFile(ContentFile(b"content", name="file.txt"))
+        file.read(3)
+        self.assertIsNone(file.digest)
+
+
+@mock.patch.object(fb_settings, "DEDUPLICATE_UPLOADS", True)
+class DeduplicateUploadsTestCase(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(
+            username="staff",
+            password="password",
+            is_staff=True,
+        )
+        self.client.force_login(user)
+        self.names = ["dedup-a.txt", "dedup-b.txt", "dedup-c.txt"]
+        for name in self.names:
+            self.addCleanup(default_storage.delete, get_directory() + name)
+
+    def upload(self, name, content):
+        response = self.client.post(
+            reverse("fb_do_upload"),
+            data={"folder": "", "Filedata": ContentFile(content, name=name)},
+        )
+        self.assertEqual(200, response.status_code)
+        return os.stat(default_storage.path(os.path.join(get_directory(), name)))
+
+    def test_identical_uploads_linked(self):
+        a = self.upload("dedup-a.txt", b"same content")
+        b = self.upload("dedup-b.txt", b"same content")
+        c = self.upload("dedup-c.txt", b"other content")
+        self.assertEqual(a.st_ino, b.st_ino)
+        self.assertNotEqual(a.st_ino, c.st_ino)
+        self.assertEqual(3, ContentHash.objects.count())
+
+        out = StringIO()
+        call_command("filebrowser_dedup_report", stdout=out)
+        self.assertEqual(
+            "3 files, 2 distinct contents, 12\xa0bytes saved.\n", out.getvalue()
+        )
+
+        # Deleting one of the links leaves the content of the other.
+        self.client.post(reverse("fb_delete") + "?filename=dedup-a.txt")
+        self.assertFalse(ContentHash.objects.filter(path__endswith="a.txt").exists())
+        with default_storage.open(get_directory() + "dedup-b.txt") as f:
+            self.assertEqual(b"same content", f.read())
+
+    def test_replace_linked(self):
+        a = self.upload("dedup-a.txt", b"same content")
+        b = self.upload("dedup-b.txt", b"same content")
+        self.assertEqual(a.st_ino, b.st_ino)
+        # Replacing one of the links leaves the content of the other.
+        b = self.upload("dedup-b.txt", b"new content")
+        self.assertNotEqual(a.st_ino, b.st_ino)
+        with default_storage.open(get_directory() + "dedup-a.txt") as f:
+            self.assertEqual(b"same content", f.read())
+        with default_storage.open(get_directory() + "dedup-b.txt") as f:
+            self.assertEqual(b"new content", f.read())
+
+    def test_rename(self):
+        self.upload("dedup-a.txt", b"same content")
+        self.client.post(
+            reverse("fb_rename") + "?filename=dedup-a.txt", data={"name": "dedup-c"}
+        )
+        self.assertEqual(
+            [get_directory() + "dedup-c.txt"],
+            list(ContentHash.objects.values_list("path", flat=True)),
+        )
+
+    def test_changed_file_not_linked(self):
+        self.upload("dedup-a.txt", b"same content")
+        ContentHash.objects.update(modified="2000-01-01 00:00")
+        a = os.stat(default_storage.path(get_directory() + "dedup-a.txt"))
+        b = self.upload("dedup-b.txt", b"same content")
+        self.assertNotEqual(a.st_ino, b.st_ino)
+        self.assertEqual(1, ContentHash.objects.count())
+
+    @override_settings(MEDIA_LIBRARY_PER_SITE=True)
+    def test_sites_not_linked(self):
+        stats = []
+        for site_id in (1, 2):
+            with override_settings(SITE_ID=site_id):
+                self.addCleanup(default_storage.delete, get_directory() + "dedup-a.txt")
+                stats.append(self.upload("dedup-a.txt", b"same content"))
+        self.assertNotEqual(stats[0].st_ino, stats[1].st_ino)
+        self.assertEqual(2, ContentHash.objects.count())
@@ -0,0 +1,144 @@
+import json
+import os
+import time
+from unittest import mock, skipIf
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from filebrowser_safe import settings as fb_settings
+from filebrowser_safe import views
+from filebrowser_safe.storage import S3Boto3StorageMixin
+
+try:
+    import boto3
+    import requests
+    from storages.backends.s3boto3 import S3Boto3Storage
+except ImportError:
+    boto3 = None
+
+try:
+    from moto import mock_aws
+except ImportError:
+    try:
+        from moto import mock_s3 as mock_aws
+    except ImportError:
+        mock_aws = None
+
+User = get_user_model()
+
+
+@skipIf(boto3 is None or mock_aws is None, "boto3, moto or django-storages missing")
+# MEDIA_ROOT is a local path, unused with S3.
+@override_settings(MEDIA_ROOT="")
+@mock.patch.object(fb_settings, "DIRECT_UPLOADS", True)
+class DirectUploadTestCase(TestCase):
+    def setUp(self):
+        environ = mock.patch.dict(
+            os.environ,
+            {
+                "AWS_ACCESS_KEY_ID": "testing",
+                "AWS_SECRET_ACCESS_KEY": "testing",
+                "AWS_DEFAULT_REGION": "us-east-1",
+            },
+        )
+        environ.start()
+        self.addCleanup(environ.stop)
+        aws = mock_aws()
+        aws.start()
+        self.addCleanup(aws.stop)
+        boto3.client("s3", region_name="us-east-1").create_bucket(Bucket="media")
+        storage_class = type("S3Storage", (S3Boto3Storage, S3Boto3StorageMixin), {})
+        self.storage = storage_class(bucket_name="media", region_name="us-east-1")
+        default_storage._setup()
+        storage = mock.patch.object(default_storage, "_wrapped", self.storage)
+        storage.start()
+        self.addCleanup(storage.stop)
+
+        user = User.objects.create_user(
+            username="staff", password="password", is_staff=True
+        )
+        self.client.force_login(user)
+
+    def presign(self, filename, size=7):
+        return self.client.post(
+            reverse("fb_presign_upload"),
+            data={"folder": "", "filename": filename, "size": size},
+        )
+
+    def test_direct_upload(self):
+        response = self.presign("Direct Upload.txt")
+        self.assertEqual(200, response.status_code)
+        params = json.loads(response.content)
+        self.assertEqual("uploads/direct_upload.txt", params["fields"]["key"])
+
+        response = requests.post(
+            params["url"],
+            data=params["fields"],
+            files={"file": ("Direct Upload.txt", b"content")},
+        )
+        self.assertLess(response.status_code, 300)
+
+        receiver = mock.Mock()
+        views.filebrowser_post_upload.connect(receiver)
+        self.addCleanup(views.filebrowser_post_upload.disconnect, receiver)
+        response = self.client.post(
+            reverse("fb_finalize_upload"), data={"token": params["token"]}
+        )
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(
+            "uploads/direct_upload.txt", receiver.call_args[1]["file"].name
+        )
+        with default_storage.open("uploads/direct_upload.txt") as f:
+            self.assertEqual(b"content", f.read())
+
+        # The token only completes the upload once.
+        response = self.client.post(
+            reverse("fb_finalize_upload"), data={"token": params["token"]}
+        )
+        self.assertEqual(400, response.status_code)
+        self.assertEqual(1, receiver.call_count)
+
+    def test_finalize_other_size(self):
+        params = json.loads(self.presign("resized.txt").content)
+        self.storage.save("uploads/resized.txt", ContentFile(b"other content"))
+        response = self.client.post(
+            reverse("fb_finalize_upload"), data={"token": params["token"]}
+        )
+        self.assertEqual(400, response.status_code)
+
+    def test_too_large(self):
+        size = fb_settings.MAX_UPLOAD_SIZE + 1
+        self.assertEqual(400, self.presign("file.txt", size=size).status_code)
+
+    def test_server_processed(self):
+        response = self.presign("page.html")
+        self.assertEqual({}, json.loads(response.content))
+
+    def test_finalize_missing_file(self):
+        params = json.loads(self.presign("missing.txt").content)
+        response = self.client.post(
+            reverse("fb_finalize_upload"), data={"token": params["token"]}
+        )
+        self.assertEqual(400, response.status_code)
+        response = self.client.post(
+            reverse("fb_finalize_upload"), data={"token": "forged"}
+        )
+        self.assertEqual(400, response.status_code)
+
+    def test_disabled(self):
+        with mock.patch.object(fb_settings, "DIRECT_UPLOADS", False):
+            self.assertEqual(400, self.presign("file.txt").status_code)
+
+    def test_finalize_expired(self):
+        params = json.loads(self.presign("expired.txt").content)
+        self.storage.save("uploads/expired.txt", ContentFile(b"content"))
+        max_age = fb_settings.DIRECT_UPLOAD_EXPIRY + views.DIRECT_UPLOAD_MARGIN
+        with mock.patch("time.time", return_value=time.time() + max_age + 1):
+            response = self.client.post(
+                reverse("fb_finalize_upload"), data={"token": params["token"]}
+            )
+        self.assertEqual(400, response.status_code)
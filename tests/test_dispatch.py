@@ -0,0 +1,190 @@
+import json
+import threading
+from functools import partial
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from filebrowser_safe import dispatch
+from filebrowser_safe import settings as fb_settings
+from filebrowser_safe.base import FileObject
+from filebrowser_safe.functions import get_directory
+from filebrowser_safe.models import SignalEvent
+from filebrowser_safe.views import filebrowser_post_delete, filebrowser_post_upload
+
+User = get_user_model()
+
+calls = []
+
+
+def deferred_receiver(**kwargs):
+    calls.append(("deferred", threading.current_thread().name, kwargs))
+
+
+@dispatch.sync_receiver
+def sync_receiver(**kwargs):
+    calls.append(("sync", threading.current_thread().name, kwargs))
+
+
+failures = {"count": 0}
+
+
+def failing_receiver(**kwargs):
+    calls.append(("failing", threading.current_thread().name, kwargs))
+    if failures["count"]:
+        failures["count"] -= 1
+        raise ValueError("Failed")
+
+
+class Receiver:
+    def __init__(self, name):
+        self.name = name
+
+    def __call__(self, **kwargs):
+        calls.append((self.name, threading.current_thread().name, kwargs))
+
+    def method(self, **kwargs):
+        self(**kwargs)
+
+
+class DispatchTestCase(TestCase):
+    def setUp(self):
+        calls.clear()
+        for receiver in (deferred_receiver, sync_receiver):
+            filebrowser_post_delete.connect(receiver)
+            self.addCleanup(filebrowser_post_delete.disconnect, receiver)
+        self.user = User.objects.create_user(
+            username="staff", password="password", is_staff=True
+        )
+        self.client.force_login(self.user)
+        self.name = get_directory() + "dispatch.txt"
+        default_storage.save(self.name, ContentFile(b"x"))
+        self.addCleanup(default_storage.delete, self.name)
+
+    def delete(self):
+        self.client.post(reverse("fb_delete") + "?filename=dispatch.txt")
+
+    def test_synchronous(self):
+        self.delete()
+        self.assertEqual(["deferred", "sync"], sorted(call[0] for call in calls))
+        self.assertTrue(all(call[2]["sender"] is not None for call in calls))
+
+    @mock.patch.object(fb_settings, "SIGNAL_DISPATCH", "database")
+    def test_database(self):
+        self.delete()
+        self.assertEqual(["sync"], [call[0] for call in calls])
+        self.assertEqual(1, SignalEvent.objects.count())
+        call_command("filebrowser_dispatch_signals", "--once", stdout=StringIO())
+        self.assertEqual(["sync", "deferred"], [call[0] for call in calls])
+        kwargs = calls[1][2]
+        self.assertIsNone(kwargs["sender"])
+        self.assertTrue(kwargs["deferred"])
+        self.assertEqual(self.user.pk, kwargs["user_id"])
+        self.assertEqual("dispatch.txt", kwargs["filename"])
+        self.assertEqual(0, SignalEvent.objects.count())
+
+    @mock.patch.object(fb_settings, "SIGNAL_DISPATCH", "database")
+    @mock.patch.object(fb_settings, "LISTING_CACHE_TIMEOUT", 60)
+    def test_internal_receivers_not_deferred(self):
+        caches["default"].clear()
+        listed = 'value="dispatch.txt"'
+        self.assertContains(self.client.get(reverse("fb_browse")), listed)
+        self.delete()
+        # The cached listing is discarded within the request.
+        self.assertNotContains(self.client.get(reverse("fb_browse")), listed)
+        self.assertEqual(1, SignalEvent.objects.count())
+
+    @mock.patch.object(fb_settings, "SIGNAL_DISPATCH", "database")
+    def test_dispatch_uid(self):
+        first, second = Receiver("first"), Receiver("second")
+        for receiver in (first, second):
+            filebrowser_post_delete.connect(receiver.method, dispatch_uid=receiver.name)
+            self.addCleanup(
+                filebrowser_post_delete.disconnect, dispatch_uid=receiver.name
+            )
+        self.delete()
+        self.assertEqual(
+            ["tests.test_dispatch.deferred_receiver", "first", "second"],
+            json.loads(SignalEvent.objects.get().payload)["receivers"],
+        )
+        calls.clear()
+        call_command("filebrowser_dispatch_signals", "--once", stdout=StringIO())
+        self.assertEqual(
+            ["deferred", "first", "second"], sorted(call[0] for call in calls)
+        )
+
+    @mock.patch.object(fb_settings, "SIGNAL_DISPATCH", "database")
+    def test_unnamed_receivers(self):
+        receivers = (Receiver("instance"), partial(deferred_receiver, partial=True))
+        for receiver in receivers:
+            filebrowser_post_delete.connect(receiver, weak=False)
+            self.addCleanup(filebrowser_post_delete.disconnect, receiver)
+        with self.assertLogs("filebrowser_safe", "WARNING") as logs:
+            self.delete()
+        self.assertEqual(2, len(logs.output))
+        self.assertEqual(["sync", "instance", "deferred"], [call[0] for call in calls])
+        self.assertTrue(calls[2][2]["partial"])
+        self.assertEqual(
+            ["tests.test_dispatch.deferred_receiver"],
+            json.loads(SignalEvent.objects.get().payload)["receivers"],
+        )
+
+    def test_signals(self):
+        self.assertEqual(set(dispatch.SIGNALS), set(dispatch._signals()))
+        self.assertIs(
+            filebrowser_post_delete, dispatch._signals()["filebrowser_post_delete"]
+        )
+
+    @mock.patch.object(fb_settings, "SIGNAL_DISPATCH", "thread")
+    def test_thread(self):
+        self.delete()
+        dispatch.get_queue().join()
+        self.assertEqual(["sync", "deferred"], [call[0] for call in calls])
+        self.assertNotEqual(calls[0][1], calls[1][1])
+
+    @mock.patch.object(fb_settings, "SIGNAL_DISPATCH", "database")
+    @mock.patch.object(fb_settings, "SIGNAL_QUEUE_SIZE", 0)
+    def test_queue_full(self):
+        with self.assertLogs("filebrowser_safe", "WARNING"):
+            self.delete()
+        self.assertEqual(["sync", "deferred"], [call[0] for call in calls])
+        self.assertEqual(0, SignalEvent.objects.count())
+
+    @mock.patch.object(fb_settings, "SIGNAL_DISPATCH", "database")
+    @mock.patch.object(fb_settings, "SIGNAL_RETRIES", 2)
+    @mock.patch.object(fb_settings, "SIGNAL_RETRY_DELAY", 0)
+    def test_retries(self):
+        filebrowser_post_delete.connect(failing_receiver)
+        self.addCleanup(filebrowser_post_delete.disconnect, failing_receiver)
+        failures["count"] = 5
+        self.delete()
+        with self.assertLogs("filebrowser_safe", "ERROR") as logs:
+            call_command("filebrowser_dispatch_signals", "--once", stdout=StringIO())
+        self.assertIn("Gave up sending filebrowser_post_delete", logs.output[-1])
+        # Only the failing receiver is called again.
+        self.assertEqual(
+            ["sync", "deferred", "failing", "failing", "failing"],
+            [call[0] for call in calls],
+        )
+        self.assertEqual(0, SignalEvent.objects.count())
+
+    @mock.patch.object(fb_settings, "SIGNAL_DISPATCH", "database")
+    def test_fileobject(self):
+        filebrowser_post_upload.connect(deferred_receiver)
+        self.addCleanup(filebrowser_post_upload.disconnect, deferred_receiver)
+        fileobject = FileObject(self.name)
+        fileobject.filesize
+        dispatch.send(filebrowser_post_upload, sender=None, path="", file=fileobject)
+        with mock.patch.object(default_storage, "size") as size:
+            dispatch.DatabaseQueue().process()
+            received = calls[0][2]["file"]
+            self.assertEqual(self.name, received.path)
+            self.assertEqual(1, received.filesize)
+            size.assert_not_called()
@@ -0,0 +1,46 @@
+import os
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.test import TestCase
+
+from filebrowser_safe.fields import prefetch_file_metadata
+from filebrowser_safe.functions import get_directory
+from tests.models import Document
+
+
+class PrefetchFileMetadataTestCase(TestCase):
+    def setUp(self):
+        directory = get_directory()
+        self.file_name = default_storage.save(
+            os.path.join(directory, "prefetch.txt"), ContentFile(b"prefetch")
+        )
+        self.addCleanup(default_storage.delete, self.file_name)
+        self.dir_name = os.path.join(directory, "prefetch-dir")
+        default_storage.makedirs(self.dir_name)
+        self.addCleanup(default_storage.rmtree, self.dir_name)
+        Document.objects.create(file=self.file_name)
+        Document.objects.create(file=self.dir_name)
+        Document.objects.create(file=os.path.join(directory, "missing.txt"))
+        Document.objects.create(file="")
+
+    def test_prefetch(self):
+        expected = [
+            (doc.file.exists, doc.file.is_folder, doc.file.filesize, doc.file.date)
+            for doc in Document.objects.exclude(file="").order_by("pk")
+        ]
+        documents = prefetch_file_metadata(Document.objects.order_by("pk"))
+        with mock.patch.object(FileSystemStorage, "size") as size, mock.patch.object(
+            FileSystemStorage, "exists"
+        ) as exists:
+            prefetched = [
+                (doc.file.exists, doc.file.is_folder, doc.file.filesize, doc.file.date)
+                for doc in documents
+                if doc.file
+            ]
+        self.assertFalse(size.called)
+        self.assertFalse(exists.called)
+        self.assertEqual(expected, prefetched)
+        self.assertEqual((True, False, 8), prefetched[0][:3])
+        self.assertEqual((False, False, None, None), prefetched[2])
@@ -0,0 +1,107 @@
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from filebrowser_safe import functions
+from filebrowser_safe import settings as fb_settings
+from filebrowser_safe.functions import (
+    _exclude_matcher,
+    get_filterdate,
+    get_filterdate_range,
+    in_date_range,
+    is_excluded,
+)
+
+
+class LegacySubPattern(list):
+    """
+    ``sre_parse.SubPattern`` as before Python 3.8, with ``pattern`` in place
+    of ``state``.
+    """
+
+    def __init__(self, parsed):
+        super().__init__(parsed)
+        self.pattern = parsed.state
+
+
+class IsExcludedTestCase(SimpleTestCase):
+    def setUp(self):
+        _exclude_matcher.cache_clear()
+        is_excluded.cache_clear()
+        self.addCleanup(_exclude_matcher.cache_clear)
+        self.addCleanup(is_excluded.cache_clear)
+
+    def test_default(self):
+        self.assertEqual(("_q",), _exclude_matcher()[1])
+        self.assertTrue(is_excluded("photo_.jpg_60x60_q85.jpg"))
+        self.assertFalse(is_excluded("photo.jpg"))
+        self.assertFalse(is_excluded("photo_q85.jpg"))
+
+    def test_combined(self):
+        exclude = (r"^tmp-", r"\.bak$")
+        with mock.patch.object(fb_settings, "EXCLUDE", exclude):
+            self.assertEqual(("tmp-", ".bak"), _exclude_matcher()[1])
+            self.assertTrue(is_excluded("tmp-file.txt"))
+            self.assertTrue(is_excluded("file.txt.bak"))
+            self.assertFalse(is_excluded("file.txt"))
+
+    def test_no_prefilter(self):
+        exclude = (r"^tmp-", r"\d+")
+        with mock.patch.object(fb_settings, "EXCLUDE", exclude):
+            self.assertEqual((), _exclude_matcher()[1])
+            self.assertTrue(is_excluded("file1.txt"))
+
+    def test_flags(self):
+        with mock.patch.object(fb_settings, "EXCLUDE", (r"(?i)^tmp-", r"\.bak$")):
+            self.assertEqual((), _exclude_matcher()[1])
+            self.assertTrue(is_excluded("TMP-file.txt"))
+
+    def test_legacy_sre_parse(self):
+        parse = functions.sre_parse.parse
+        with mock.patch.object(
+            functions.sre_parse,
+            "parse",
+            side_effect=lambda *args: LegacySubPattern(parse(*args)),
+        ):
+            self.assertEqual("tmp-", functions._required_literal(r"^tmp-"))
+            self.assertEqual("", functions._required_literal(r"(?i)\.bak$"))
+
+    def test_backreference(self):
+        with mock.patch.object(fb_settings, "EXCLUDE", (r"(\w)\1", r"^x")):
+            self.assertTrue(is_excluded("aab.txt"))
+            self.assertTrue(is_excluded("xyz.txt"))
+            self.assertFalse(is_excluded("abc.txt"))
+
+
+class FilterDateRangeTestCase(SimpleTestCase):
+    def test_named_ranges(self):
+        now = time.time()
+        today = get_filterdate_range("today")
+        self.assertTrue(in_date_range(now, today))
+        self.assertFalse(in_date_range(now - 86400 * 2, today))
+        self.assertTrue(
+            in_date_range(now - 86400 * 6, get_filterdate_range("past7days"))
+        )
+        self.assertFalse(
+            in_date_range(now - 86400 * 8, get_filterdate_range("past7days"))
+        )
+        self.assertTrue(in_date_range(now, get_filterdate_range("thisyear")))
+        self.assertEqual((None, None), get_filterdate_range(""))
+        self.assertFalse(in_date_range(now, get_filterdate_range("unknown")))
+
+    def test_custom_range(self):
+        start, end = get_filterdate_range("", "2020-01-01", "2020-01-31")
+        self.assertEqual(time.mktime((2020, 1, 1, 0, 0, 0, 0, 0, -1)), start)
+        self.assertEqual(time.mktime((2020, 2, 1, 0, 0, 0, 0, 0, -1)), end)
+        self.assertEqual((start, None), get_filterdate_range("", "2020-01-01", "x"))
+        self.assertFalse(in_date_range(None, (start, end)))
+        self.assertTrue(in_date_range(None, (None, None)))
+
+    def test_combined_range(self):
+        start, end = get_filterdate_range("thisyear", "1999-01-01")
+        self.assertEqual(get_filterdate_range("thisyear"), (start, end))
+
+    def test_get_filterdate(self):
+        self.assertEqual("true", get_filterdate("today", time.time()))
+        self.assertEqual("", get_filterdate("today", 0))
@@ -0,0 +1,58 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.files.storage import FileSystemStorage
+from django.test import TestCase
+from django.urls import reverse
+
+from filebrowser_safe import settings as fb_settings
+from filebrowser_safe.instrumentation import StorageStats, instrument_storage_class
+
+User = get_user_model()
+
+
+class StorageStatsTestCase(TestCase):
+    def test_str(self):
+        stats = StorageStats()
+        stats.record("exists", 0.002)
+        stats.record("exists", 0.001)
+        stats.record("isdir", 0.001)
+        self.assertEqual(3, stats.total_calls)
+        self.assertEqual(
+            "calls=3; time=4.0ms; exists=2/3.0ms; isdir=1/1.0ms", str(stats)
+        )
+
+    def test_nested_calls_not_timed_twice(self):
+        stats = StorageStats()
+        stats.depth = 1
+        stats.record("exists", 0.001)
+        stats.depth = 0
+        stats.record("isdir", 0.002)
+        self.assertEqual(2, stats.total_calls)
+        self.assertAlmostEqual(0.002, stats.total_time)
+
+
+@mock.patch.object(fb_settings, "STORAGE_INSTRUMENTATION", True)
+class InstrumentedViewTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        instrument_storage_class(FileSystemStorage)
+
+    def setUp(self):
+        user = User.objects.create_user(
+            username="staff",
+            password="password",
+            is_staff=True,
+        )
+        self.client.force_login(user)
+
+    def test_header(self):
+        response = self.client.get(reverse("fb_browse"))
+        self.assertEqual(200, response.status_code)
+        self.assertIn("scandir=1/", response["X-Filebrowser-Storage"])
+
+    def test_budget(self):
+        with mock.patch.object(fb_settings, "STORAGE_CALL_BUDGET", 1):
+            with self.assertLogs("filebrowser_safe", "WARNING"):
+                self.client.get(reverse("fb_browse"))
@@ -0,0 +1,93 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.test import TestCase
+from django.urls import reverse
+
+from filebrowser_safe import metrics
+from filebrowser_safe import settings as fb_settings
+from filebrowser_safe.functions import get_directory
+from filebrowser_safe.instrumentation import instrument_storage_class
+
+User = get_user_model()
+
+
+@mock.patch.object(fb_settings, "METRICS", True)
+class MetricsTestCase(TestCase):
+    def test_render(self):
+        metrics.clear()
+        metrics.inc("filebrowser_uploads_total", 2)
+        metrics.observe("filebrowser_view_seconds", 0.02, view="browse")
+        output = metrics.render()
+        self.assertIn("# TYPE filebrowser_view_seconds histogram", output)
+        self.assertIn("filebrowser_uploads_total 2\n", output)
+        self.assertIn(
+            'filebrowser_view_seconds_bucket{view="browse",le="0.01"} 0', output
+        )
+        self.assertIn(
+            'filebrowser_view_seconds_bucket{view="browse",le="0.025"} 1', output
+        )
+        self.assertIn(
+            'filebrowser_view_seconds_bucket{view="browse",le="+Inf"} 1', output
+        )
+        self.assertIn('filebrowser_view_seconds_count{view="browse"} 1', output)
+
+    def test_disabled(self):
+        metrics.clear()
+        with mock.patch.object(fb_settings, "METRICS", False):
+            metrics.inc("filebrowser_uploads_total")
+        self.assertNotIn("filebrowser_uploads_total 1", metrics.render())
+
+
+@mock.patch.object(fb_settings, "METRICS", True)
+class MetricsViewTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        instrument_storage_class(FileSystemStorage)
+
+    def setUp(self):
+        metrics.clear()
+        user = User.objects.create_user(
+            username="staff", password="password", is_staff=True
+        )
+        self.client.force_login(user)
+
+    def test_not_enabled(self):
+        with mock.patch.object(fb_settings, "METRICS", False):
+            response = self.client.get(reverse("fb_metrics"))
+        self.assertEqual(404, response.status_code)
+
+    def test_staff_only(self):
+        self.client.logout()
+        response = self.client.get(reverse("fb_metrics"))
+        self.assertEqual(302, response.status_code)
+
+    def test_browse(self):
+        self.client.get(reverse("fb_browse"))
+        response = self.client.get(reverse("fb_metrics"))
+        self.assertEqual(200, response.status_code)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        output = response.content.decode()
+        self.assertIn('filebrowser_view_seconds_count{view="browse"} 1', output)
+        self.assertIn("filebrowser_listing_entries_count 1", output)
+        self.assertIn(
+            'filebrowser_storage_calls_total{backend="FileSystemStorage",'
+            'method="scandir"} 1',
+            output,
+        )
+
+    def test_upload(self):
+        name = get_directory() + "metrics.txt"
+        self.addCleanup(default_storage.delete, name)
+        self.client.post(
+            reverse("fb_do_upload"),
+            data={"folder": "", "Filedata": ContentFile(b"x" * 5, name="metrics.txt")},
+        )
+        output = metrics.render()
+        self.assertIn("filebrowser_uploads_total 1\n", output)
+        self.assertIn("filebrowser_upload_bytes_total 5\n", output)
+        self.assertIn("filebrowser_upload_throughput_bytes_per_second_count 1", output)
+        self.assertIn('filebrowser_view_seconds_count{view="_upload_file"} 1', output)
@@ -0,0 +1,118 @@
+import os
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+
+from filebrowser_safe import settings as fb_settings
+from filebrowser_safe.base import FileObject
+from filebrowser_safe.functions import get_directory
+from filebrowser_safe.views import _serve_response
+from tests.models import Document
+
+User = get_user_model()
+
+
+def staff_only(request, name):
+    return request.user.is_staff
+
+
+class ServeTestCase(TestCase):
+    def setUp(self):
+        self.name = default_storage.save(
+            os.path.join(get_directory(), "serve.txt"), ContentFile(b"0123456789")
+        )
+        self.addCleanup(default_storage.delete, self.name)
+        self.url = reverse("fb_serve", kwargs={"path": self.name})
+        user = User.objects.create_user(username="user", password="password")
+        self.client.force_login(user)
+
+    def test_serve(self):
+        response = self.client.get(self.url)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(b"0123456789", b"".join(response.streaming_content))
+        self.assertEqual("10", response["Content-Length"])
+        self.assertEqual("bytes", response["Accept-Ranges"])
+        self.assertIn("private", response["Cache-Control"])
+        self.assertIn("no-cache", response["Cache-Control"])
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(304, response.status_code)
+
+    def test_versioned(self):
+        version = "%d" % FileObject(self.name).date
+        response = self.client.get(self.url, {"v": version})
+        self.assertIn("private", response["Cache-Control"])
+        self.assertIn(
+            "max-age=%d" % fb_settings.SERVE_MAX_AGE, response["Cache-Control"]
+        )
+        self.assertNotIn("no-cache", response["Cache-Control"])
+
+        response = self.client.get(self.url, {"v": int(version) - 1})
+        self.assertIn("no-cache", response["Cache-Control"])
+        self.assertNotIn("max-age", response["Cache-Control"])
+
+    def test_range(self):
+        response = self.client.get(self.url, HTTP_RANGE="bytes=2-4")
+        self.assertEqual(206, response.status_code)
+        self.assertEqual(b"234", b"".join(response.streaming_content))
+        self.assertEqual("bytes 2-4/10", response["Content-Range"])
+
+        response = self.client.get(self.url, HTTP_RANGE="bytes=-3")
+        self.assertEqual(b"789", b"".join(response.streaming_content))
+
+        response = self.client.get(self.url, HTTP_RANGE="bytes=20-")
+        self.assertEqual(416, response.status_code)
+        self.assertEqual("bytes */10", response["Content-Range"])
+
+        response = self.client.get(
+            self.url, HTTP_RANGE="bytes=2-4", HTTP_IF_RANGE='"stale"'
+        )
+        self.assertEqual(200, response.status_code)
+
+    @mock.patch.object(fb_settings, "SERVE_MODE", "x-accel-redirect")
+    def test_x_accel_redirect(self):
+        response = self.client.get(self.url)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual("/protected/" + self.name, response["X-Accel-Redirect"])
+        self.assertEqual(b"", response.content)
+
+    @mock.patch.object(fb_settings, "SERVE_MODE", "x-sendfile")
+    def test_x_sendfile(self):
+        response = self.client.get(self.url)
+        self.assertEqual(default_storage.path(self.name), response["X-Sendfile"])
+
+    @mock.patch.object(fb_settings, "SERVE_MODE", "x-sendfile")
+    def test_x_sendfile_remote_storage(self):
+        request = RequestFactory().get(self.url)
+        with mock.patch.object(
+            default_storage, "path", side_effect=NotImplementedError
+        ):
+            with self.assertRaises(ImproperlyConfigured):
+                _serve_response(request, self.name, 10, '"etag"', 0)
+
+    def test_anonymous(self):
+        self.client.logout()
+        response = self.client.get(self.url)
+        self.assertEqual(302, response.status_code)
+
+    @mock.patch.object(fb_settings, "SERVE_PERMISSION", "tests.test_serve.staff_only")
+    def test_permission_denied(self):
+        self.assertEqual(403, self.client.get(self.url).status_code)
+
+    def test_invalid_paths(self):
+        for path in ("serve.txt", get_directory() + "../serve.txt", self.name + "x"):
+            url = reverse("fb_serve", kwargs={"path": path})
+            self.assertEqual(404, self.client.get(url).status_code)
+
+    @mock.patch.object(fb_settings, "SERVE_MEDIA", True)
+    def test_urls(self):
+        fileobject = FileObject(self.name)
+        self.assertEqual(self.url, fileobject.url)
+        fileobject.date
+        self.assertEqual(self.url + "?v=%d" % fileobject.date, fileobject.url)
+        self.assertEqual(self.url, Document(file=self.name).file.url)
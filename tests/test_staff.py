@@ -2,6 +2,7 @@ import os
 import shutil
 import tempfile
 from pathlib import Path
+from unittest import mock
 
 from django.contrib.auth import get_user_model
 from django.core.files.base import ContentFile
@@ -51,6 +52,17 @@ class FilebrowserStaffTestCase(TestCase):
             response = self.client.get(url, data={"dir": self.subdir.name})
             self.assertContains(response, os.path.basename(temp_file.name))
 
+    def test_browse__date_range(self):
+        url = reverse("fb_browse")
+        with tempfile.NamedTemporaryFile(
+            dir=self.upload_dir, suffix=".txt"
+        ) as temp_file:
+            name = os.path.basename(temp_file.name)
+            response = self.client.get(url, {"date_from": "2000-01-01"})
+            self.assertContains(response, name)
+            response = self.client.get(url, {"date_to": "2000-01-01"})
+            self.assertNotContains(response, name)
+
     def test_browse__suspicious(self):
         url = reverse("fb_browse") + f"?dir={self.subdir.name}/../"
         response = self.client.get(url)
@@ -137,3 +149,108 @@ class FilebrowserStaffTestCase(TestCase):
             self.assertEqual(uploaded_file.read(), test_file.read())
         # Cleanup uploaded file
         default_storage.delete(test_file_path)
+
+    def test_bulk_delete(self):
+        url = reverse("fb_bulk_delete")
+        folder = Path(tempfile.mkdtemp(dir=self.upload_dir, prefix="fb-"))
+        (folder / "nested.txt").write_text("nested")
+        with tempfile.NamedTemporaryFile(
+            dir=self.upload_dir, prefix="fb-", suffix="-test.txt", delete=False
+        ) as temp_file:
+            temp_path = temp_file.name
+        response = self.client.post(
+            url,
+            data={"filename": [os.path.basename(temp_path), folder.name]},
+            follow=True,
+        )
+        self.assertContains(response, "2 items were successfully deleted.")
+        self.assertFalse(os.path.exists(temp_path))
+        self.assertFalse(folder.exists())
+
+    def test_bulk_delete__invalid(self):
+        url = reverse("fb_bulk_delete")
+        with tempfile.NamedTemporaryFile(dir=self.upload_dir) as temp_file:
+            response = self.client.post(
+                url,
+                data={"filename": [os.path.basename(temp_file.name), "../missing"]},
+                follow=True,
+            )
+            self.assertContains(response, "The requested File does not exist.")
+            self.assertTrue(os.path.exists(temp_file.name))
+
+    def test_bulk_move(self):
+        url = reverse("fb_bulk_move")
+        with tempfile.NamedTemporaryFile(
+            dir=self.upload_dir, prefix="fb-", suffix="-test.txt", delete=False
+        ) as temp_file:
+            temp_path = temp_file.name
+        name = os.path.basename(temp_path)
+        response = self.client.post(
+            url,
+            data={"filename": [name], "destination": self.subdir.name},
+            follow=True,
+        )
+        self.assertContains(response, "1 item was successfully moved.")
+        self.assertFalse(os.path.exists(temp_path))
+        self.assertTrue((self.subdir / name).exists())
+        (self.subdir / name).unlink()
+
+    def test_bulk_move__into_itself(self):
+        url = reverse("fb_bulk_move")
+        response = self.client.post(
+            url,
+            data={"filename": [self.subdir.name], "destination": self.subdir.name},
+            follow=True,
+        )
+        self.assertContains(response, "be moved into itself.")
+        self.assertTrue(self.subdir.exists())
+
+    def test_bulk_move__into_itself_unnormalized(self):
+        url = reverse("fb_bulk_move") + "?dir=" + self.subdir.name
+        nested = self.subdir / "nested"
+        nested.mkdir()
+        self.addCleanup(shutil.rmtree, str(nested))
+        for destination, msg in (
+            (self.subdir.name + "//nested", "be moved into itself."),
+            ("nested/../..", "The requested Folder does not exist."),
+        ):
+            response = self.client.post(
+                url,
+                data={"filename": ["nested"], "destination": destination},
+                follow=True,
+            )
+            self.assertContains(response, msg)
+            self.assertEqual([], os.listdir(str(nested)))
+
+    def test_bulk_copy__failed_progress(self):
+        url = reverse("fb_bulk_copy")
+        folder = Path(tempfile.mkdtemp(dir=self.upload_dir, prefix="fb-"))
+        self.addCleanup(shutil.rmtree, str(folder))
+
+        def copy(old_name, new_name, progress=None):
+            progress(2, 5)
+            raise OSError("Interrupted")
+
+        with mock.patch.object(default_storage, "copy", side_effect=copy):
+            response = self.client.post(
+                url,
+                data={"filename": [folder.name], "destination": self.subdir.name},
+                follow=True,
+            )
+        self.assertContains(response, "%s (2 of 5 files)" % folder.name)
+
+    def test_bulk_copy(self):
+        url = reverse("fb_bulk_copy")
+        folder = Path(tempfile.mkdtemp(dir=self.upload_dir, prefix="fb-"))
+        self.addCleanup(shutil.rmtree, str(folder))
+        (folder / "nested.txt").write_text("nested")
+        response = self.client.post(
+            url,
+            data={"filename": [folder.name], "destination": self.subdir.name},
+            follow=True,
+        )
+        self.assertContains(response, "1 item was successfully copied.")
+        copied = self.subdir / folder.name
+        self.addCleanup(shutil.rmtree, str(copied))
+        self.assertEqual("nested", (copied / "nested.txt").read_text())
+        self.assertTrue((folder / "nested.txt").exists())
@@ -0,0 +1,442 @@
+import os
+import shutil
+import stat
+import tempfile
+import threading
+from datetime import datetime
+from unittest import mock, skipIf
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.test import SimpleTestCase
+
+from filebrowser_safe.storage import (
+    FileSystemStorageMixin,
+    GoogleStorageMixin,
+    S3Boto3StorageMixin,
+    S3BotoStorageMixin,
+    _concurrently,
+    clean_name,
+)
+
+
+class FileSystemStorageMixinTestCase(SimpleTestCase):
+    def setUp(self):
+        storage_class = type(
+            "FileSystemStorage", (FileSystemStorage, FileSystemStorageMixin), {}
+        )
+        self.storage = storage_class(location=tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.storage.location)
+        for name in ("uploads/a.txt", "uploads/sub/c.txt"):
+            self.storage.save(name, ContentFile(b"content"))
+
+    def test_move_folder(self):
+        with mock.patch("os.rename", wraps=os.rename) as rename:
+            self.storage.move("uploads/sub", "moved")
+        rename.assert_called_once_with(
+            self.storage.path("uploads/sub"), self.storage.path("moved")
+        )
+        self.assertTrue(self.storage.exists("moved/c.txt"))
+        with self.assertRaises(OSError):
+            self.storage.move("uploads", "moved")
+
+    def test_copy(self):
+        progress = mock.Mock()
+        self.storage.copy("uploads", "copied", progress=progress)
+        self.assertEqual(mock.call(2, 2), progress.call_args)
+        self.assertEqual(
+            ["copied", "uploads"], sorted(os.listdir(self.storage.location))
+        )
+        self.assertTrue(self.storage.exists("copied/sub/c.txt"))
+        self.storage.copy("uploads/a.txt", "copied/d.txt")
+        self.assertEqual(b"content", self.storage.open("copied/d.txt").read())
+        with self.assertRaises(OSError):
+            self.storage.copy("uploads/a.txt", "copied/d.txt")
+
+    def test_overwrite(self):
+        os.link(self.storage.path("uploads/a.txt"), self.storage.path("linked.txt"))
+        self.storage.overwrite("uploads/a.txt", ContentFile(b"replaced"))
+        self.assertEqual(b"replaced", self.storage.open("uploads/a.txt").read())
+        # Other links keep the previous content.
+        self.assertEqual(b"content", self.storage.open("linked.txt").read())
+        self.assertEqual(
+            ["a.txt", "sub"], sorted(os.listdir(self.storage.path("uploads")))
+        )
+        self.storage.overwrite("new/b.txt", ContentFile("text"))
+        self.assertEqual(b"text", self.storage.open("new/b.txt").read())
+
+    def test_overwrite_temporary_file(self):
+        content = TemporaryUploadedFile("a.txt", "text/plain", 8, None)
+        content.write(b"replaced")
+        content.flush()
+        temporary_path = content.temporary_file_path()
+        with mock.patch.object(content, "chunks") as chunks:
+            self.storage.overwrite("uploads/a.txt", content)
+        chunks.assert_not_called()
+        self.assertFalse(os.path.exists(temporary_path))
+        self.assertEqual(b"replaced", self.storage.open("uploads/a.txt").read())
+
+    def test_overwrite_permissions(self):
+        self.storage.file_permissions_mode = 0o640
+        self.storage.directory_permissions_mode = 0o750
+        self.storage.overwrite("new/sub/b.txt", ContentFile(b"text"))
+        for name, mode in (
+            ("new", 0o750),
+            ("new/sub", 0o750),
+            ("new/sub/b.txt", 0o640),
+        ):
+            self.assertEqual(
+                mode, stat.S_IMODE(os.stat(self.storage.path(name)).st_mode)
+            )
+
+    def test_overwrite_failed(self):
+        content = ContentFile(b"replaced")
+        with mock.patch.object(content, "chunks", side_effect=OSError):
+            with self.assertRaises(OSError):
+                self.storage.overwrite("uploads/a.txt", content)
+        self.assertEqual(b"content", self.storage.open("uploads/a.txt").read())
+        self.assertEqual(
+            ["a.txt", "sub"], sorted(os.listdir(self.storage.path("uploads")))
+        )
+
+
+class FakeBucket:
+    name = "media"
+
+    def __init__(self):
+        self.keys = {}
+
+    def copy_key(self, new_key_name, bucket_name, old_key_name, preserve_acl=False):
+        self.keys[new_key_name] = self.keys[old_key_name]
+        return True
+
+
+class FakeS3BotoStorage:
+    """
+    In-memory stand-in for the boto based S3BotoStorage, which needs boto 2.
+    """
+
+    def __init__(self):
+        self.bucket = FakeBucket()
+
+    def _clean_name(self, name):
+        return clean_name(name)
+
+    def _normalize_name(self, name):
+        return name
+
+    def _encode_name(self, name):
+        return name
+
+    def exists(self, name):
+        return name in self.bucket.keys
+
+    def size(self, name):
+        return len(self.bucket.keys[name])
+
+    def delete(self, name):
+        del self.bucket.keys[name]
+
+    def listdir(self, name):
+        prefix = name.rstrip("/") + "/" if name else ""
+        directories, files = set(), []
+        for key in self.bucket.keys:
+            if key.startswith(prefix):
+                dirname, _, filename = key[len(prefix) :].partition("/")
+                if filename:
+                    directories.add(dirname)
+                else:
+                    files.append(dirname)
+        return sorted(directories), files
+
+
+class S3BotoStorageMixinTestCase(SimpleTestCase):
+    def setUp(self):
+        storage_class = type(
+            "S3BotoStorage", (FakeS3BotoStorage, S3BotoStorageMixin), {}
+        )
+        self.storage = storage_class()
+        for name in ("uploads/a.txt", "uploads/b.txt", "uploads/sub/c.txt"):
+            self.storage.bucket.keys[name] = b"content"
+
+    def keys(self):
+        return sorted(self.storage.bucket.keys)
+
+    def test_isdir(self):
+        self.assertTrue(self.storage.isdir("uploads/sub"))
+        self.assertFalse(self.storage.isdir("uploads/a.txt"))
+        self.assertFalse(self.storage.isdir("missing"))
+
+    def test_move_file(self):
+        progress = mock.Mock()
+        self.storage.move("uploads/a.txt", "uploads/d.txt", progress=progress)
+        self.assertEqual(mock.call(1, 1), progress.call_args)
+        self.assertEqual(
+            ["uploads/b.txt", "uploads/d.txt", "uploads/sub/c.txt"], self.keys()
+        )
+        with self.assertRaises(OSError):
+            self.storage.move("uploads/b.txt", "uploads/d.txt")
+        self.storage.move("uploads/b.txt", "uploads/d.txt", allow_overwrite=True)
+        self.assertEqual(["uploads/d.txt", "uploads/sub/c.txt"], self.keys())
+
+    def test_move_folder(self):
+        self.storage.move("uploads/sub", "moved")
+        self.assertEqual(["moved/c.txt", "uploads/a.txt", "uploads/b.txt"], self.keys())
+
+    def test_copy_folder(self):
+        progress = mock.Mock()
+        self.storage.copy("uploads", "copied", progress=progress)
+        self.assertEqual(mock.call(3, 3), progress.call_args)
+        self.assertEqual(
+            [
+                "copied/a.txt",
+                "copied/b.txt",
+                "copied/sub/c.txt",
+                "uploads/a.txt",
+                "uploads/b.txt",
+                "uploads/sub/c.txt",
+            ],
+            self.keys(),
+        )
+        with self.assertRaises(OSError):
+            self.storage.copy("uploads/a.txt", "copied/a.txt")
+
+
+try:
+    import boto3
+    from storages.backends.s3boto3 import S3Boto3Storage
+except ImportError:
+    boto3 = None
+
+try:
+    from moto import mock_aws
+except ImportError:
+    try:
+        from moto import mock_s3 as mock_aws
+    except ImportError:
+        mock_aws = None
+
+try:
+    from gcp_storage_emulator.server import create_server
+    from google.auth.credentials import AnonymousCredentials
+    from storages.backends.gcloud import GoogleCloudStorage
+except ImportError:
+    GoogleCloudStorage = create_server = None
+
+
+@skipIf(boto3 is None or mock_aws is None, "boto3, moto or django-storages missing")
+class S3Boto3StorageMixinTestCase(SimpleTestCase):
+    def setUp(self):
+        environ = mock.patch.dict(
+            os.environ,
+            {
+                "AWS_ACCESS_KEY_ID": "testing",
+                "AWS_SECRET_ACCESS_KEY": "testing",
+                "AWS_DEFAULT_REGION": "us-east-1",
+            },
+        )
+        environ.start()
+        self.addCleanup(environ.stop)
+        aws = mock_aws()
+        aws.start()
+        self.addCleanup(aws.stop)
+        boto3.client("s3", region_name="us-east-1").create_bucket(Bucket="media")
+        # The mixin is appended to the storage class bases, as done by
+        # setup_default_storage().
+        storage_class = type("S3Storage", (S3Boto3Storage, S3Boto3StorageMixin), {})
+        self.storage = storage_class(bucket_name="media", region_name="us-east-1")
+        self.client = self.storage.connection.meta.client
+        for name in ("uploads/a.txt", "uploads/b.txt", "uploads/sub/c.txt"):
+            self.storage.save(name, ContentFile(b"content"))
+
+    def keys(self):
+        response = self.client.list_objects_v2(Bucket="media")
+        return sorted(obj["Key"] for obj in response.get("Contents", ()))
+
+    def test_isdir_isfile(self):
+        self.assertTrue(self.storage.isdir(""))
+        self.assertTrue(self.storage.isdir("uploads"))
+        self.assertTrue(self.storage.isdir("uploads/sub/"))
+        self.assertFalse(self.storage.isdir("uploads/a.txt"))
+        self.assertFalse(self.storage.isdir("missing"))
+        self.assertTrue(self.storage.isfile("uploads/a.txt"))
+        self.assertFalse(self.storage.isfile("uploads/sub"))
+
+    def test_scandir(self):
+        entries = sorted(self.storage.scandir("uploads"))
+        self.assertEqual(
+            [("a.txt", False, 7), ("b.txt", False, 7), ("sub", True, None)],
+            [entry[:3] for entry in entries],
+        )
+        self.assertIsInstance(entries[0][3], datetime)
+
+    def test_scandir_paginated(self):
+        with mock.patch.object(
+            S3Boto3StorageMixin,
+            "_list_pages",
+            lambda storage, prefix, delimiter="/", **kwargs: (
+                storage.connection.meta.client.get_paginator(
+                    "list_objects_v2"
+                ).paginate(
+                    Bucket="media",
+                    Prefix=prefix,
+                    Delimiter=delimiter,
+                    PaginationConfig={"PageSize": 1},
+                )
+            ),
+        ):
+            entries = self.storage.scandir("uploads")
+        self.assertEqual(["a.txt", "b.txt", "sub"], sorted(e[0] for e in entries))
+
+    def test_move_file(self):
+        self.storage.move("uploads/a.txt", "uploads/d.txt")
+        self.assertFalse(self.storage.exists("uploads/a.txt"))
+        self.assertEqual(b"content", self.storage.open("uploads/d.txt").read())
+        with self.assertRaises(OSError):
+            self.storage.move("uploads/b.txt", "uploads/d.txt")
+        self.storage.move("uploads/b.txt", "uploads/d.txt", allow_overwrite=True)
+        self.assertEqual(["uploads/d.txt", "uploads/sub/c.txt"], self.keys())
+
+    def test_overwrite(self):
+        with mock.patch.object(S3Boto3StorageMixin, "_copy_key") as copy_key:
+            self.storage.overwrite("uploads/a.txt", ContentFile(b"replaced"))
+        copy_key.assert_not_called()
+        self.assertEqual(b"replaced", self.storage.open("uploads/a.txt").read())
+        self.assertEqual(
+            ["uploads/a.txt", "uploads/b.txt", "uploads/sub/c.txt"], self.keys()
+        )
+
+    def test_move_folder(self):
+        self.storage.move("uploads/sub", "uploads/moved")
+        self.assertEqual(
+            ["uploads/a.txt", "uploads/b.txt", "uploads/moved/c.txt"], self.keys()
+        )
+
+    def test_copy_folder(self):
+        progress = mock.Mock()
+        self.storage.copy("uploads", "copied", progress=progress)
+        self.assertEqual(
+            [
+                "copied/a.txt",
+                "copied/b.txt",
+                "copied/sub/c.txt",
+                "uploads/a.txt",
+                "uploads/b.txt",
+                "uploads/sub/c.txt",
+            ],
+            self.keys(),
+        )
+        self.assertEqual(mock.call(3, 3), progress.call_args)
+        with self.assertRaises(OSError):
+            self.storage.copy("uploads/a.txt", "copied/a.txt")
+
+    def test_makedirs_rmtree(self):
+        self.storage.makedirs("uploads/new")
+        self.assertTrue(self.storage.isdir("uploads/new"))
+        with mock.patch.object(S3Boto3StorageMixin, "delete_batch_size", 2):
+            self.storage.rmtree("uploads")
+        self.assertEqual([], self.keys())
+
+
+@skipIf(
+    GoogleCloudStorage is None or create_server is None,
+    "django-storages[google] or gcp-storage-emulator missing",
+)
+class GoogleStorageMixinTestCase(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = create_server("localhost", 0, in_memory=True)
+        cls.server.start()
+        cls.host = "http://localhost:%d" % cls.server._api._httpd.server_address[1]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        environ = mock.patch.dict(os.environ, {"STORAGE_EMULATOR_HOST": self.host})
+        environ.start()
+        self.addCleanup(environ.stop)
+        self.addCleanup(self.server.wipe)
+        storage_class = type(
+            "GoogleCloudStorage", (GoogleCloudStorage, GoogleStorageMixin), {}
+        )
+        self.storage = storage_class(
+            bucket_name="media",
+            project_id="test",
+            credentials=AnonymousCredentials(),
+        )
+        self.storage.client.create_bucket("media")
+        for name in ("uploads/a.txt", "uploads/b.txt", "uploads/sub/c.txt"):
+            self.storage.save(name, ContentFile(b"content"))
+
+    def keys(self):
+        return sorted(blob.name for blob in self.storage.bucket.list_blobs())
+
+    def test_isdir_isfile(self):
+        self.assertTrue(self.storage.isdir(""))
+        self.assertTrue(self.storage.isdir("uploads"))
+        self.assertTrue(self.storage.isdir("uploads/sub/"))
+        self.assertFalse(self.storage.isdir("uploads/a.txt"))
+        self.assertFalse(self.storage.isdir("missing"))
+        self.assertTrue(self.storage.isfile("uploads/a.txt"))
+        self.assertFalse(self.storage.isfile("uploads/sub"))
+        self.assertFalse(self.storage.isfile(""))
+
+    def test_scandir(self):
+        entries = sorted(self.storage.scandir("uploads"))
+        self.assertEqual(
+            [("a.txt", False, 7), ("b.txt", False, 7), ("sub", True, None)],
+            [entry[:3] for entry in entries],
+        )
+        self.assertIsInstance(entries[0][3], datetime)
+
+    def test_move_file(self):
+        self.storage.move("uploads/a.txt", "uploads/d.txt")
+        self.assertFalse(self.storage.exists("uploads/a.txt"))
+        self.assertEqual(b"content", self.storage.open("uploads/d.txt").read())
+        with self.assertRaises(OSError):
+            self.storage.move("uploads/b.txt", "uploads/d.txt")
+
+    def test_move_folder(self):
+        self.storage.move("uploads/sub", "uploads/moved")
+        self.assertEqual(
+            ["uploads/a.txt", "uploads/b.txt", "uploads/moved/c.txt"], self.keys()
+        )
+
+    def test_copy_file(self):
+        self.storage.copy("uploads/a.txt", "uploads/d.txt")
+        self.assertEqual(b"content", self.storage.open("uploads/d.txt").read())
+        self.assertTrue(self.storage.exists("uploads/a.txt"))
+
+    def test_overwrite(self):
+        with mock.patch.object(GoogleStorageMixin, "_copy_key") as copy_key:
+            self.storage.overwrite("uploads/a.txt", ContentFile(b"replaced"))
+        copy_key.assert_not_called()
+        self.assertEqual(b"replaced", self.storage.open("uploads/a.txt").read())
+        self.assertEqual(
+            ["uploads/a.txt", "uploads/b.txt", "uploads/sub/c.txt"], self.keys()
+        )
+
+    def test_makedirs_rmtree(self):
+        self.storage.makedirs("uploads/new")
+        self.assertTrue(self.storage.isdir("uploads/new"))
+        with mock.patch.object(GoogleStorageMixin, "delete_batch_size", 2):
+            self.storage.rmtree("uploads")
+        self.assertEqual([], self.keys())
+
+
+class ConcurrentlyTestCase(SimpleTestCase):
+    def test_nested(self):
+        def outer(item):
+            thread = threading.current_thread()
+            inner = _concurrently(lambda i: threading.current_thread(), range(3))
+            return thread, inner
+
+        for thread, inner in _concurrently(outer, range(4), workers=2):
+            self.assertNotEqual(threading.current_thread(), thread)
+            # Nested calls run in the worker thread itself.
+            self.assertEqual([thread] * 3, inner)
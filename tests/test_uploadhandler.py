@@ -0,0 +1,57 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import StopUpload
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+
+from filebrowser_safe import settings as fb_settings
+from filebrowser_safe.functions import get_directory
+from filebrowser_safe.uploadhandler import LimitUploadHandler, rejected_uploads
+
+User = get_user_model()
+
+
+@mock.patch.object(fb_settings, "MAX_UPLOAD_SIZE", 10)
+class LimitUploadHandlerTestCase(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(
+            username="staff", password="password", is_staff=True
+        )
+        self.client.force_login(user)
+
+    def upload(self, name, content):
+        return self.client.post(
+            reverse("fb_do_upload"),
+            data={"folder": "", "Filedata": ContentFile(content, name=name)},
+        )
+
+    def test_size(self):
+        rejected = rejected_uploads().get("size", 0)
+        response = self.upload("large.txt", b"x" * 11)
+        self.assertEqual(400, response.status_code)
+        self.assertFalse(default_storage.exists(get_directory() + "large.txt"))
+        self.assertEqual(rejected + 1, rejected_uploads()["size"])
+
+    def test_extension(self):
+        rejected = rejected_uploads().get("extension", 0)
+        response = self.upload("script.exe", b"x")
+        self.assertEqual(400, response.status_code)
+        self.assertEqual(rejected + 1, rejected_uploads()["extension"])
+
+    def test_allowed(self):
+        self.addCleanup(default_storage.delete, get_directory() + "small.txt")
+        self.assertEqual(200, self.upload("small.txt", b"x" * 10).status_code)
+        self.assertTrue(default_storage.exists(get_directory() + "small.txt"))
+
+    def test_stops_at_limit(self):
+        request = RequestFactory().post("/")
+        handler = LimitUploadHandler(request)
+        handler.new_file("Filedata", "file.txt", "text/plain", None)
+        self.assertEqual(b"x" * 6, handler.receive_data_chunk(b"x" * 6, 0))
+        with self.assertRaises(StopUpload) as cm:
+            handler.receive_data_chunk(b"x" * 6, 6)
+        self.assertTrue(cm.exception.connection_reset)
+        self.assertEqual("size", request.upload_rejected)
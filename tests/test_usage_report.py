@@ -0,0 +1,61 @@
+import json
+import os
+from io import StringIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase
+
+from filebrowser_safe.functions import get_directory
+
+
+class UsageReportCommandTestCase(TestCase):
+    def setUp(self):
+        self.root = os.path.join(get_directory(), "usage")
+        files = {
+            "a.jpg": b"x" * 100,
+            "sub/b.txt": b"x" * 10,
+            "sub/deeper/c.jpg": b"x" * 1000,
+            "sub/deeper/d.bin": b"x",
+        }
+        for name, content in files.items():
+            default_storage.save(os.path.join(self.root, name), ContentFile(content))
+        self.addCleanup(default_storage.rmtree, self.root)
+
+    def report(self, *args):
+        out = StringIO()
+        call_command("filebrowser_usage_report", "--json", *args, stdout=out)
+        return json.loads(out.getvalue())
+
+    def test_report(self):
+        report = self.report("--top", "100")
+        # Only this test's files, other tests may leave some behind.
+        folders = [f for f in report["folders"] if f["path"].startswith(self.root)]
+        files = [f for f in report["largest_files"] if f["path"].startswith(self.root)]
+        self.assertEqual(
+            [
+                (self.root, 1111, 4),
+                (self.root + "/sub", 1011, 3),
+                (self.root + "/sub/deeper", 1001, 2),
+            ],
+            [(f["path"], f["size"], f["files"]) for f in folders],
+        )
+        self.assertEqual(
+            [
+                (self.root + "/sub/deeper/c.jpg", 1000),
+                (self.root + "/a.jpg", 100),
+                (self.root + "/sub/b.txt", 10),
+                (self.root + "/sub/deeper/d.bin", 1),
+            ],
+            [(f["path"], f["size"]) for f in files],
+        )
+        self.assertEqual(2, len(self.report("--top", "2")["folders"]))
+        self.assertGreaterEqual(report["types"]["Image"]["size"], 1100)
+        self.assertGreaterEqual(report["types"]["Other"]["files"], 1)
+
+    def test_text(self):
+        out = StringIO()
+        call_command("filebrowser_usage_report", "--top", "100", stdout=out)
+        self.assertIn("Largest folders:", out.getvalue())
+        self.assertIn(self.root + "/sub/deeper", out.getvalue())
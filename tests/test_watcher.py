@@ -0,0 +1,45 @@
+import os
+import shutil
+from unittest import mock, skipIf
+
+from django.core.files.storage import default_storage
+from django.test import SimpleTestCase
+
+from filebrowser_safe.functions import get_directory
+from filebrowser_safe.watcher import DirectoryWatcher, inotify_simple
+
+
+@skipIf(inotify_simple is None, "inotify_simple is not installed")
+class DirectoryWatcherTestCase(SimpleTestCase):
+    def setUp(self):
+        self.directory = default_storage.path(os.path.join(get_directory(), "watched"))
+        os.makedirs(self.directory)
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.watcher = DirectoryWatcher(coalesce=0.1)
+        self.addCleanup(self.watcher.inotify.close)
+        self.watcher.watch(self.watcher.root)
+        self.watcher.snapshot = self.watcher.scan()
+
+    def flushed(self):
+        with mock.patch("filebrowser_safe.watcher.invalidate_listing") as invalidate:
+            self.watcher.flush()
+        return {call[0][0] for call in invalidate.call_args_list}
+
+    def test_events(self):
+        os.makedirs(os.path.join(self.directory, "sub"))
+        with open(os.path.join(self.directory, "sub", "file.txt"), "w") as f:
+            f.write("watched")
+        for _ in range(3):
+            for event in self.watcher.inotify.read(timeout=100):
+                self.watcher.handle(event)
+        watched = get_directory() + "watched"
+        self.assertEqual({watched, watched + "/sub"}, self.flushed())
+        self.assertEqual(set(), self.flushed())
+
+    def test_reconcile(self):
+        self.watcher.unwatch(self.watcher.root)
+        os.makedirs(os.path.join(self.directory, "missed"))
+        self.watcher.reconcile()
+        self.assertIn(self.directory, self.watcher.watches.values())
+        watched = get_directory() + "watched"
+        self.assertEqual({watched, watched + "/missed"}, self.flushed())